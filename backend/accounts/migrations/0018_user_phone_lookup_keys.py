@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-17 22:57
+
+from django.db import migrations, models
+
+
+def backfill_phone_keys(apps, schema_editor):
+    User = apps.get_model('accounts', 'User')
+    batch = []
+    for user in User.objects.exclude(phone_number__isnull=True).exclude(phone_number='').only('id', 'phone_number').iterator():
+        digits = ''.join(ch for ch in str(user.phone_number) if ch.isdigit())
+        user.phone_digits, user.phone_tail9 = digits, digits[-9:]
+        batch.append(user)
+        if len(batch) >= 1000:
+            User.objects.bulk_update(batch, ['phone_digits', 'phone_tail9'])
+            batch = []
+    if batch:
+        User.objects.bulk_update(batch, ['phone_digits', 'phone_tail9'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_remove_user_ussd_pin_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='phone_digits',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='phone_tail9',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=9),
+        ),
+        migrations.RunPython(backfill_phone_keys, migrations.RunPython.noop),
+    ]
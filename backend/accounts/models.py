@@ -91,6 +91,9 @@ class User(TimestampMixin, AbstractUser):
     username = None
     email = models.EmailField(_("email_address"), unique=True)
     phone_number = PhoneNumberField(_("phone_number"), unique=True, blank=True, null=True)
+    # Derived from phone_number on save (see accounts.phone_lookup) for indexed MSISDN lookup.
+    phone_digits = models.CharField(max_length=20, blank=True, default="", db_index=True, editable=False)
+    phone_tail9 = models.CharField(max_length=9, blank=True, default="", db_index=True, editable=False)
     # country = models.ForeignKey(
     #     Country, on_delete=models.CASCADE, null=True, blank=True
     # )
@@ -243,6 +246,18 @@ class User(TimestampMixin, AbstractUser):
         """
         return f"{self.first_name} {self.last_name} {self.email}, {self.phone_number}"
 
+    def save(self, *args, **kwargs):
+        from accounts.phone_lookup import forget_msisdn, msisdn_keys
+
+        digits, tail = msisdn_keys(self.phone_number)
+        if (digits, tail) != (self.phone_digits, self.phone_tail9):
+            forget_msisdn(self.phone_digits, digits)
+            self.phone_digits, self.phone_tail9 = digits, tail
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "phone_digits", "phone_tail9"}
+        super().save(*args, **kwargs)
+
     @property
     def tokens(self):
         refresh = RefreshToken.for_user(self)
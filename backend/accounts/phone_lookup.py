@@ -0,0 +1,87 @@
+"""
+Caller resolution by MSISDN for USSD and other phone-first channels.
+
+`User.save` stores two keys derived from `phone_number`: `phone_digits` (digits
+only, e.g. 256772123456) and `phone_tail9` (the last nine digits, the national
+subscriber number in Uganda). Gateways send callers as +256…, 256… or 07…, so
+an exact digits match is preferred and a unique tail match is accepted — the
+same rules the old full-table scan applied, now as one index probe.
+
+Unambiguous resolutions are cached by tail key for USSD_PHONE_CACHE_SECONDS, so
+every format of a number shares one entry; saves that change a phone number
+evict the old and new tails.
+"""
+from __future__ import annotations
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+TAIL_DIGITS = 9
+
+
+def normalize_msisdn(phone) -> str:
+    return "".join(ch for ch in str(phone or "") if ch.isdigit())
+
+
+def msisdn_keys(phone) -> tuple[str, str]:
+    """(digits, last-9 key) for a phone number; both empty when it has no digits."""
+    digits = normalize_msisdn(phone)
+    return digits, digits[-TAIL_DIGITS:]
+
+
+def _cache_key(tail: str) -> str:
+    return f"msisdn:user:{tail}"
+
+
+def forget_msisdn(*phones) -> None:
+    """Evict cached resolutions for these numbers."""
+    keys = [_cache_key(tail) for _, tail in map(msisdn_keys, phones) if tail]
+    if not keys:
+        return
+    try:
+        cache.delete_many(keys)
+    except Exception as exc:
+        logger.debug("MSISDN cache eviction failed: %s", exc)
+
+
+def find_user_by_msisdn(phone):
+    """User for an incoming MSISDN, or None when unknown or ambiguous."""
+    from accounts.models import User
+
+    digits, tail = msisdn_keys(phone)
+    if not digits:
+        return None
+
+    try:
+        cached_id = cache.get(_cache_key(tail))
+    except Exception:
+        cached_id = None
+    if cached_id is not None:
+        user = User.objects.filter(pk=cached_id).first()
+        if user is not None:
+            return user
+
+    candidates = list(
+        User.objects.filter(Q(phone_digits=digits) | Q(phone_tail9=tail))
+        .exclude(phone_digits="")[:3]
+    )
+    user = next((c for c in candidates if c.phone_digits == digits), None)
+    if user is None and len(candidates) == 1:
+        user = candidates[0]
+
+    # Only a tail shared by no one else resolves the same for every caller format.
+    if user is not None and len(candidates) == 1:
+        try:
+            cache.set(
+                _cache_key(tail),
+                user.pk,
+                int(getattr(settings, "USSD_PHONE_CACHE_SECONDS", 300)),
+            )
+        except Exception as exc:
+            logger.debug("MSISDN cache write failed: %s", exc)
+    return user
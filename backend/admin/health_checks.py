@@ -251,10 +251,24 @@ def check_mtn_momo() -> dict:
             error="Not fully configured",
             latency_ms=_latency_ms(start),
         )
+    from mtn_momo.client import momo_client_stats
+
     token = MTNMoMoService().get_api_token()
-    if token:
-        return _component("MTN MoMo API", "GREEN", latency_ms=_latency_ms(start))
-    return _component("MTN MoMo API", "RED", error="Could not obtain API token", latency_ms=_latency_ms(start))
+    stats = momo_client_stats()
+    extras = {"client": stats}
+    if not token:
+        return _component(
+            "MTN MoMo API", "RED", error="Could not obtain API token", latency_ms=_latency_ms(start), extras=extras
+        )
+    if stats["breaker_state"] != "closed":
+        return _component(
+            "MTN MoMo API",
+            "AMBER",
+            error=f"Circuit {stats['breaker_state']}: recent MoMo calls failing",
+            latency_ms=_latency_ms(start),
+            extras=extras,
+        )
+    return _component("MTN MoMo API", "GREEN", latency_ms=_latency_ms(start), extras=extras)
 
 
 def check_airtel_money() -> dict:
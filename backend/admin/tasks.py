@@ -0,0 +1,9 @@
+from celery import shared_task
+
+
+@shared_task(name="admin.tasks.refresh_admin_metrics", ignore_result=True, expires=60)
+def refresh_admin_metrics():
+    """Periodic task: recompute the admin dashboard/stats snapshot."""
+    from admin.dashboard_metrics import refresh_snapshot
+
+    refresh_snapshot()
@@ -55,6 +55,7 @@ from .views import (
     TariffDetailView,
     TariffSeedEraView,
     TariffActivateView,
+    TariffSimulationView,
     # 2FA (Section 1.3)
     TOTP2FASetupView,
     TOTP2FAStatusView,
@@ -129,6 +130,7 @@ urlpatterns = [
     path('tariffs/', TariffsView.as_view(), name='admin-tariffs'),
     path('tariffs/seed-era/', TariffSeedEraView.as_view(), name='admin-tariffs-seed-era'),
     path('tariffs/<int:pk>/activate/', TariffActivateView.as_view(), name='admin-tariff-activate'),
+    path('tariffs/<int:pk>/simulate/', TariffSimulationView.as_view(), name='admin-tariff-simulate'),
     path('tariffs/<int:pk>/', TariffDetailView.as_view(), name='admin-tariff-detail'),
 
     # --- 2FA (Section 1.3) ---
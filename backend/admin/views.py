@@ -25,10 +25,11 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from accounts.models import Profile, UserAccountDetails
+from accounts.models import UserAccountDetails
 from accounts.utils import create_admin_provisioned_user
 from loan.models import LoanApplication
 from meter.models import Meter, Transaction
+from .dashboard_metrics import get_snapshot
 from .models import (
     AdminActivityLog,
     AdminNotificationSettings,
@@ -168,130 +169,11 @@ class AdminDashboardView(APIView, RBACMixin):
             return err
 
         try:
-            today = timezone.now().date()
-            last_week = today - timedelta(days=7)
-            last_month = today - timedelta(days=30)
-
-            # --- Users ---
-            total_users = User.objects.filter(user_role=User.CLIENT).count()
-            total_admins = User.objects.filter(
-                user_role__in=[User.ADMIN, User.CUSTOMER_SERVICE, User.OPERATOR]
-            ).count()
-            total_meters = Meter.objects.count()
-            active_meters = Meter.objects.filter(status=Meter.STATUS_ACTIVE).count()
-            new_users_today = User.objects.filter(
-                user_role=User.CLIENT, create_date__date=today
-            ).count()
-            new_users_week = User.objects.filter(
-                user_role=User.CLIENT, create_date__date__gte=last_week
-            ).count()
-            verified_users = Profile.objects.filter(email_verified=True).count()
-            users_with_meters = (
-                User.objects.filter(user_role=User.CLIENT, devices__isnull=False)
-                .distinct()
-                .count()
-            )
-
-            # Active users (transacted in last 30 days) — per spec Section 1.5
-            active_users_30d = (
-                User.objects.filter(
-                    user_role=User.CLIENT,
-                    transactions__create_date__date__gte=last_month,
-                )
-                .distinct()
-                .count()
-            )
-
-            # --- Transactions ---
-            transactions_today = Transaction.objects.filter(
-                create_date__date=today
-            ).count()
-            failed_today = Transaction.objects.filter(
-                create_date__date=today, status=Transaction.STATUS_FAILED
-            ).count()
-            total_today = max(transactions_today, 1)
-            failed_pct = round(failed_today / total_today * 100, 1)
-
-            # --- Loans ---
-            active_loans = LoanApplication.objects.filter(
-                status__in=['ACTIVE', 'APPROVED']
-            ).count()
-            # due_date is a Python property — compute overdue in Python
-            try:
-                active_loan_list = LoanApplication.objects.filter(
-                    status='ACTIVE'
-                ).select_related('disbursement')
-                overdue_loans = sum(
-                    1 for l in active_loan_list
-                    if l.due_date and l.due_date.date() < today
-                )
-                loans_30d_overdue = sum(
-                    1 for l in active_loan_list
-                    if l.due_date and l.due_date.date() < today - timedelta(days=30)
-                )
-            except Exception:
-                overdue_loans = 0
-                loans_30d_overdue = 0
-
-            # --- Flagged accounts ---
-            flagged_accounts = FlaggedAccount.objects.filter(
-                status=FlaggedAccount.STATUS_OPEN
-            ).count()
-
-            # --- System status (simplified — Green unless errors detected) ---
-            system_status = "GREEN"
-
-            # --- Recent users ---
-            recent_users = (
-                User.objects.filter(user_role=User.CLIENT)
-                .select_related('profile')
-                .order_by('-create_date')[:10]
-            )
-            recent_users_list = []
-            for u in recent_users:
-                recent_users_list.append({
-                    "id": u.id,
-                    "email": u.email,
-                    "name": f"{u.first_name} {u.last_name}",
-                    "phone": str(u.phone_number) if u.phone_number else '',
-                    "email_verified": getattr(getattr(u, 'profile', None), 'email_verified', False),
-                    "joined": u.create_date.strftime("%Y-%m-%d %H:%M"),
-                    "has_meter": u.devices.exists(),
-                })
-
+            snapshot = get_snapshot()
             return Response({
                 "success": True,
-                # Users
-                "total_users": total_users,
-                "total_admins": total_admins,
-                "total_meters": total_meters,
-                "active_meters": active_meters,
-                "verified_users": verified_users,
-                "users_with_meters": users_with_meters,
-                "new_users_today": new_users_today,
-                "new_users_week": new_users_week,
-                "active_users_30d": active_users_30d,
-                # Transactions (Section 1.5 widgets)
-                "transactions_today": transactions_today,
-                "failed_transactions_today": failed_today,
-                "failed_transaction_pct": failed_pct,
-                # Loans
-                "active_loans": active_loans,
-                "overdue_loans": overdue_loans,
-                "loans_30d_overdue": loans_30d_overdue,
-                # Flags / status
-                "flagged_accounts": flagged_accounts,
-                "system_status": system_status,
-                # Legacy compatibility
-                "total_loans": active_loans,
-                "pending_loans": LoanApplication.objects.filter(status='PENDING').count(),
-                "outstanding_balance": 0,
-                "recent_registrations": new_users_week,
-                "verification_rate": round(
-                    (verified_users / total_users * 100) if total_users > 0 else 0, 1
-                ),
-                "recent_users": recent_users_list,
-                "timestamp": datetime.now().isoformat(),
+                **snapshot["dashboard"],
+                "timestamp": snapshot["computed_at"],
             })
 
         except Exception as exc:
@@ -617,7 +499,9 @@ class UserDetailView(APIView, RBACMixin):
                 wallet_balance = float(w.balance)
 
         # Active loans
-        active_loans_qs = LoanApplication.objects.filter(user=u, status__in=['ACTIVE', 'APPROVED'])
+        active_loans_qs = LoanApplication.objects.filter(
+            user=u, status__in=['ACTIVE', 'APPROVED']
+        ).select_related('disbursement')
         active_loans = [{
             "id": l.id,
             "loan_id": l.loan_id,
@@ -753,12 +637,9 @@ class UserDetailView(APIView, RBACMixin):
 
         wallet = u.wallet_set.first()
         wallet_balance = wallet.balance if wallet else 0
-        # outstanding_balance is a computed @property (interest/penalty math), not a DB
-        # column, so it must be summed in Python rather than via .aggregate(Sum(...)).
-        outstanding = sum(
-            loan.outstanding_balance
-            for loan in LoanApplication.objects.filter(user=u, status__in=['ACTIVE', 'APPROVED'])
-        )
+        outstanding = LoanApplication.objects.filter(
+            user=u, status__in=['ACTIVE', 'APPROVED']
+        ).aggregate(total=Sum('balance'))['total'] or 0
 
         if wallet_balance > 0 or outstanding > 0:
             return Response(
@@ -1471,30 +1352,21 @@ class CreditLoansDashboardView(APIView, RBACMixin):
             return err
 
         today = timezone.now().date()
-        week_from_now = today + timedelta(days=7)
-        grace_cutoff = today - timedelta(days=2)
+        today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        week_end = today_start + timedelta(days=8)
+        grace_cutoff = today_start - timedelta(days=2)
 
         total_active = LoanApplication.objects.filter(status__in=['ACTIVE', 'APPROVED']).count()
 
-        # due_date is a Python property — evaluate in Python
-        try:
-            active_loans_qs = list(
-                LoanApplication.objects.filter(status='ACTIVE').select_related('disbursement')
-            )
-            due_this_week = sum(
-                1 for l in active_loans_qs
-                if l.due_date and today <= l.due_date.date() <= week_from_now
-            )
-            overdue = sum(
-                1 for l in active_loans_qs
-                if l.due_date and l.due_date.date() < grace_cutoff
-            )
-            overdue_30d = sum(
-                1 for l in active_loans_qs
-                if l.due_date and l.due_date.date() < today - timedelta(days=30)
-            )
-        except Exception:
-            due_this_week = overdue = overdue_30d = 0
+        # Counted on the stored (status, due_at) index maintained by loan.lifecycle.
+        due_counts = LoanApplication.objects.filter(status__in=['DISBURSED', 'DEFAULTED']).aggregate(
+            due_this_week=Count('pk', filter=Q(due_at__gte=today_start, due_at__lt=week_end)),
+            overdue=Count('pk', filter=Q(due_at__lt=grace_cutoff)),
+            overdue_30d=Count('pk', filter=Q(due_at__lt=today_start - timedelta(days=30))),
+        )
+        due_this_week = due_counts['due_this_week']
+        overdue = due_counts['overdue']
+        overdue_30d = due_counts['overdue_30d']
 
         repaid_30d = LoanApplication.objects.filter(
             status='REPAID',
@@ -1546,7 +1418,7 @@ class LoanManagementView(APIView, RBACMixin):
             loans_query = loans_query.filter(status=status_filter)
 
         total_count = loans_query.count()
-        loans = loans_query.select_related('user').order_by('-created_at')[offset:offset + limit]
+        loans = loans_query.select_related('user', 'disbursement').order_by('-created_at')[offset:offset + limit]
 
         return Response({
             "success": True,
@@ -2140,7 +2012,7 @@ class ReportsView(APIView, RBACMixin):
             data = {
                 "disbursed": loans.filter(status__in=['ACTIVE', 'REPAID']).count(),
                 "repaid": loans.filter(status='REPAID').count(),
-                "overdue": loans.filter(status='ACTIVE', due_date__lt=today).count(),
+                "overdue": loans.filter(status__in=['DISBURSED', 'DEFAULTED'], due_at__lt=timezone.now()).count(),
             }
 
         elif report_type == 'meter_registration':
@@ -2200,53 +2072,11 @@ class AdminStatsView(APIView, RBACMixin):
         if not ok:
             return err
 
-        today = timezone.now().date()
-        last_week = today - timedelta(days=7)
-        last_month = today - timedelta(days=30)
-
-        daily_registrations = []
-        for i in range(7):
-            date = today - timedelta(days=i)
-            count = User.objects.filter(user_role=User.CLIENT, create_date__date=date).count()
-            daily_registrations.append({"date": date.isoformat(), "count": count})
-        daily_registrations.reverse()
-
-        meter_daily = []
-        for i in range(7):
-            date = today - timedelta(days=i)
-            count = Meter.objects.filter(create_date__date=date).count()
-            meter_daily.append({"date": date.isoformat(), "count": count})
-        meter_daily.reverse()
-
-        total_meters = Meter.objects.count()
-        with_units = Meter.objects.filter(units__gt=0).count()
-        without_units = max(0, total_meters - with_units)
-        active_ratio = round((with_units / total_meters) * 100, 1) if total_meters else 0
-
+        snapshot = get_snapshot()
         return Response({
             "success": True,
-            "stats": {
-                "user_registrations": {
-                    "daily": daily_registrations,
-                    "weekly_total": User.objects.filter(user_role=User.CLIENT, create_date__date__gte=last_week).count(),
-                    "monthly_total": User.objects.filter(user_role=User.CLIENT, create_date__date__gte=last_month).count(),
-                },
-                "meter_registrations": {
-                    "daily": meter_daily,
-                    "total": total_meters,
-                },
-                "user_status": {
-                    "active": User.objects.filter(account_is_active=True, user_role=User.CLIENT).count(),
-                    "inactive": User.objects.filter(account_is_active=False, user_role=User.CLIENT).count(),
-                    "verified": Profile.objects.filter(email_verified=True).count(),
-                    "unverified": Profile.objects.filter(email_verified=False).count(),
-                },
-                "meter_status": {
-                    "with_units": with_units,
-                    "without_units": without_units,
-                    "active_ratio": active_ratio,
-                },
-            },
+            "stats": snapshot["stats"],
+            "computed_at": snapshot["computed_at"],
         })
 
 
@@ -2646,6 +2476,46 @@ class TariffActivateView(APIView, RBACMixin):
         )
 
 
+class TariffSimulationView(APIView, RBACMixin):
+    """
+    What-if: replay recent purchases through tariff `pk` and the active tariff
+    (or `baseline_id`) and report kWh yield / revenue deltas per customer.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        ok, err = self._require_operator_or_admin(request)
+        if not ok:
+            return err
+        from loan.tariff_cache import get_tariff_snapshot, snapshot_for_tariff
+        from utils.bill_simulator import compare_tariffs, load_purchase_sample
+
+        try:
+            candidate = ElectricityTariff.objects.get(pk=pk)
+        except ElectricityTariff.DoesNotExist:
+            return Response({"error": "Not found"}, status=404)
+
+        baseline_id = request.data.get("baseline_id")
+        if baseline_id:
+            try:
+                baseline = snapshot_for_tariff(ElectricityTariff.objects.get(pk=baseline_id))
+            except (ElectricityTariff.DoesNotExist, ValueError):
+                return Response({"error": "Baseline tariff not found"}, status=404)
+        else:
+            baseline = get_tariff_snapshot()
+
+        try:
+            days = min(max(int(request.data.get("days", 90)), 1), 366)
+            top = min(max(int(request.data.get("top", 50)), 0), 500)
+        except (TypeError, ValueError):
+            return Response({"error": "days and top must be integers"}, status=400)
+
+        sample = load_purchase_sample(timezone.now() - timedelta(days=days))
+        report = compare_tariffs(sample, baseline, snapshot_for_tariff(candidate), top=top)
+        return Response({"days": days, **report})
+
+
 class TariffDetailView(APIView, RBACMixin):
     permission_classes = [IsAuthenticated]
 
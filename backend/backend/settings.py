@@ -80,6 +80,23 @@ CORS_ALLOW_ALL_ORIGINS = DEBUG
 from mtn_momo.config import MTN_MOMO_CONFIG, should_simulate_payments  # noqa: E402
 
 MTN_USE_SIMULATED_PAYMENTS = should_simulate_payments()
+# Background MoMo status reconciliation (transactions.tasks.reconcile_momo_payments):
+# beat interval, rows claimed per kind per tick, and parallel MoMo status calls.
+MOMO_RECONCILE_INTERVAL_SECONDS = get_env_variable("MOMO_RECONCILE_INTERVAL_SECONDS", 5, cast=int)
+MOMO_RECONCILE_BATCH_SIZE = get_env_variable("MOMO_RECONCILE_BATCH_SIZE", 100, cast=int)
+MOMO_RECONCILE_CONCURRENCY = get_env_variable("MOMO_RECONCILE_CONCURRENCY", 8, cast=int)
+# Per-payment status check backoff: base * 2^checks, capped at the max.
+MOMO_RECONCILE_BASE_SECONDS = get_env_variable("MOMO_RECONCILE_BASE_SECONDS", 5, cast=int)
+MOMO_RECONCILE_MAX_SECONDS = get_env_variable("MOMO_RECONCILE_MAX_SECONDS", 300, cast=int)
+# Pending payments MoMo has not resolved after this long are marked failed/cancelled.
+MOMO_PAYMENT_EXPIRY_SECONDS = get_env_variable("MOMO_PAYMENT_EXPIRY_SECONDS", 3600, cast=int)
+# Simulated mode: age at which a pending payment auto-completes.
+MOMO_SIMULATED_SETTLE_SECONDS = get_env_variable("MOMO_SIMULATED_SETTLE_SECONDS", 2, cast=int)
+# MoMo HTTP client (mtn_momo.client): renew the shared access token this long before
+# it expires; open the circuit after N consecutive failures and retry after the reset window.
+MOMO_TOKEN_REFRESH_MARGIN_SECONDS = get_env_variable("MOMO_TOKEN_REFRESH_MARGIN_SECONDS", 120, cast=int)
+MOMO_BREAKER_FAILURES = get_env_variable("MOMO_BREAKER_FAILURES", 5, cast=int)
+MOMO_BREAKER_RESET_SECONDS = get_env_variable("MOMO_BREAKER_RESET_SECONDS", 30, cast=int)
 
 THINGSBOARD_BASE_URL = get_env_variable("THINGSBOARD_BASE_URL", "https://iot.energy-share.sun.ac.ug")
 # Server-to-server URL when TB runs on the same production host (bypasses public DNS/firewall hairpin).
@@ -90,15 +107,76 @@ THINGSBOARD_VERIFY_SSL = str(
     get_env_variable("THINGSBOARD_VERIFY_SSL", "true")
 ).strip().lower() in ("1", "true", "yes", "on")
 THINGSBOARD_WEBHOOK_SECRET = get_env_variable("THINGSBOARD_WEBHOOK_SECRET", "")
+THINGSBOARD_WEBHOOK_MAX_BATCH = get_env_variable("THINGSBOARD_WEBHOOK_MAX_BATCH", 5000, cast=int)
 THINGSBOARD_TENANT_USERNAME = get_env_variable("THINGSBOARD_TENANT_USERNAME", "")
 THINGSBOARD_TENANT_PASSWORD = get_env_variable("THINGSBOARD_TENANT_PASSWORD", "")
+# Renew the cached tenant JWT this many seconds before its exp claim.
+THINGSBOARD_TOKEN_REFRESH_MARGIN_SECONDS = get_env_variable("THINGSBOARD_TOKEN_REFRESH_MARGIN_SECONDS", 60, cast=int)
 THINGSBOARD_USAGE_TELEMETRY_KEY = get_env_variable("THINGSBOARD_USAGE_TELEMETRY_KEY", "daily_kwh")
+# How long to remember which attribute scope / telemetry holds each device's remaining_units.
+THINGSBOARD_UNITS_SOURCE_CACHE_SECONDS = get_env_variable("THINGSBOARD_UNITS_SOURCE_CACHE_SECONDS", 86400, cast=int)
 AMI_LOW_UNITS_THRESHOLD_KWH = get_env_variable("AMI_LOW_UNITS_THRESHOLD_KWH", 5, cast=float)
 AMI_LOW_UNITS_POLL_SECONDS = get_env_variable("AMI_LOW_UNITS_POLL_SECONDS", 1, cast=int)
 AMI_LOW_UNITS_ALERT_COOLDOWN_HOURS = get_env_variable("AMI_LOW_UNITS_ALERT_COOLDOWN_HOURS", 6, cast=int)
+# Parallel ThingsBoard reads per poll tick, and the tick's wall-clock budget (0 = poll interval).
+AMI_LOW_UNITS_POLL_CONCURRENCY = get_env_variable("AMI_LOW_UNITS_POLL_CONCURRENCY", 16, cast=int)
+AMI_LOW_UNITS_POLL_DEADLINE_SECONDS = get_env_variable("AMI_LOW_UNITS_POLL_DEADLINE_SECONDS", 0, cast=float)
+# Oldest day the nightly snapshot aggregation will rewrite when late snapshots arrive.
+AMI_USAGE_REAGGREGATE_MAX_DAYS = get_env_variable("AMI_USAGE_REAGGREGATE_MAX_DAYS", 31, cast=int)
+# Energy Usage report cache TTL, and minimum gap between user-requested refreshes per meter.
+POWER_USAGE_CACHE_SECONDS = get_env_variable("POWER_USAGE_CACHE_SECONDS", 60, cast=int)
+POWER_USAGE_REFRESH_COOLDOWN_SECONDS = get_env_variable("POWER_USAGE_REFRESH_COOLDOWN_SECONDS", 60, cast=int)
+
+# =============================
+# Shared cache (tariff snapshot version, hot lookups)
+# Per-process memory by default so local dev needs no Redis; set CACHE_REDIS_URL
+# in production so every gunicorn/celery worker sees the same keys.
+# =============================
+CACHE_REDIS_URL = get_env_variable("CACHE_REDIS_URL", "")
+if CACHE_REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+            "OPTIONS": {
+                "CLIENT_CLASS": "django_redis.client.DefaultClient",
+                "IGNORE_EXCEPTIONS": True,
+            },
+        }
+    }
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+# Billing: workers re-check the tariff version on every bill but rebuild snapshots
+# at most this often even if the version token never changes (per-process cache).
+TARIFF_SNAPSHOT_MAX_AGE_SECONDS = get_env_variable("TARIFF_SNAPSHOT_MAX_AGE_SECONDS", 300, cast=int)
+
+# Loans: how long the per-user "can buy units" gate is cached (reset on every loan
+# write), and how often the background sweep retries stranded disbursements and
+# closes fully paid loans.
+LOAN_GATE_CACHE_SECONDS = get_env_variable("LOAN_GATE_CACHE_SECONDS", 300, cast=int)
+LOAN_SWEEP_INTERVAL_SECONDS = get_env_variable("LOAN_SWEEP_INTERVAL_SECONDS", 60, cast=int)
+LOAN_DEFAULT_GRACE_DAYS = get_env_variable("LOAN_DEFAULT_GRACE_DAYS", 30, cast=int)
+CREDIT_PROFILE_DEBOUNCE_SECONDS = get_env_variable("CREDIT_PROFILE_DEBOUNCE_SECONDS", 30, cast=int)
+CREDIT_PROFILE_MAX_AGE_SECONDS = get_env_variable("CREDIT_PROFILE_MAX_AGE_SECONDS", 86400, cast=int)
+
+# Admin dashboard/stats snapshot (admin.dashboard_metrics): Celery beat recomputes it this often.
+ADMIN_METRICS_REFRESH_SECONDS = get_env_variable("ADMIN_METRICS_REFRESH_SECONDS", 60, cast=int)
 
 # USSD: inactivity timeout between user inputs (seconds). Industry default is 90s.
 USSD_SESSION_TIMEOUT_SECONDS = get_env_variable("USSD_SESSION_TIMEOUT_SECONDS", 90, cast=int)
+# Cache lifetime for MSISDN → user resolutions on USSD requests.
+USSD_PHONE_CACHE_SECONDS = get_env_variable("USSD_PHONE_CACHE_SECONDS", 300, cast=int)
+# USSD session storage: the shared cache (Redis) with write-behind to UssdSession when
+# CACHE_REDIS_URL is set, otherwise the database (LocMem is per-process).
+USSD_SESSION_STORE = get_env_variable(
+    "USSD_SESSION_STORE",
+    "ussd.session_store.CacheSessionStore" if CACHE_REDIS_URL else "ussd.session_store.DatabaseSessionStore",
+)
+# Extra cache lifetime past the inactivity timeout so late retries still see the session.
+USSD_SESSION_CACHE_GRACE_SECONDS = get_env_variable("USSD_SESSION_CACHE_GRACE_SECONDS", 600, cast=int)
+# How often idle cached USSD sessions have their final state written to UssdSession.
+USSD_SESSION_PERSIST_SWEEP_SECONDS = get_env_variable("USSD_SESSION_PERSIST_SWEEP_SECONDS", 60, cast=int)
 
 # Application definition
 
@@ -321,6 +399,31 @@ CELERY_BEAT_SCHEDULE = {
         "schedule": timedelta(seconds=AMI_LOW_UNITS_POLL_SECONDS),
         "options": {"queue": "celery"},
     },
+    "momo-payment-reconcile": {
+        "task": "transactions.tasks.reconcile_momo_payments",
+        "schedule": timedelta(seconds=MOMO_RECONCILE_INTERVAL_SECONDS),
+        "options": {"queue": "celery"},
+    },
+    "loan-lifecycle": {
+        "task": "loan.tasks.run_loan_lifecycle",
+        "schedule": crontab(minute=30, hour=0),
+        "options": {"queue": "celery"},
+    },
+    "loan-state-sweep": {
+        "task": "loan.tasks.sweep_loan_states",
+        "schedule": timedelta(seconds=LOAN_SWEEP_INTERVAL_SECONDS),
+        "options": {"queue": "celery"},
+    },
+    "ussd-idle-session-persist": {
+        "task": "ussd.tasks.persist_idle_ussd_sessions",
+        "schedule": timedelta(seconds=USSD_SESSION_PERSIST_SWEEP_SECONDS),
+        "options": {"queue": "celery"},
+    },
+    "admin-metrics-refresh": {
+        "task": "admin.tasks.refresh_admin_metrics",
+        "schedule": timedelta(seconds=ADMIN_METRICS_REFRESH_SECONDS),
+        "options": {"queue": "celery"},
+    },
 }
 
 # JWT settings
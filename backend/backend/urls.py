@@ -7,7 +7,12 @@ from django.http import HttpResponse
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from webhooks.api.views import ThingsBoardLowUnitsWebhookView, ThingsBoardDailyUsageWebhookView
+from webhooks.api.views import (
+    ThingsBoardDailyUsageBatchWebhookView,
+    ThingsBoardDailyUsageWebhookView,
+    ThingsBoardLowUnitsBatchWebhookView,
+    ThingsBoardLowUnitsWebhookView,
+)
 
 def home(request):
     return HttpResponse("Welcome to the Metering API! Visit /api/v1/ for API endpoints or /admin/ for the admin interface.")
@@ -28,6 +33,16 @@ urlpatterns = [
         ThingsBoardDailyUsageWebhookView.as_view(),
         name='thingsboard-daily-usage-webhook',
     ),
+    path(
+        'webhooks/thingsboard/low-units/batch',
+        ThingsBoardLowUnitsBatchWebhookView.as_view(),
+        name='thingsboard-low-units-batch-webhook',
+    ),
+    path(
+        'webhooks/thingsboard/daily-usage/batch',
+        ThingsBoardDailyUsageBatchWebhookView.as_view(),
+        name='thingsboard-daily-usage-batch-webhook',
+    ),
 ]
 
 urlpatterns += static(
@@ -9,10 +9,8 @@ from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.conf import settings  # Add this import
 
 from loan.models import LoanApplication, LoanRepayment
-from meter.models import Meter
-from meter.services import push_units_to_thingsboard
 from mtn_momo.services import MTNMoMoService
-from transactions.models import TransactionLog, TransactionType
+from transactions.momo_reconciliation import repayment_status
 
 logger = logging.getLogger(__name__)
 
@@ -24,7 +22,7 @@ class MoMoPaymentView(APIView):
         try:
             loan = LoanApplication.objects.get(id=loan_id, user=request.user)
             
-            if loan.status != 'DISBURSED':
+            if loan.status not in ('DISBURSED', 'DEFAULTED'):
                 return Response(
                     {"error": "Loan is not disbursed or already completed"}, 
                     status=status.HTTP_400_BAD_REQUEST
@@ -85,9 +83,9 @@ class MoMoPaymentView(APIView):
             )
 
     def simulate_sandbox_payment(self, loan, amount, phone_number, external_id, payment_ref):
-        """Simulate successful payment in sandbox mode"""
+        """Record the repayment as PENDING; the MoMo reconciler auto-completes it in simulated mode."""
         with transaction.atomic():
-            repayment = LoanRepayment.objects.create(
+            LoanRepayment.objects.create(
                 loan=loan,
                 amount_paid=amount,
                 units_paid=0,
@@ -99,82 +97,16 @@ class MoMoPaymentView(APIView):
                 is_on_time=True
             )
 
-        import threading
-        threading.Thread(
-            target=self._complete_sandbox_payment,
-            args=(loan.id, amount, external_id, repayment.id),
-            daemon=True
-        ).start()
-
         return Response({
-            "message": "Sandbox: Payment simulation started! Status will update in 5 seconds.",
+            "message": "Sandbox: Payment simulation started! Status will update in a few seconds.",
             "payment_reference": payment_ref,
             "external_id": external_id,
             "status": "PENDING",
             "user_prompt": "Sandbox mode: No actual PIN prompt. Payment will auto-complete.",
-            "note": "Check payment status in 5 seconds using the payment-status endpoint.",
+            "note": "Check payment status in a few seconds using the payment-status endpoint.",
             "poll_interval": 5000
         })
 
-    def _complete_sandbox_payment(self, loan_id, amount, external_id, repayment_id):
-        """Background task to complete sandbox payment after 5 seconds"""
-        import time
-        time.sleep(5)
-
-        try:
-            from loan.models import LoanApplication, LoanRepayment
-            from django.db import transaction as db_transaction
-
-            with db_transaction.atomic():
-                repayment = LoanRepayment.objects.get(id=repayment_id)
-                loan = LoanApplication.objects.get(id=loan_id)
-                
-
-                repayment.payment_status = 'SUCCESS'
-                repayment.units_paid = 0
-                repayment.momo_transaction_id = f"SANDBOX_{external_id}"
-                repayment.save()
-
-                TransactionLog.objects.create(
-                    user=loan.user,
-                    transaction_type=TransactionType.LOAN_REPAYMENT,
-                    amount=amount,
-                    units=0,
-                    status='COMPLETED',
-                    reference_id=loan.loan_id,
-                    details={
-                        'payment_reference': repayment.payment_reference,
-                        'payment_source': 'PHONE',
-                        'momo_external_id': external_id,
-                        'sandbox': True,
-                    }
-                )
-
-                logger.info(f"Sandbox: Loan payment completed. Loan: {loan.loan_id}, Amount: {amount}")
-                
-                # Check if loan is fully paid
-
-                meter = Meter.objects.get(user=loan.user)
-                meter.units += repayment.units_paid
-                meter.save()
-                push_ok, push_msg = push_units_to_thingsboard(
-                    meter=meter,
-                    units=repayment.units_paid,
-                    reference_id=repayment.payment_reference,
-                )
-                if not push_ok:
-                    logger.warning("ThingsBoard push failed for sandbox repayment %s: %s", repayment.payment_reference, push_msg)
-
-                logger.info(f"Sandbox: Loan payment completed. Loan: {loan.loan_id}, Amount: {amount}, Units: {repayment.units_paid}")
-
-                if loan.outstanding_balance <= 0:
-                    loan.status = 'COMPLETED'
-                    loan.save()
-                    logger.info(f"Sandbox: Loan {loan.loan_id} marked as COMPLETED")
-
-        except Exception as e:
-            logger.error(f"Sandbox payment completion error: {str(e)}")
-
     def process_real_momo_payment(self, loan, amount, phone_number, external_id, payment_ref):
         """Process real MoMo payment via MTN request-to-pay."""
         momo_reference = str(uuid.uuid4())
@@ -347,21 +279,9 @@ class PaymentStatusView(APIView):
                 loan__user=request.user  # Ensure user owns this payment
             )
 
-            # If already successful, return immediately
-            if repayment.payment_status == 'SUCCESS':
-                return self._build_success_response(repayment)
-
-            # Poll MoMo when not in simulated dev mode
-            from mtn_momo.config import should_simulate_payments
-
-            if should_simulate_payments():
-                return Response({
-                    "payment_status": repayment.payment_status,
-                    "amount": float(repayment.amount_paid),
-                    "transaction_id": repayment.momo_transaction_id,
-                    "note": "Simulated mode: status updates automatically after a few seconds",
-                })
-            return self._check_real_payment_status(repayment, external_id)
+            # Settled by the MoMo reconciler; pending rows are only nudged, never polled here.
+            repayment_status(repayment)
+            return self._build_success_response(repayment)
 
         except LoanRepayment.DoesNotExist:
             logger.error(f"No repayment found for external_id {external_id} and user {request.user.id}")
@@ -376,56 +296,6 @@ class PaymentStatusView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
-    def _check_real_payment_status(self, repayment, external_id):
-        """Check real MoMo payment status"""
-        momo_service = MTNMoMoService()
-        status_result = momo_service.get_payment_status(external_id)
-        logger.info(f"MoMo status check for external_id {external_id}: {status_result}")
-
-        if status_result['status'] == 'SUCCESS':
-            with transaction.atomic():
-                repayment.payment_status = 'SUCCESS'
-                repayment.momo_transaction_id = status_result.get('transaction_id')
-
-                repayment.units_paid = 0
-                repayment.save()
-
-                TransactionLog.objects.create(
-                    user=repayment.loan.user,
-                    transaction_type=TransactionType.LOAN_REPAYMENT,
-                    amount=repayment.amount_paid,
-                    units=0,
-                    status='COMPLETED',
-                    reference_id=repayment.loan.loan_id,
-                    details={
-                        'payment_reference': repayment.payment_reference,
-                        'payment_source': 'PHONE',
-                        'momo_external_id': external_id,
-                    }
-                )
-                # Add units to meter
-                meter = Meter.objects.get(user=repayment.loan.user)
-                meter.units += units_equivalent
-                meter.save()
-                push_ok, push_msg = push_units_to_thingsboard(
-                    meter=meter,
-                    units=units_equivalent,
-                    reference_id=repayment.payment_reference,
-                )
-                if not push_ok:
-                    logger.warning("ThingsBoard push failed for repayment %s: %s", repayment.payment_reference, push_msg)
-
-                # Check loan completion
-                if repayment.loan.outstanding_balance <= 0:
-                    repayment.loan.status = 'COMPLETED'
-                    repayment.loan.save()
-
-        elif status_result['status'] in ['FAILED', 'CANCELLED']:
-            repayment.payment_status = status_result['status']
-            repayment.save()
-
-        return self._build_success_response(repayment)
-    
     def _build_success_response(self, repayment):
         """Build standardized success response"""
         return Response({
@@ -660,13 +660,13 @@ class LoanStatsView(APIView):
             )
 
             total_repayments = float(
-                LoanRepayment.objects.filter(loan__user=request.user)
+                LoanRepayment.objects.filter(loan__user=request.user, payment_status="SUCCESS")
                 .aggregate(total=Sum("amount_paid"))["total"] or 0
             )
 
-            outstanding_balance = sum(
-                float(l.outstanding_balance)
-                for l in loans.exclude(status__in=["COMPLETED", "REJECTED"])
+            outstanding_balance = float(
+                loans.exclude(status__in=["COMPLETED", "REJECTED"])
+                .aggregate(total=Sum("balance"))["total"] or 0
             )
 
             credit_signal = get_or_create_dummy_credit_signal(request.user)
@@ -914,7 +914,7 @@ class LoanRepaymentView(APIView):
         try:
             loan = LoanApplication.objects.get(id=loan_id, user=request.user)
             
-            if loan.status != 'DISBURSED':
+            if loan.status not in ('DISBURSED', 'DEFAULTED'):
                 return Response(
                     {"error": "Loan is not disbursed or already completed"}, 
                     status=status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,237 @@
+"""
+Per-user credit profile snapshots.
+
+`resolve_user_loan_access` runs on loan stats, USSD loan menus, the wallet
+summary and every application. Computing it means syncing the credit signal,
+scoring it, aggregating the repayment trust ladder and resolving the tier, so
+the result is kept in one `CreditProfileSnapshot` row per user and a read is a
+single-row fetch.
+
+A snapshot is served while it is fresh:
+
+- no event since it was computed (`clean_revision` has caught up with
+  `dirty_revision`),
+- time alone cannot have changed it yet (`next_review_at` is the next due date
+  of the user's disbursed loans, or CREDIT_PROFILE_MAX_AGE_SECONDS), and
+- it was computed with the current rules (`formula_version`).
+
+Otherwise the reader recomputes it inline. Loan, repayment, credit-signal and
+profile writes mark the row dirty (`loan.signals`) and queue
+`loan.tasks.refresh_credit_profile` once per CREDIT_PROFILE_DEBOUNCE_SECONDS,
+so bursts of events cost one recompute and the next read is usually a hit.
+Every recompute bumps `revision` and records its trigger in `reason`; bump
+CREDIT_PROFILE_VERSION whenever the scoring rules change.
+
+Events bump `dirty_revision` in their own transaction. A recompute reads it
+before computing and stores it as `clean_revision`, so an event that commits
+after the recompute read its data leaves the row stale for the queued refresh.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import timedelta
+from decimal import Decimal
+from typing import Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from loan.models import CreditProfileSnapshot, LoanApplication
+from loan.services import (
+    MIN_LOAN_AMOUNT,
+    MIN_LOAN_CREDIT_SCORE,
+    PLATFORM_MAX_LOAN,
+    STARTER_MAX_LOAN,
+    compute_user_loan_access,
+)
+
+logger = logging.getLogger(__name__)
+
+CREDIT_PROFILE_VERSION = 1
+SNAPSHOT_FIELDS = (
+    "credit_score",
+    "profile_score",
+    "loan_tier",
+    "interest_rate",
+    "max_eligible_amount",
+    "is_loan_eligible",
+    "trust_level",
+    "trust_cap",
+    "loans_completed_on_time",
+    "loans_completed_late",
+    "loans_defaulted",
+    "loan_overdue",
+    "credit_signal_source",
+)
+
+
+def debounce_seconds() -> int:
+    return max(1, int(getattr(settings, "CREDIT_PROFILE_DEBOUNCE_SECONDS", 30)))
+
+
+def max_age_seconds() -> int:
+    return max(60, int(getattr(settings, "CREDIT_PROFILE_MAX_AGE_SECONDS", 86400)))
+
+
+def is_fresh(snapshot: CreditProfileSnapshot, now=None) -> bool:
+    now = now or timezone.now()
+    return (
+        snapshot.formula_version == CREDIT_PROFILE_VERSION
+        and snapshot.clean_revision >= snapshot.dirty_revision
+        and (snapshot.next_review_at is None or snapshot.next_review_at > now)
+    )
+
+
+def snapshot_access(snapshot: CreditProfileSnapshot) -> dict:
+    """The `resolve_user_loan_access` payload stored in `snapshot`."""
+    return {
+        "credit_score": snapshot.credit_score,
+        "profile_score": snapshot.profile_score,
+        "loan_tier": snapshot.loan_tier,
+        "max_eligible_amount": snapshot.max_eligible_amount,
+        "platform_max_loan": PLATFORM_MAX_LOAN,
+        "starter_max_loan": STARTER_MAX_LOAN,
+        "min_loan_amount": MIN_LOAN_AMOUNT,
+        "min_credit_score": MIN_LOAN_CREDIT_SCORE,
+        "is_loan_eligible": snapshot.is_loan_eligible,
+        "interest_rate": float(snapshot.interest_rate) if snapshot.interest_rate is not None else None,
+        "credit_signal_source": snapshot.credit_signal_source,
+        "trust_level": snapshot.trust_level,
+        "trust_cap": snapshot.trust_cap,
+        "loans_completed_on_time": snapshot.loans_completed_on_time,
+        "loans_completed_late": snapshot.loans_completed_late,
+        "loans_defaulted": snapshot.loans_defaulted,
+        "loan_overdue": snapshot.loan_overdue,
+    }
+
+
+def _next_review_at(user, now):
+    next_due = LoanApplication.objects.filter(user=user, status="DISBURSED", due_at__gt=now).aggregate(
+        next_due=Min("due_at")
+    )["next_due"]
+    fallback = now + timedelta(seconds=max_age_seconds())
+    return min(next_due, fallback) if next_due else fallback
+
+
+def recompute_credit_profile(user, reason: str = "") -> CreditProfileSnapshot:
+    """Compute the user's loan access from scratch and store it as their snapshot."""
+    started = timezone.now()
+    # Events committed after this read keep the row dirty (see the module docstring).
+    seen = CreditProfileSnapshot.objects.filter(user=user).values_list("dirty_revision", flat=True).first() or 0
+    access = compute_user_loan_access(user)
+    values = {field: access[field] for field in SNAPSHOT_FIELDS}
+    if values["interest_rate"] is not None:
+        values["interest_rate"] = Decimal(str(values["interest_rate"]))
+    values.update(
+        formula_version=CREDIT_PROFILE_VERSION,
+        reason=reason[:50],
+        computed_at=started,
+        clean_revision=seen,
+        next_review_at=_next_review_at(user, started),
+    )
+    try:
+        with transaction.atomic():
+            snapshot = CreditProfileSnapshot.objects.select_for_update().filter(user=user).first()
+            if snapshot is None:
+                return CreditProfileSnapshot.objects.create(user=user, revision=1, **values)
+            if snapshot.computed_at > started:
+                # A recompute that started later has already been stored.
+                return snapshot
+            for field, value in values.items():
+                setattr(snapshot, field, value)
+            snapshot.revision += 1
+            snapshot.save()
+            return snapshot
+    except IntegrityError:
+        # A concurrent first recompute created the row; it is at least as fresh.
+        return CreditProfileSnapshot.objects.get(user=user)
+
+
+def get_credit_profile(user) -> dict:
+    """The user's loan access: the stored snapshot, recomputed first when stale."""
+    snapshot = CreditProfileSnapshot.objects.filter(user_id=user.pk).first()
+    if snapshot is None or not is_fresh(snapshot):
+        snapshot = recompute_credit_profile(user, reason="read" if snapshot is None else "stale read")
+    return snapshot_access(snapshot)
+
+
+def _refresh_key(user_id: int) -> str:
+    return f"credit:profile:refresh:{user_id}"
+
+
+def _queue_refresh(user_id: int, reason: str) -> None:
+    try:
+        if not cache.add(_refresh_key(user_id), 1, debounce_seconds()):
+            return
+    except Exception:
+        pass
+    from loan.tasks import refresh_credit_profile
+
+    try:
+        refresh_credit_profile.apply_async((user_id, reason), countdown=debounce_seconds())
+    except Exception as exc:
+        # The row is already dirty, so the next read recomputes it.
+        logger.warning("Could not queue credit profile refresh for user %s: %s", user_id, exc)
+
+
+def mark_credit_profiles_stale(user_ids: Iterable[int], reason: str) -> None:
+    """Flag the users' snapshots for recompute and queue one debounced refresh each."""
+    user_ids = {user_id for user_id in user_ids if user_id}
+    if not user_ids:
+        return
+    CreditProfileSnapshot.objects.filter(user_id__in=user_ids).update(
+        dirty_at=timezone.now(), dirty_revision=F("dirty_revision") + 1
+    )
+
+    def queue():
+        for user_id in user_ids:
+            _queue_refresh(user_id, reason)
+
+    transaction.on_commit(queue)
+
+
+def mark_all_credit_profiles_stale() -> int:
+    """Tier or scoring rule changes affect everyone: flag every snapshot for a recompute on its next read."""
+    return CreditProfileSnapshot.objects.update(dirty_at=timezone.now(), dirty_revision=F("dirty_revision") + 1)
+
+
+def refresh_credit_profile(user_id: int, reason: str = "") -> bool:
+    """Debounced job body: recompute the snapshot if it is still stale; True when it did."""
+    from accounts.models import User
+
+    # Events from here on queue a new job rather than relying on this one.
+    cache.delete(_refresh_key(user_id))
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
+        return False
+    snapshot = CreditProfileSnapshot.objects.filter(user_id=user_id).first()
+    if snapshot is not None and is_fresh(snapshot):
+        return False
+    recompute_credit_profile(user, reason=reason)
+    return True
+
+
+def recompute_credit_profiles(user_ids: Iterable[int] | None = None, reason: str = "audit") -> tuple[int, int]:
+    """
+    Recompute every snapshot (or only `user_ids`) regardless of freshness;
+    returns (recomputed, changed) where changed counts rows whose access differs.
+    """
+    from accounts.models import User
+
+    users = User.objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=list(user_ids))
+    previous = {
+        snapshot.user_id: snapshot_access(snapshot)
+        for snapshot in CreditProfileSnapshot.objects.filter(user__in=users)
+    }
+    recomputed = changed = 0
+    for user in users.iterator(chunk_size=200):
+        snapshot = recompute_credit_profile(user, reason=reason)
+        recomputed += 1
+        if previous.get(user.pk) != snapshot_access(snapshot):
+            changed += 1
+    return recomputed, changed
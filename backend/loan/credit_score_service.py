@@ -1,5 +1,7 @@
 import logging
 from decimal import Decimal
+
+import numpy as np
 from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
@@ -39,7 +41,7 @@ class CreditScoreService:
             
             # Calculate new score based on event
             new_score, change_amount, reason = cls._calculate_score_change(
-                user, factors, event_type, extra_data
+                user, factors, event_type, extra_data, current_score
             )
             
             # Update factors based on event
@@ -53,15 +55,15 @@ class CreditScoreService:
                 signal = user.credit_signal
                 # Update signal based on new score
                 if new_score >= 80:
-                    signal.payment_history = 'GOOD'
-                    signal.financial_capacity = 'STRONG'
+                    values = ('GOOD', 'STRONG')
                 elif new_score >= 60:
-                    signal.payment_history = 'FAIR'
-                    signal.financial_capacity = 'AVERAGE'
+                    values = ('FAIR', 'AVERAGE')
                 else:
-                    signal.payment_history = 'POOR'
-                    signal.financial_capacity = 'WEAK'
-                signal.save()
+                    values = ('POOR', 'WEAK')
+                # Only write (and invalidate the credit profile) when the band moved.
+                if (signal.payment_history, signal.financial_capacity) != values:
+                    signal.payment_history, signal.financial_capacity = values
+                    signal.save(update_fields=['payment_history', 'financial_capacity', 'updated_at'])
             
             # Record history
             if change_amount != 0:
@@ -87,11 +89,12 @@ class CreditScoreService:
             return None, 0, None
     
     @classmethod
-    def _calculate_score_change(cls, user, factors, event_type, extra_data):
+    def _calculate_score_change(cls, user, factors, event_type, extra_data, current_score=None):
         """
         Calculate how much the score should change based on event
         """
-        current_score = calculate_weighted_credit_score(get_or_create_dummy_credit_signal(user))
+        if current_score is None:
+            current_score = calculate_weighted_credit_score(get_or_create_dummy_credit_signal(user))
         
         if event_type == 'UNIT_PURCHASE':
             # Purchasing units increases score
@@ -239,58 +242,13 @@ class CreditScoreService:
         """
         Calculate detailed credit score breakdown for display
         """
+        from loan.rescoring import FACTOR_COLUMNS, score_factors
+
         factors, _ = CreditScoreFactors.objects.get_or_create(user=user)
-        
-        # Calculate individual component scores
-        components = {}
-        
-        # On-time payment score (0-100)
-        total_payments = factors.on_time_payments + factors.late_payments
-        if total_payments > 0:
-            on_time_ratio = (factors.on_time_payments / total_payments) * 100
-            components['payment_history'] = round(on_time_ratio)
-        else:
-            components['payment_history'] = 50  # Neutral starting point
-        
-        # Wallet usage score
-        if factors.wallet_usage_count > 0:
-            wallet_score = min(100, factors.wallet_usage_count * 5 + int(factors.wallet_transaction_volume / 100000))
-            components['wallet_usage'] = round(wallet_score)
-        else:
-            components['wallet_usage'] = 30
-        
-        # Purchase frequency score
-        if factors.purchase_frequency > 0:
-            purchase_score = min(100, factors.purchase_frequency * 10)
-            components['purchase_activity'] = round(purchase_score)
-        else:
-            components['purchase_activity'] = 20
-        
-        # Sharing behavior score
-        if factors.sharing_count > 0:
-            sharing_score = min(100, factors.sharing_count * 15)
-            components['sharing_behavior'] = round(sharing_score)
-        else:
-            components['sharing_behavior'] = 40
-        
-        # Loan history score
-        if factors.loans_taken > 0:
-            completion_ratio = (factors.loans_completed / factors.loans_taken) * 100 if factors.loans_taken > 0 else 0
-            loan_score = (completion_ratio * 0.7) + (min(100, factors.on_time_payments * 5) * 0.3)
-            components['loan_history'] = round(loan_score)
-        else:
-            components['loan_history'] = 50
-        
-        # Weighted total
-        final_score = (
-            components['payment_history'] * cls.WEIGHTS['on_time_payments'] +
-            components['wallet_usage'] * cls.WEIGHTS['wallet_usage'] +
-            components['purchase_activity'] * cls.WEIGHTS['purchase_frequency'] +
-            components['sharing_behavior'] * cls.WEIGHTS['sharing_behavior'] +
-            components['loan_history'] * cls.WEIGHTS['loan_history']
-        )
-        
-        return round(final_score), components
+        # One-row run of the vectorised scorer, so per-user and batch scores agree.
+        columns = {name: np.array([float(getattr(factors, name))]) for name in FACTOR_COLUMNS}
+        scores, components = score_factors(columns, cls.WEIGHTS)
+        return int(scores[0]), {name: int(values[0]) for name, values in components.items()}
 
 
 
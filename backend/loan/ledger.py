@@ -0,0 +1,162 @@
+"""
+Denormalised loan balances.
+
+`LoanApplication` carries its running balance as columns, so purchase gates,
+loan lists and "who owes what" reports read them instead of recomputing
+interest, penalty and repayments loan by loan:
+
+- `principal`: the approved amount.
+- `charges_accrued`: interest for the tenure plus the late penalty (0.1% of
+  principal per day past the due date), capped at
+  MAX_CUMULATIVE_CHARGES_MULTIPLIER × principal.
+- `amount_paid_total`: sum of SUCCESS repayments.
+- `balance`: principal + charges_accrued − amount_paid_total, never below 0.
+
+All figures are Decimal UGX rounded to the cent. `LoanApplication.save`
+re-derives principal, charges and balance; every `LoanRepayment` save or
+delete re-sums the loan's successful repayments under a row lock
+(`loan.signals`); the nightly lifecycle engine (`loan.lifecycle`) advances the
+penalty of overdue loans in bulk.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from loan.models import LoanApplication, LoanRepayment
+
+logger = logging.getLogger(__name__)
+
+LEDGER_FIELDS = ["principal", "charges_accrued", "amount_paid_total", "balance"]
+# Re-derived on every LoanApplication.save.
+DERIVED_FIELDS = ["principal", "charges_accrued", "balance", "due_at"]
+LATE_PENALTY_DAILY_RATE = Decimal("0.001")
+# Loans that can still accrue a penalty.
+ACCRUING_STATUSES = ("DISBURSED", "DEFAULTED")
+
+_CENT = Decimal("0.01")
+_ZERO = Decimal("0")
+
+
+def _money(value) -> Decimal:
+    return Decimal(str(value or 0)).quantize(_CENT, rounding=ROUND_HALF_UP)
+
+
+def charges_cap(principal: Decimal) -> Decimal:
+    return principal * Decimal(str(getattr(settings, "MAX_CUMULATIVE_CHARGES_MULTIPLIER", 1)))
+
+
+def loan_charges(loan: LoanApplication, now=None) -> Decimal:
+    """Interest plus late penalty as of `now`, capped at the statutory share of principal."""
+    principal = _money(loan.amount_approved)
+    if principal <= 0:
+        return _ZERO
+    interest = principal * Decimal(str(loan.interest_rate or 0)) / 100 * Decimal(loan.tenure_months) / 12
+    penalty = _ZERO
+    now = now or timezone.now()
+    due_date = loan.due_date
+    if due_date and now > due_date:
+        penalty = (now - due_date).days * LATE_PENALTY_DAILY_RATE * principal
+    return _money(min(interest + penalty, charges_cap(principal)))
+
+
+def apply_charges(loan: LoanApplication, now=None) -> None:
+    """Re-derive principal, due date, charges and balance on the instance (not saved)."""
+    if loan.due_at is None:
+        loan.due_at = loan.due_date
+    loan.principal = _money(loan.amount_approved)
+    loan.charges_accrued = loan_charges(loan, now)
+    loan.balance = max(_ZERO, loan.principal + loan.charges_accrued - _money(loan.amount_paid_total))
+
+
+def refresh_loan_balance(loan_id: int, now=None) -> Optional[LoanApplication]:
+    """Re-sum successful repayments and recompute the loan's balance under a row lock."""
+    with transaction.atomic():
+        loan = (
+            LoanApplication.objects.select_for_update()
+            .select_related("disbursement")
+            .filter(pk=loan_id)
+            .first()
+        )
+        if loan is None:
+            return None
+        paid = LoanRepayment.objects.filter(loan_id=loan_id, payment_status="SUCCESS").aggregate(
+            total=Sum("amount_paid")
+        )["total"]
+        loan.amount_paid_total = _money(paid)
+        apply_charges(loan, now)
+        loan.save(update_fields=[*LEDGER_FIELDS, "updated_at"])
+    return loan
+
+
+def rebuild_loan_balances(user_ids: Optional[Iterable[int]] = None) -> int:
+    """Recompute every loan's balance columns (all users, or only `user_ids`)."""
+    loans = LoanApplication.objects.all()
+    if user_ids is not None:
+        loans = loans.filter(user_id__in=list(user_ids))
+    count = 0
+    for loan_id in loans.values_list("pk", flat=True).iterator():
+        refresh_loan_balance(loan_id)
+        count += 1
+    return count
+
+
+def accrue_loan_charges(now=None, batch_size: int = 500) -> dict:
+    """
+    Nightly pass (run by `loan.lifecycle.run_loan_lifecycle`): advance the
+    penalty on loans past their stored `due_at`. The new charges are written in
+    bulk, then each batch's balance is re-derived in SQL from the row's own
+    columns so concurrent repayments are never lost.
+    """
+    started = time.monotonic()
+    now = now or timezone.now()
+    loans = (
+        LoanApplication.objects.filter(status__in=ACCRUING_STATUSES, principal__gt=0, due_at__lt=now)
+        .only("pk", "amount_approved", "interest_rate", "tenure_months", "charges_accrued", "principal", "due_at")
+        .order_by("pk")
+    )
+    scanned = updated = capped = 0
+    batch: list[LoanApplication] = []
+
+    def flush():
+        LoanApplication.objects.bulk_update(batch, ["charges_accrued"])
+        LoanApplication.objects.filter(pk__in=[loan.pk for loan in batch]).update(
+            balance=Greatest(F("principal") + F("charges_accrued") - F("amount_paid_total"), Value(_ZERO)),
+            updated_at=now,
+        )
+        batch.clear()
+
+    for loan in loans.iterator(chunk_size=batch_size):
+        scanned += 1
+        charges = loan_charges(loan, now)
+        if charges >= _money(charges_cap(loan.principal)):
+            capped += 1
+        if charges == loan.charges_accrued:
+            continue
+        loan.charges_accrued = charges
+        batch.append(loan)
+        updated += 1
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    metrics = {
+        "scanned": scanned,
+        "updated": updated,
+        "capped": capped,
+        "took_ms": round((time.monotonic() - started) * 1000, 1),
+    }
+    logger.info(
+        "Loan charge accrual: scanned=%s updated=%s capped=%s took=%sms",
+        scanned, updated, capped, metrics["took_ms"],
+    )
+    return metrics
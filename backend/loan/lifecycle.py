@@ -0,0 +1,168 @@
+"""
+Nightly loan lifecycle engine.
+
+Overdue and default are persisted rather than derived from the `due_date`
+property loan by loan. One pass of `run_loan_lifecycle` (beat task
+`loan.tasks.run_loan_lifecycle`):
+
+1. stamps `due_at` (disbursement date + LOAN_MONTH_DAYS × tenure) on disbursed
+   loans that lack it — one UPDATE per tenure;
+2. marks DISBURSED loans past `due_at` as overdue (`overdue_at`);
+3. moves DISBURSED loans with a balance left more than LOAN_DEFAULT_GRACE_DAYS
+   past `due_at` to DEFAULTED, and refreshes their activity feed entries;
+4. advances the late penalty (`loan.ledger.accrue_loan_charges`);
+5. records one `CreditScoreHistory` row per transition in a single bulk insert
+   and marks the affected users' credit profile snapshots stale.
+
+Transitions are claimed in batches under row locks, so a repayment that
+completes a loan mid-run is never overwritten, and each loan yields at most
+one overdue and one default event however often the engine runs.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateTimeField, ExpressionWrapper, OuterRef, Subquery, Value
+from django.utils import timezone
+
+from loan.credit_profile import mark_credit_profiles_stale
+from loan.ledger import accrue_loan_charges
+from loan.models import CreditScoreHistory, LoanApplication, LoanDisbursement, UserCreditSignal
+from loan.scoring import calculate_weighted_credit_score
+from loan.tenure import LOAN_MONTH_DAYS, LOAN_TENURE_MAX_MONTHS, LOAN_TENURE_MIN_MONTHS
+from loan.trust_ladder import (
+    STARTER_CREDIT_SCORE,
+    TRUST_SCORE_PENALTY_DEFAULT,
+    TRUST_SCORE_PENALTY_OVERDUE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def default_grace_days() -> int:
+    return max(0, int(getattr(settings, "LOAN_DEFAULT_GRACE_DAYS", 30)))
+
+
+def stamp_due_dates() -> int:
+    """Set `due_at` on disbursed loans missing it; returns the number stamped."""
+    disbursed_at = LoanDisbursement.objects.filter(loan_application=OuterRef("pk")).values("disbursement_date")[:1]
+    stamped = 0
+    for months in range(LOAN_TENURE_MIN_MONTHS, LOAN_TENURE_MAX_MONTHS + 1):
+        stamped += LoanApplication.objects.filter(
+            due_at__isnull=True, tenure_months=months, disbursement__isnull=False
+        ).update(
+            due_at=ExpressionWrapper(
+                Subquery(disbursed_at) + Value(timedelta(days=LOAN_MONTH_DAYS * months)),
+                output_field=DateTimeField(),
+            )
+        )
+    return stamped
+
+
+def _claim(loans, batch_size: int, **changes) -> list[tuple[int, int, str]]:
+    """
+    Apply `changes` to every loan in `loans`, a locked batch at a time; returns
+    (pk, user_id, loan_id) of the rows changed. `changes` must take a row out
+    of `loans`, which is what ends the loop.
+    """
+    claimed = []
+    while True:
+        with transaction.atomic():
+            batch = list(
+                loans.select_for_update().order_by("pk").values_list("pk", "user_id", "loan_id")[:batch_size]
+            )
+            if not batch:
+                return claimed
+            LoanApplication.objects.filter(pk__in=[row[0] for row in batch]).update(**changes)
+        claimed.extend(batch)
+
+
+def _history_rows(events: list[tuple[tuple[int, int, str], str, int, str]]) -> list[CreditScoreHistory]:
+    """One CreditScoreHistory per event; a user's events chain from their profile score."""
+    user_ids = {row[1] for row, _event, _penalty, _reason in events}
+    scores = {
+        signal.user_id: calculate_weighted_credit_score(signal)
+        for signal in UserCreditSignal.objects.filter(user_id__in=user_ids)
+    }
+    history = []
+    for (_pk, user_id, loan_id), event_type, penalty, reason in events:
+        previous = scores.get(user_id, STARTER_CREDIT_SCORE)
+        new = max(0, previous - penalty)
+        scores[user_id] = new
+        history.append(
+            CreditScoreHistory(
+                user_id=user_id,
+                previous_score=previous,
+                new_score=new,
+                change_amount=new - previous,
+                reason=reason.format(loan_id=loan_id),
+                event_type=event_type,
+                reference_id=loan_id,
+            )
+        )
+    return history
+
+
+def _record_defaults(claimed: list[tuple[int, int, str]], batch_size: int) -> None:
+    from transactions.activity_feed import record_activity
+
+    # Queryset updates skip post_save; refresh the history entries explicitly.
+    pks = [row[0] for row in claimed]
+    for start in range(0, len(pks), batch_size):
+        for loan in LoanApplication.objects.filter(pk__in=pks[start:start + batch_size]):
+            record_activity(loan)
+
+
+def run_loan_lifecycle(now=None, batch_size: int = 500) -> dict:
+    """Advance every loan's lifecycle as of `now`; returns the run's metrics."""
+    started = time.monotonic()
+    now = now or timezone.now()
+    grace_days = default_grace_days()
+
+    stamped = stamp_due_dates()
+    overdue = _claim(
+        LoanApplication.objects.filter(status="DISBURSED", due_at__lt=now, overdue_at__isnull=True),
+        batch_size,
+        overdue_at=now,
+        updated_at=now,
+    )
+    defaulted = _claim(
+        LoanApplication.objects.filter(
+            status="DISBURSED", balance__gt=0, due_at__lt=now - timedelta(days=grace_days)
+        ),
+        batch_size,
+        status="DEFAULTED",
+        updated_at=now,
+    )
+    _record_defaults(defaulted, batch_size)
+    accrual = accrue_loan_charges(now, batch_size=batch_size)
+
+    events = [
+        (row, "LOAN_OVERDUE", TRUST_SCORE_PENALTY_OVERDUE, "Loan {loan_id} is past its due date")
+        for row in overdue
+    ] + [
+        (row, "LOAN_DEFAULT", TRUST_SCORE_PENALTY_DEFAULT, f"Loan {{loan_id}} unpaid {grace_days} days after due date")
+        for row in defaulted
+    ]
+    history = CreditScoreHistory.objects.bulk_create(_history_rows(events), batch_size=batch_size)
+    mark_credit_profiles_stale({row[1] for row, *_rest in events}, reason="loan lifecycle")
+
+    metrics = {
+        "due_stamped": stamped,
+        "overdue": len(overdue),
+        "defaulted": len(defaulted),
+        "history_written": len(history),
+        "charges_updated": accrual["updated"],
+        "charges_capped": accrual["capped"],
+        "took_ms": round((time.monotonic() - started) * 1000, 1),
+    }
+    logger.info(
+        "Loan lifecycle: due_stamped=%s overdue=%s defaulted=%s history=%s charges_updated=%s took=%sms",
+        stamped, metrics["overdue"], metrics["defaulted"], metrics["history_written"],
+        metrics["charges_updated"], metrics["took_ms"],
+    )
+    return metrics
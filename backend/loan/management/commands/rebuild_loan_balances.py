@@ -0,0 +1,27 @@
+"""
+Recompute the denormalised loan balance columns from repayments.
+
+Run after bulk data fixes or if balances are suspected to have drifted:
+    python manage.py rebuild_loan_balances
+    python manage.py rebuild_loan_balances --user 42 --user 43
+"""
+from django.core.management.base import BaseCommand
+
+from loan.ledger import rebuild_loan_balances
+
+
+class Command(BaseCommand):
+    help = "Recompute principal, charges, amount paid and balance on every LoanApplication"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            action="append",
+            type=int,
+            dest="user_ids",
+            help="Limit the rebuild to this user id (repeatable)",
+        )
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_loan_balances(options.get("user_ids"))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt balances of {rebuilt} loans."))
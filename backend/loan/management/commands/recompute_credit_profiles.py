@@ -0,0 +1,28 @@
+"""
+Recompute credit profile snapshots from scratch, ignoring freshness.
+
+Run after changing the scoring rules (or bump CREDIT_PROFILE_VERSION and let
+reads recompute lazily), to backfill snapshots, or to audit stored rows:
+    python manage.py recompute_credit_profiles
+    python manage.py recompute_credit_profiles --user 42 --user 43
+"""
+from django.core.management.base import BaseCommand
+
+from loan.credit_profile import recompute_credit_profiles
+
+
+class Command(BaseCommand):
+    help = "Recompute the CreditProfileSnapshot of every user and report how many changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            action="append",
+            type=int,
+            dest="user_ids",
+            help="Limit the recompute to this user id (repeatable)",
+        )
+
+    def handle(self, *args, **options):
+        recomputed, changed = recompute_credit_profiles(options.get("user_ids"))
+        self.stdout.write(self.style.SUCCESS(f"Recomputed {recomputed} credit profiles ({changed} changed)."))
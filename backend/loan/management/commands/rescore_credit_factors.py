@@ -0,0 +1,49 @@
+"""
+Re-score every user's CreditScoreFactors with the current weights and tiers.
+
+Run after changing CreditScoreService.WEIGHTS or the LoanTier thresholds;
+preview the tier migrations first with --dry-run. Users never rescored before
+are seeded without being reported, so run it once before the change too.
+This only records the factor score and tier on CreditScoreFactors; loan access
+still comes from the credit-signal score and trust ladder.
+
+    python manage.py rescore_credit_factors --dry-run
+    python manage.py rescore_credit_factors
+    python manage.py rescore_credit_factors --user 42 --user 43
+"""
+from django.core.management.base import BaseCommand
+
+from loan.rescoring import rescore_credit_factors
+
+
+class Command(BaseCommand):
+    help = (
+        "Batch re-score CreditScoreFactors, store changed scores/tiers and record CreditScoreHistory "
+        "(factor score only; loan access is unaffected)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            action="append",
+            type=int,
+            dest="user_ids",
+            help="Limit the rescore to this user id (repeatable)",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Report tier migrations without writing")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Factor rows scored per batch")
+
+    def handle(self, *args, **options):
+        report = rescore_credit_factors(
+            options.get("user_ids"),
+            dry_run=options["dry_run"],
+            chunk_size=max(1, options["chunk_size"]),
+        )
+        prefix = "[dry run] " if report["dry_run"] else ""
+        self.stdout.write(
+            f"{prefix}Scanned {report['scanned']} users: {report['changed']} changed, {report['seeded']} seeded, "
+            f"{report['tier_changes']} tier changes, {report['history_written']} history rows"
+        )
+        for migration, count in report["tier_migrations"].items():
+            self.stdout.write(f"  {migration}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"Done in {report['took_ms']}ms."))
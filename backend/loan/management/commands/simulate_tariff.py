@@ -0,0 +1,93 @@
+"""
+What-if comparison of a candidate tariff against the active one.
+
+Replays recent completed purchases (or a synthetic sample) through both
+tariffs in one vectorised pass and reports kWh yield and revenue changes.
+
+Run:
+    python manage.py simulate_tariff DOM-10.1-2026Q2
+    python manage.py simulate_tariff DOM-10.1-2026Q2 --days 30 --top 20
+    python manage.py simulate_tariff DOM-10.1-2026Q2 --synthetic 1000000
+"""
+import json
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from loan.models import ElectricityTariff
+from loan.tariff_cache import get_tariff_snapshot, snapshot_for_tariff
+from utils.bill_simulator import PurchaseSample, compare_tariffs, load_purchase_sample
+
+
+def _resolve_tariff(value):
+    qs = ElectricityTariff.objects.all()
+    tariff = qs.filter(tariff_code=value).first()
+    if tariff is None and str(value).isdigit():
+        tariff = qs.filter(pk=int(value)).first()
+    if tariff is None:
+        raise CommandError(f"Tariff '{value}' not found (use tariff_code or id).")
+    return snapshot_for_tariff(tariff)
+
+
+def _synthetic_sample(rows: int, seed: int) -> PurchaseSample:
+    rng = np.random.default_rng(seed)
+    return PurchaseSample(
+        user_ids=rng.integers(1, max(rows // 20, 2), rows),
+        payments=rng.integers(1_000, 200_000, rows).astype(np.float64),
+        month_to_date_kwh=np.where(rng.random(rows) < 0.4, 0.0, rng.random(rows) * 200),
+        lifeline_eligible=rng.random(rows) < 0.8,
+    )
+
+
+class Command(BaseCommand):
+    help = "Compare kWh yield and revenue of a candidate tariff against the active one"
+
+    def add_arguments(self, parser):
+        parser.add_argument("candidate", help="Candidate tariff_code or id")
+        parser.add_argument("--baseline", help="Baseline tariff_code or id (default: active tariff)")
+        parser.add_argument("--days", type=int, default=90, help="Replay purchases from the last N days")
+        parser.add_argument("--synthetic", type=int, default=0, help="Use N random purchases instead of history")
+        parser.add_argument("--seed", type=int, default=7)
+        parser.add_argument("--top", type=int, default=10, help="Most affected customers to list")
+        parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+
+    def handle(self, *args, **options):
+        candidate = _resolve_tariff(options["candidate"])
+        baseline = _resolve_tariff(options["baseline"]) if options["baseline"] else get_tariff_snapshot()
+
+        if options["synthetic"]:
+            sample = _synthetic_sample(options["synthetic"], options["seed"])
+        else:
+            sample = load_purchase_sample(timezone.now() - timedelta(days=options["days"]))
+
+        started = time.perf_counter()
+        report = compare_tariffs(sample, baseline, candidate, top=options["top"])
+        elapsed = time.perf_counter() - started
+
+        if options["json"]:
+            self.stdout.write(json.dumps({**report, "elapsed_seconds": round(elapsed, 3)}, indent=2))
+            return
+
+        self.stdout.write(f"Simulated {report['baseline']['rows']:,} purchases in {elapsed:.2f}s")
+        for label in ("baseline", "candidate"):
+            row = report[label]
+            self.stdout.write(
+                f"  {label:<9} {row['tariff']:<18} kWh={row['total_kwh']:>14,.2f}  "
+                f"energy={row['energy_revenue']:>16,.2f}  service={row['service_revenue']:>14,.2f}  "
+                f"vat={row['vat']:>14,.2f}"
+            )
+        delta = report["delta"]
+        self.stdout.write(
+            f"  delta                        kWh={delta['total_kwh']:>14,.2f}  "
+            f"billed={delta['total_billed']:>16,.2f}"
+        )
+        if report["customers"]:
+            self.stdout.write("\nMost affected customers (kWh):")
+            for row in report["customers"]:
+                self.stdout.write(
+                    f"  user {row['user_id']:>8}: {row['baseline_kwh']:>10,.2f} -> "
+                    f"{row['candidate_kwh']:>10,.2f} ({row['delta_kwh']:+,.2f})"
+                )
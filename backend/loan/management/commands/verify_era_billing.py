@@ -13,9 +13,12 @@ from loan.models import ElectricityTariff, TariffBlock
 from utils.billing import (
     DEFAULT_SERVICE_CHARGE,
     VAT_RATE,
+    _bisect_units_for_payment,
     calculate_bill_for_units,
     calculate_units_from_payment,
     get_active_domestic_tariff,
+    load_billing_context,
+    solve_units_for_payment,
 )
 
 
@@ -38,6 +41,9 @@ CASES = [
     {"payment": "5000", "expected_units": "5.60", "monthly": "28", "lifeline": True},
 ]
 
+# Payments swept to cross-check the closed-form solver against bisection.
+SWEEP_PAYMENTS = [Decimal(p) for p in range(500, 400001, 1250)]
+
 
 class Command(BaseCommand):
     help = "Verify ERA Q4 2025 billing examples against utils.billing"
@@ -79,6 +85,32 @@ class Command(BaseCommand):
                 billing_mod.get_monthly_units_consumed = original
 
         self.stdout.write(f"\n{ok}/{len(CASES)} examples matched.")
+
+        mismatches = 0
+        checked = 0
+        for case in CASES:
+            user, monthly_fn = _mock_user(case["lifeline"], Decimal(case["monthly"]))
+            original = billing_mod.get_monthly_units_consumed
+            billing_mod.get_monthly_units_consumed = monthly_fn
+            try:
+                ctx = load_billing_context(user)
+            finally:
+                billing_mod.get_monthly_units_consumed = original
+
+            for payment in SWEEP_PAYMENTS:
+                solved, _ = solve_units_for_payment(payment, ctx)
+                reference = _bisect_units_for_payment(payment, ctx)
+                checked += 1
+                if solved.quantize(Decimal("0.01")) != reference.quantize(Decimal("0.01")):
+                    mismatches += 1
+                    self.stdout.write(
+                        self.style.ERROR(
+                            f"MISMATCH  UGX {payment} (monthly={case['monthly']}): "
+                            f"closed-form {solved} vs bisection {reference}"
+                        )
+                    )
+        style = self.style.SUCCESS if not mismatches else self.style.ERROR
+        self.stdout.write(style(f"Closed-form solver: {checked - mismatches}/{checked} payments agree with bisection."))
         if ok < len(CASES):
             self.stdout.write(
                 self.style.WARNING('Run "python manage.py seed_era_tariff" if blocks are missing.')
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-17 23:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0019_creditscorefactors_created_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loanrepayment',
+            name='next_status_check_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='loanrepayment',
+            name='status_checks',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='loanrepayment',
+            index=models.Index(condition=models.Q(('payment_status', 'PENDING')), fields=['next_status_check_at'], name='repay_pending_next_check_idx'),
+        ),
+    ]
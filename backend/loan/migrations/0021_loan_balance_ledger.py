@@ -0,0 +1,89 @@
+# Generated by Django 5.2 on 2026-10-17 23:31
+
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import migrations, models
+from django.db.models import Sum
+from django.utils import timezone
+
+CENT = Decimal('0.01')
+
+
+def backfill_loan_balances(apps, schema_editor):
+    """Seed the balance columns with what the old outstanding_balance property computed."""
+    LoanApplication = apps.get_model('loan', 'LoanApplication')
+    LoanRepayment = apps.get_model('loan', 'LoanRepayment')
+
+    paid_by_loan = dict(
+        LoanRepayment.objects.filter(payment_status='SUCCESS')
+        .values('loan_id').annotate(total=Sum('amount_paid')).values_list('loan_id', 'total')
+    )
+    multiplier = Decimal(str(getattr(settings, 'MAX_CUMULATIVE_CHARGES_MULTIPLIER', 1)))
+    now = timezone.now()
+    batch = []
+    for loan in LoanApplication.objects.select_related('disbursement').iterator(chunk_size=500):
+        principal = Decimal(str(loan.amount_approved or 0)).quantize(CENT, rounding=ROUND_HALF_UP)
+        charges = Decimal('0')
+        if principal > 0:
+            charges = principal * Decimal(str(loan.interest_rate or 0)) / 100 * Decimal(loan.tenure_months) / 12
+            try:
+                due = loan.disbursement.disbursement_date + timedelta(days=30 * loan.tenure_months)
+            except ObjectDoesNotExist:
+                due = None
+            if due and now > due:
+                charges += (now - due).days * Decimal('0.001') * principal
+            charges = min(charges, principal * multiplier).quantize(CENT, rounding=ROUND_HALF_UP)
+        paid = Decimal(str(paid_by_loan.get(loan.pk) or 0)).quantize(CENT, rounding=ROUND_HALF_UP)
+        loan.principal = principal
+        loan.charges_accrued = charges
+        loan.amount_paid_total = paid
+        loan.balance = max(Decimal('0'), principal + charges - paid)
+        batch.append(loan)
+        if len(batch) >= 500:
+            LoanApplication.objects.bulk_update(batch, ['principal', 'charges_accrued', 'amount_paid_total', 'balance'])
+            batch = []
+    if batch:
+        LoanApplication.objects.bulk_update(batch, ['principal', 'charges_accrued', 'amount_paid_total', 'balance'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0020_momo_reconciliation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loanapplication',
+            name='amount_paid_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='loanapplication',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='loanapplication',
+            name='charges_accrued',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Interest plus late penalty so far, capped at MAX_CUMULATIVE_CHARGES_MULTIPLIER x principal', max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='loanapplication',
+            name='principal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='loanapplication',
+            index=models.Index(fields=['user', 'status'], name='loan_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanapplication',
+            index=models.Index(fields=['status', 'balance'], name='loan_status_balance_idx'),
+        ),
+        migrations.RunPython(backfill_loan_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-17 23:37
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import DateTimeField, ExpressionWrapper, OuterRef, Subquery, Value
+
+
+def backfill_due_at(apps, schema_editor):
+    """Store disbursement date + 30 days x tenure on every disbursed loan."""
+    LoanApplication = apps.get_model('loan', 'LoanApplication')
+    LoanDisbursement = apps.get_model('loan', 'LoanDisbursement')
+
+    disbursed_at = LoanDisbursement.objects.filter(loan_application=OuterRef('pk')).values('disbursement_date')[:1]
+    for months in range(1, 13):
+        LoanApplication.objects.filter(tenure_months=months, disbursement__isnull=False).update(
+            due_at=ExpressionWrapper(
+                Subquery(disbursed_at) + Value(timedelta(days=30 * months)),
+                output_field=DateTimeField(),
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0021_loan_balance_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loanapplication',
+            name='due_at',
+            field=models.DateTimeField(blank=True, help_text='Disbursement date + LOAN_MONTH_DAYS x tenure', null=True),
+        ),
+        migrations.AddField(
+            model_name='loanapplication',
+            name='overdue_at',
+            field=models.DateTimeField(blank=True, help_text='When the nightly engine first found the loan past its due date', null=True),
+        ),
+        migrations.AlterField(
+            model_name='creditscorehistory',
+            name='event_type',
+            field=models.CharField(choices=[('LOAN_APPLICATION', 'Loan Application'), ('LOAN_REPAYMENT', 'Loan Repayment'), ('UNIT_PURCHASE', 'Unit Purchase'), ('WALLET_USAGE', 'Wallet Usage'), ('LATE_PAYMENT', 'Late Payment'), ('ON_TIME_PAYMENT', 'On-Time Payment'), ('SHARE_UNITS', 'Share Units'), ('METER_REGISTRATION', 'Meter Registration'), ('LOAN_OVERDUE', 'Loan Overdue'), ('LOAN_DEFAULT', 'Loan Default')], max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='loanapplication',
+            index=models.Index(fields=['status', 'due_at'], name='loan_status_due_idx'),
+        ),
+        migrations.RunPython(backfill_due_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-17 23:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0022_loan_lifecycle'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditProfileSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('credit_score', models.IntegerField()),
+                ('profile_score', models.IntegerField()),
+                ('loan_tier', models.CharField(max_length=20)),
+                ('interest_rate', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('max_eligible_amount', models.IntegerField()),
+                ('is_loan_eligible', models.BooleanField()),
+                ('trust_level', models.CharField(max_length=20)),
+                ('trust_cap', models.IntegerField()),
+                ('loans_completed_on_time', models.IntegerField(default=0)),
+                ('loans_completed_late', models.IntegerField(default=0)),
+                ('loans_defaulted', models.IntegerField(default=0)),
+                ('loan_overdue', models.BooleanField(default=False)),
+                ('credit_signal_source', models.CharField(blank=True, max_length=100, null=True)),
+                ('formula_version', models.PositiveSmallIntegerField(help_text='Scoring rules the row was computed with')),
+                ('revision', models.PositiveIntegerField(default=0, help_text='Incremented on every recompute')),
+                ('reason', models.CharField(blank=True, help_text='Event that triggered the last recompute', max_length=50)),
+                ('computed_at', models.DateTimeField()),
+                ('next_review_at', models.DateTimeField(blank=True, help_text='When time alone can change the result (next loan due date)', null=True)),
+                ('dirty_at', models.DateTimeField(blank=True, help_text='Last event after which the row must be recomputed', null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='credit_profile', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-17 23:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0023_credit_profile_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='creditscorefactors',
+            name='loan_tier',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='creditscorefactors',
+            name='score',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='creditscorefactors',
+            name='scored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='creditscorehistory',
+            name='event_type',
+            field=models.CharField(choices=[('LOAN_APPLICATION', 'Loan Application'), ('LOAN_REPAYMENT', 'Loan Repayment'), ('UNIT_PURCHASE', 'Unit Purchase'), ('WALLET_USAGE', 'Wallet Usage'), ('LATE_PAYMENT', 'Late Payment'), ('ON_TIME_PAYMENT', 'On-Time Payment'), ('SHARE_UNITS', 'Share Units'), ('METER_REGISTRATION', 'Meter Registration'), ('LOAN_OVERDUE', 'Loan Overdue'), ('LOAN_DEFAULT', 'Loan Default'), ('RESCORE', 'Batch Rescore')], max_length=50),
+        ),
+    ]
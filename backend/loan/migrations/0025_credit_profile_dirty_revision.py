@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 00:02
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def carry_over_dirty_rows(apps, schema_editor):
+    """Rows stale under the old `dirty_at < computed_at` test stay stale."""
+    CreditProfileSnapshot = apps.get_model('loan', 'CreditProfileSnapshot')
+    CreditProfileSnapshot.objects.filter(dirty_at__gte=F('computed_at')).update(dirty_revision=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0024_credit_factor_rescore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='creditprofilesnapshot',
+            name='clean_revision',
+            field=models.PositiveIntegerField(default=0, help_text='dirty_revision seen before the last recompute read its data'),
+        ),
+        migrations.AddField(
+            model_name='creditprofilesnapshot',
+            name='dirty_revision',
+            field=models.PositiveIntegerField(default=0, help_text='Incremented by every event that makes the row stale'),
+        ),
+        migrations.RunPython(carry_over_dirty_rows, migrations.RunPython.noop),
+    ]
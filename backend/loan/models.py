@@ -180,6 +180,19 @@ class LoanApplication(TimeStampedModel):
     tariff = models.ForeignKey(ElectricityTariff, on_delete=models.SET_NULL, null=True, blank=True)
     rejection_reason = models.TextField(null=True, blank=True)
     user_notified = models.BooleanField(default=False)
+    # Running balance (loan.ledger): kept in step with repayments and the nightly accrual.
+    principal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    charges_accrued = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0,
+        help_text="Interest plus late penalty so far, capped at MAX_CUMULATIVE_CHARGES_MULTIPLIER x principal",
+    )
+    amount_paid_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Lifecycle (loan.lifecycle): stamped at disbursement and by the nightly engine.
+    due_at = models.DateTimeField(null=True, blank=True, help_text="Disbursement date + LOAN_MONTH_DAYS x tenure")
+    overdue_at = models.DateTimeField(
+        null=True, blank=True, help_text="When the nightly engine first found the loan past its due date",
+    )
     
     def check_eligibility(self):
         return self.credit_score >= 75 if self.credit_score else False
@@ -198,6 +211,13 @@ class LoanApplication(TimeStampedModel):
             else:
                 self.status = 'REJECTED'
                 self.rejection_reason = "Credit score below 75% threshold"
+
+        from loan.ledger import DERIVED_FIELDS, apply_charges
+
+        # amount_paid_total is only written by loan.ledger.refresh_loan_balance.
+        apply_charges(self)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], *DERIVED_FIELDS}
     
         super().save(*args, **kwargs)
 
@@ -234,6 +254,8 @@ class LoanApplication(TimeStampedModel):
     
     @property
     def due_date(self):
+        if self.due_at:
+            return self.due_at
         if hasattr(self, 'disbursement') and self.disbursement:
             return loan_due_date(self.disbursement.disbursement_date, self.tenure_months)
         return None
@@ -247,38 +269,21 @@ class LoanApplication(TimeStampedModel):
     
     @property
     def amount_paid(self):
-        return sum(float(repayment.amount_paid) for repayment in self.repayments.all())
-
+        # Pending MoMo collections only count once the reconciler confirms them.
+        return float(self.amount_paid_total)
 
     @property
     def outstanding_balance(self):
-        """Calculate outstanding balance with the statutory 100%-of-principal cap on all charges."""
-        if not self.amount_approved:
-            return 0
-
-        principal = float(self.amount_approved)
-
-        # Interest (annual rate applied pro-rata over tenure)
-        interest = principal * float(self.interest_rate) / 100 * (self.tenure_months / 12)
-
-        # Late-payment penalty: 0.1% per day on principal
-        penalty = 0.0
-        if self.due_date and timezone.now() > self.due_date:
-            days_late = (timezone.now() - self.due_date).days
-            penalty = days_late * 0.001 * principal
-
-        # Statutory cap: total charges (interest + penalty) must not exceed 100% of principal
-        max_charges = principal * float(
-            getattr(settings, 'MAX_CUMULATIVE_CHARGES_MULTIPLIER', 1.0)
-        )
-        total_charges = min(interest + penalty, max_charges)
-
-        total_due = principal + total_charges
-        balance = total_due - self.amount_paid
-        return max(0.0, balance)
+        """Balance still owed, charges capped at 100% of principal (see `loan.ledger`)."""
+        return float(self.balance)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'status'], name='loan_user_status_idx'),
+            models.Index(fields=['status', 'balance'], name='loan_status_balance_idx'),
+            models.Index(fields=['status', 'due_at'], name='loan_status_due_idx'),
+        ]
 
 
 class LoanDisbursement(TimeStampedModel):
@@ -338,12 +343,22 @@ class LoanRepayment(TimeStampedModel):
         ],
         default='PENDING'
     )
+    # MoMo status reconciliation (transactions.momo_reconciliation).
+    status_checks = models.PositiveSmallIntegerField(default=0)
+    next_status_check_at = models.DateTimeField(null=True, blank=True)
     
     def __str__(self):
         return f"Repayment #{self.id} for Loan #{self.loan.loan_id}"
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['next_status_check_at'],
+                condition=models.Q(payment_status='PENDING'),
+                name='repay_pending_next_check_idx',
+            ),
+        ]
 
 
 class LoanTier(models.Model):
@@ -445,6 +460,9 @@ class CreditScoreHistory(models.Model):
         ('ON_TIME_PAYMENT', 'On-Time Payment'),
         ('SHARE_UNITS', 'Share Units'),
         ('METER_REGISTRATION', 'Meter Registration'),
+        ('LOAN_OVERDUE', 'Loan Overdue'),
+        ('LOAN_DEFAULT', 'Loan Default'),
+        ('RESCORE', 'Batch Rescore'),
     ])
     reference_id = models.CharField(max_length=100, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -488,9 +506,49 @@ class CreditScoreFactors(models.Model):
     # Account age
     account_age_days = models.IntegerField(default=0)
     last_activity_date = models.DateTimeField(auto_now=True)
+
+    # Written by the batch rescore (loan.rescoring), not per event.
+    score = models.IntegerField(null=True, blank=True)
+    loan_tier = models.CharField(max_length=20, null=True, blank=True)
+    scored_at = models.DateTimeField(null=True, blank=True)
     
     updated_at = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
-        return f"Factors for {self.user.email}"
\ No newline at end of file
+        return f"Factors for {self.user.email}"
+
+
+class CreditProfileSnapshot(models.Model):
+    """
+    Precomputed loan access per user (see loan.credit_profile): what
+    `resolve_user_loan_access` serves, recomputed after loan, repayment,
+    credit-signal and profile events.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='credit_profile')
+    credit_score = models.IntegerField()
+    profile_score = models.IntegerField()
+    loan_tier = models.CharField(max_length=20)
+    interest_rate = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    max_eligible_amount = models.IntegerField()
+    is_loan_eligible = models.BooleanField()
+    trust_level = models.CharField(max_length=20)
+    trust_cap = models.IntegerField()
+    loans_completed_on_time = models.IntegerField(default=0)
+    loans_completed_late = models.IntegerField(default=0)
+    loans_defaulted = models.IntegerField(default=0)
+    loan_overdue = models.BooleanField(default=False)
+    credit_signal_source = models.CharField(max_length=100, null=True, blank=True)
+    formula_version = models.PositiveSmallIntegerField(help_text="Scoring rules the row was computed with")
+    revision = models.PositiveIntegerField(default=0, help_text="Incremented on every recompute")
+    reason = models.CharField(max_length=50, blank=True, help_text="Event that triggered the last recompute")
+    computed_at = models.DateTimeField()
+    next_review_at = models.DateTimeField(
+        null=True, blank=True, help_text="When time alone can change the result (next loan due date)",
+    )
+    dirty_at = models.DateTimeField(null=True, blank=True, help_text="Last event after which the row must be recomputed")
+    dirty_revision = models.PositiveIntegerField(default=0, help_text="Incremented by every event that makes the row stale")
+    clean_revision = models.PositiveIntegerField(default=0, help_text="dirty_revision seen before the last recompute read its data")
+
+    def __str__(self):
+        return f"CreditProfile<{self.user_id}> r{self.revision}: {self.credit_score} {self.loan_tier}"
\ No newline at end of file
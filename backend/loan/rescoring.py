@@ -0,0 +1,207 @@
+"""
+Vectorised batch rescoring over `CreditScoreFactors`.
+
+`CreditScoreService.calculate_detailed_score` scores one user at a time. After
+a change to `CreditScoreService.WEIGHTS` or to the `LoanTier` thresholds,
+`rescore_credit_factors` re-scores everyone: it streams the factor rows in
+chunks, computes each chunk's component and final scores as NumPy arrays, maps
+them to the active tiers, and diffs them against the score and tier stored by
+the previous rescore. Changed rows are written with one `bulk_update` and a
+`CreditScoreHistory` (`RESCORE`) insert per chunk. With `dry_run=True` nothing
+is written and the report only counts the tier migrations.
+
+Rows never rescored have no baseline from this scorer. They are seeded
+silently: stored and counted as `seeded`, but never reported as a tier
+migration and given no history. Run the job once before changing the weights
+or tiers so the run after the change has a baseline.
+
+The job only records the factor score. Loan access, caps and
+`CreditProfileSnapshot` are resolved from the credit-signal score and trust
+ladder (`loan.services.compute_user_loan_access`), so a rescore changes no
+user's live tier or limit.
+
+Arithmetic is float64 with round-half-even, the same as Python's `round`, so
+results match `calculate_detailed_score` exactly.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from collections import Counter
+from typing import Iterable, Optional
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from loan.credit_score_service import CreditScoreService
+from loan.models import CreditScoreFactors, CreditScoreHistory, LoanTier
+
+logger = logging.getLogger(__name__)
+
+FACTOR_COLUMNS = (
+    "on_time_payments",
+    "late_payments",
+    "wallet_usage_count",
+    "wallet_transaction_volume",
+    "purchase_frequency",
+    "sharing_count",
+    "loans_taken",
+    "loans_completed",
+)
+NO_TIER = "NONE"
+
+
+def score_factors(columns: dict[str, np.ndarray], weights: Optional[dict] = None) -> tuple[np.ndarray, dict]:
+    """
+    Final scores and per-component scores for arrays of factor values (one
+    entry per user). Mirrors `CreditScoreService.calculate_detailed_score`.
+    """
+    weights = weights or CreditScoreService.WEIGHTS
+    on_time = columns["on_time_payments"]
+    total_payments = on_time + columns["late_payments"]
+    wallet_count = columns["wallet_usage_count"]
+    purchases = columns["purchase_frequency"]
+    shares = columns["sharing_count"]
+    taken = columns["loans_taken"]
+    # Divisions by zero are masked out by the np.where guards.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        components = {
+            "payment_history": np.where(total_payments > 0, np.round(on_time / total_payments * 100), 50),
+            "wallet_usage": np.where(
+                wallet_count > 0,
+                np.minimum(100, wallet_count * 5 + np.trunc(columns["wallet_transaction_volume"] / 100000)),
+                30,
+            ),
+            "purchase_activity": np.where(purchases > 0, np.minimum(100, purchases * 10), 20),
+            "sharing_behavior": np.where(shares > 0, np.minimum(100, shares * 15), 40),
+            "loan_history": np.where(
+                taken > 0,
+                np.round(
+                    columns["loans_completed"] / taken * 100 * 0.7 + np.minimum(100, on_time * 5) * 0.3
+                ),
+                50,
+            ),
+        }
+    final = np.round(
+        components["payment_history"] * weights["on_time_payments"]
+        + components["wallet_usage"] * weights["wallet_usage"]
+        + components["purchase_activity"] * weights["purchase_frequency"]
+        + components["sharing_behavior"] * weights["sharing_behavior"]
+        + components["loan_history"] * weights["loan_history"]
+    )
+    return final.astype(np.int64), {name: values.astype(np.int64) for name, values in components.items()}
+
+
+def active_tiers() -> list[tuple[str, int, int]]:
+    """(name, min_score, max_score) of the active tiers, in `get_tier_by_score` precedence."""
+    tiers = LoanTier.objects.filter(is_active=True).order_by("min_score")
+    return list(tiers.values_list("name", "min_score", "max_score"))
+
+
+def assign_tiers(scores: np.ndarray, tiers: list[tuple[str, int, int]]) -> np.ndarray:
+    """Tier name per score (None outside every tier); the lowest matching tier wins, as in `get_tier_by_score`."""
+    names = np.full(scores.shape, None, dtype=object)
+    for name, min_score, max_score in reversed(tiers):
+        names[(scores >= min_score) & (scores <= max_score)] = name
+    return names
+
+
+def _columns(rows: list[tuple]) -> dict[str, np.ndarray]:
+    # rows: (pk, user_id, score, loan_tier, *FACTOR_COLUMNS)
+    values = np.array([row[4:] for row in rows], dtype=np.float64).reshape(len(rows), len(FACTOR_COLUMNS))
+    return {name: values[:, index] for index, name in enumerate(FACTOR_COLUMNS)}
+
+
+def _rescore_chunk(
+    rows: list[tuple], tiers, now, dry_run: bool, migrations: Counter
+) -> tuple[int, int, int, int]:
+    """Score one chunk; returns (changed, seeded, tier_changes, history_written)."""
+    scores, _ = score_factors(_columns(rows))
+    new_tiers = assign_tiers(scores, tiers)
+    unscored = np.array([row[2] is None for row in rows], dtype=bool)
+    old_scores = np.array([-1 if row[2] is None else row[2] for row in rows], dtype=np.int64)
+    old_tiers = np.array([row[3] for row in rows], dtype=object)
+    changed = np.flatnonzero(unscored | (scores != old_scores) | (new_tiers != old_tiers))
+    seeded = tier_changes = 0
+    updates, history = [], []
+    for index in changed:
+        pk, user_id, old_score, old_tier = rows[index][:4]
+        score, tier = int(scores[index]), new_tiers[index]
+        if old_score is None:
+            # First rescore of this row: no baseline from this scorer to diff against.
+            seeded += 1
+        elif tier != old_tier:
+            tier_changes += 1
+            migrations[f"{old_tier or NO_TIER} -> {tier or NO_TIER}"] += 1
+        if dry_run:
+            continue
+        updates.append(CreditScoreFactors(pk=pk, score=score, loan_tier=tier, scored_at=now))
+        if old_score is not None and old_score != score:
+            history.append(
+                CreditScoreHistory(
+                    user_id=user_id,
+                    previous_score=old_score,
+                    new_score=score,
+                    change_amount=score - old_score,
+                    reason=f"Batch rescore (tier {old_tier or NO_TIER} -> {tier or NO_TIER})",
+                    event_type="RESCORE",
+                )
+            )
+    if updates:
+        with transaction.atomic():
+            CreditScoreFactors.objects.bulk_update(updates, ["score", "loan_tier", "scored_at"])
+            CreditScoreHistory.objects.bulk_create(history)
+    return len(changed) - seeded, seeded, tier_changes, len(history)
+
+
+def rescore_credit_factors(
+    user_ids: Optional[Iterable[int]] = None,
+    *,
+    dry_run: bool = False,
+    chunk_size: int = 2000,
+) -> dict:
+    """Re-score every user's factors (or only `user_ids`); returns the run report."""
+    started = time.monotonic()
+    now = timezone.now()
+    tiers = active_tiers()
+    factors = CreditScoreFactors.objects.all()
+    if user_ids is not None:
+        factors = factors.filter(user_id__in=list(user_ids))
+    rows = factors.order_by("pk").values_list("pk", "user_id", "score", "loan_tier", *FACTOR_COLUMNS)
+
+    migrations: Counter = Counter()
+    totals: Counter = Counter()
+    chunk: list[tuple] = []
+
+    def flush():
+        changed, seeded, tier_changes, history_written = _rescore_chunk(chunk, tiers, now, dry_run, migrations)
+        totals.update(
+            scanned=len(chunk), changed=changed, seeded=seeded, tier_changes=tier_changes,
+            history_written=history_written,
+        )
+        chunk.clear()
+
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    report = {
+        "dry_run": dry_run,
+        "scanned": totals["scanned"],
+        "changed": totals["changed"],
+        "seeded": totals["seeded"],
+        "tier_changes": totals["tier_changes"],
+        "history_written": totals["history_written"],
+        "tier_migrations": dict(migrations.most_common()),
+        "took_ms": round((time.monotonic() - started) * 1000, 1),
+    }
+    logger.info(
+        "Credit rescore%s: scanned=%s changed=%s seeded=%s tier_changes=%s history=%s took=%sms",
+        " (dry run)" if dry_run else "", report["scanned"], report["changed"], report["seeded"],
+        report["tier_changes"], report["history_written"], report["took_ms"],
+    )
+    return report
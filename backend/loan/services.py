@@ -7,13 +7,17 @@ mutations stay aligned with the web portal (`loan.api.views`).
 from __future__ import annotations
 
 import logging
+from datetime import timedelta
 from decimal import Decimal, InvalidOperation
 
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction
-from django.db.models import Sum
+from django.db.models import Count, Q, Sum
 from django.utils import timezone
 
 from accounts.models import generate_random_string
+from loan.ledger import refresh_loan_balance
 from loan.models import ElectricityTariff, LoanApplication, LoanDisbursement, LoanRepayment, get_tier_by_score
 from loan.scoring import calculate_weighted_credit_score, get_or_create_credit_signal
 from loan.trust_ladder import (
@@ -44,6 +48,9 @@ logger = logging.getLogger(__name__)
 APPLY_BLOCK_STATUSES = ("PENDING", "APPROVED", "DISBURSED")
 TERMINAL_LOAN_STATUSES = ("COMPLETED", "REJECTED")
 DEBT_LOAN_STATUSES = ("DISBURSED", "DEFAULTED")
+GATE_DEBT_STATUSES = ("APPROVED", *DEBT_LOAN_STATUSES)
+# The background sweep leaves APPROVED loans this young to their own request.
+SWEEP_DISBURSE_GRACE_SECONDS = 120
 
 PURCHASE_BLOCK_MESSAGE = (
     "You cannot buy units while you have a pending or incomplete loan. "
@@ -70,63 +77,103 @@ def incomplete_loans_queryset(user):
     return LoanApplication.objects.filter(user=user).exclude(status__in=TERMINAL_LOAN_STATUSES)
 
 
+def _retry_disbursements(loans) -> tuple[int, int]:
+    """Disburse loans stranded at APPROVED; returns (disbursed, failed)."""
+    disbursed = failed = 0
+    for loan in loans.select_related("user"):
+        try:
+            disburse_loan(loan.user, loan.id, channel="RECONCILE")
+            disbursed += 1
+        except Exception:
+            logger.exception("Retry auto-disbursement failed for loan %s", loan.loan_id)
+            failed += 1
+    return disbursed, failed
+
+
+def _complete_paid_loans(loans) -> int:
+    completed = 0
+    for loan in loans.filter(status__in=DEBT_LOAN_STATUSES, balance__lte=0):
+        loan.status = "COMPLETED"
+        loan.save(update_fields=["status", "updated_at"])
+        completed += 1
+    return completed
+
+
 def reconcile_user_loan_statuses(user) -> int:
     """
     Persist the derived terminal state for loans that were fully paid but still
     carry an old active status, and retry disbursement for loans stranded at
-    APPROVED (e.g. a prior auto-disbursement attempt failed). Runs on every
-    loan list/stats fetch so approved credit never stays stuck waiting on a
-    customer action - there isn't one.
+    APPROVED (e.g. a prior auto-disbursement attempt failed). Runs on loan
+    list/stats fetches; `sweep_loan_states` does the same for everyone in the
+    background, so purchase checks never have to.
     """
-    updated = 0
-
-    for loan in LoanApplication.objects.filter(user=user, status="APPROVED"):
-        try:
-            disburse_loan(user, loan.id, channel="RECONCILE")
-            updated += 1
-        except Exception:
-            logger.exception("Retry auto-disbursement failed for loan %s", loan.loan_id)
-
-    loans = LoanApplication.objects.filter(
-        user=user,
-        status__in=DEBT_LOAN_STATUSES,
-    ).prefetch_related("repayments")
+    loans = LoanApplication.objects.filter(user=user)
+    disbursed, _failed = _retry_disbursements(loans.filter(status="APPROVED"))
+    return disbursed + _complete_paid_loans(loans)
 
-    for loan in loans:
-        if float(loan.outstanding_balance) <= 0:
-            loan.status = "COMPLETED"
-            loan.save(update_fields=["status", "updated_at"])
-            updated += 1
 
-    return updated
+def sweep_loan_states(now=None, disburse_grace_seconds: int = SWEEP_DISBURSE_GRACE_SECONDS) -> dict:
+    """
+    Background repair pass (beat task `loan.tasks.sweep_loan_states`): retry
+    disbursement of APPROVED loans older than the grace period (younger ones
+    are still being disbursed by their own request) and mark fully paid loans
+    COMPLETED.
+    """
+    now = now or timezone.now()
+    stranded = LoanApplication.objects.filter(
+        status="APPROVED", created_at__lt=now - timedelta(seconds=disburse_grace_seconds)
+    )
+    disbursed, failed = _retry_disbursements(stranded)
+    completed = _complete_paid_loans(LoanApplication.objects.all())
+    if disbursed or failed or completed:
+        logger.info("Loan sweep: disbursed=%s failed=%s completed=%s", disbursed, failed, completed)
+    return {"disbursed": disbursed, "disburse_failed": failed, "completed": completed}
 
 
 def get_blocking_loan_state(user) -> dict:
     """
     Single source of truth for whether loans should block unit purchases.
     Pending applications block because they are unresolved; paid loans do not.
+    Read-only: one aggregate over the user's loans and their balance columns.
+    Approved loans count with the debt they are about to become.
     """
-    reconcile_user_loan_statuses(user)
-
-    loans = LoanApplication.objects.filter(user=user)
-    pending_applications = loans.filter(status="PENDING").count()
-    debt_loans = []
-    outstanding_balance = Decimal("0")
-
-    for loan in loans.filter(status__in=DEBT_LOAN_STATUSES).prefetch_related("repayments"):
-        balance = Decimal(str(loan.outstanding_balance))
-        if balance > 0:
-            debt_loans.append(loan)
-            outstanding_balance += balance
+    state = LoanApplication.objects.filter(user=user).aggregate(
+        pending_applications=Count("pk", filter=Q(status="PENDING")),
+        active_loans=Count("pk", filter=Q(status__in=GATE_DEBT_STATUSES, balance__gt=0)),
+        outstanding_balance=Sum("balance", filter=Q(status__in=GATE_DEBT_STATUSES, balance__gt=0)),
+    )
+    pending_applications = state["pending_applications"]
+    outstanding_balance = state["outstanding_balance"] or Decimal("0")
 
     return {
         "pending_applications": pending_applications,
-        "active_loans": len(debt_loans),
+        "active_loans": state["active_loans"],
         "outstanding_balance": outstanding_balance,
         "has_blocking_loan": pending_applications > 0 or outstanding_balance > 0,
     }
 
 
+def _loan_gate_key(user_id) -> str:
+    return f"loan:gate:{user_id}"
+
+
+def invalidate_loan_gate(user_id) -> None:
+    """Drop the cached purchase gate now and again once the current transaction commits."""
+    key = _loan_gate_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def loan_gate_blocked(user) -> bool:
+    """Cached `has_blocking_loan`; invalidated by every loan write (`loan.signals`)."""
+    key = _loan_gate_key(user.pk)
+    blocked = cache.get(key)
+    if blocked is None:
+        blocked = get_blocking_loan_state(user)["has_blocking_loan"]
+        cache.set(key, blocked, getattr(settings, "LOAN_GATE_CACHE_SECONDS", 300))
+    return blocked
+
+
 def user_can_apply_for_loan(user) -> tuple[bool, str]:
     reconcile_user_loan_statuses(user)
     if LoanApplication.objects.filter(user=user, status__in=APPLY_BLOCK_STATUSES).exists():
@@ -135,8 +182,7 @@ def user_can_apply_for_loan(user) -> tuple[bool, str]:
 
 
 def user_can_purchase_units(user) -> tuple[bool, str]:
-    state = get_blocking_loan_state(user)
-    if state["has_blocking_loan"]:
+    if loan_gate_blocked(user):
         return False, PURCHASE_BLOCK_MESSAGE
     return True, ""
 
@@ -153,9 +199,20 @@ def get_loan_eligibility(user) -> dict:
 
 
 def resolve_user_loan_access(user) -> dict:
+    """
+    Unified loan access, read from the user's `CreditProfileSnapshot`
+    (recomputed first when loan or profile events have made it stale).
+    """
+    from loan.credit_profile import get_credit_profile
+
+    return get_credit_profile(user)
+
+
+def compute_user_loan_access(user) -> dict:
     """
     Unified loan access: starter 30k for everyone in good standing; trust ladder
-    raises cap/score after on-time repayments.
+    raises cap/score after on-time repayments. Computed from scratch; readers go
+    through `resolve_user_loan_access`.
     """
     credit_signal = get_or_create_credit_signal(user)
     profile_score = max(0, min(calculate_weighted_credit_score(credit_signal), 100))
@@ -210,7 +267,7 @@ def get_user_loan_stats(user) -> dict:
     )
 
     total_repayments = float(
-        LoanRepayment.objects.filter(loan__user=user)
+        LoanRepayment.objects.filter(loan__user=user, payment_status="SUCCESS")
         .aggregate(total=Sum("amount_paid"))["total"]
         or 0
     )
@@ -236,28 +293,23 @@ def get_user_loan_stats(user) -> dict:
 
 def get_disbursed_loan_balances(user):
     """Mirrors ``BuyUnitsView._get_active_loan_balances``."""
-    reconcile_user_loan_statuses(user)
     loans_with_balance = []
     total_outstanding = Decimal("0")
-    for loan in LoanApplication.objects.filter(user=user, status="DISBURSED").order_by(
+    for loan in LoanApplication.objects.filter(user=user, status__in=DEBT_LOAN_STATUSES, balance__gt=0).order_by(
         "created_at"
     ):
-        balance = Decimal(str(loan.outstanding_balance))
-        if balance > 0:
-            loans_with_balance.append((loan, balance))
-            total_outstanding += balance
+        loans_with_balance.append((loan, loan.balance))
+        total_outstanding += loan.balance
     return loans_with_balance, total_outstanding
 
 
 def get_repayable_loan(user):
-    """Most recent disbursed loan with an outstanding balance."""
-    reconcile_user_loan_statuses(user)
-    for loan in LoanApplication.objects.filter(user=user, status="DISBURSED").order_by(
-        "-created_at"
-    ):
-        if float(loan.outstanding_balance) > 0:
-            return loan
-    return None
+    """Most recent disbursed (or defaulted) loan with an outstanding balance."""
+    return (
+        LoanApplication.objects.filter(user=user, status__in=DEBT_LOAN_STATUSES, balance__gt=0)
+        .order_by("-created_at")
+        .first()
+    )
 
 
 def serialize_repayable_loan(loan: LoanApplication | None) -> dict | None:
@@ -540,11 +592,18 @@ def repay_loan(
     payment_method: str = "CASH",
     paid_by_user=None,
     is_anonymous: bool = False,
+    pending_repayment: LoanRepayment | None = None,
+    momo_transaction_id: str | None = None,
 ) -> dict:
-    """Same rules as ``LoanRepaymentView.post`` (web repayment)."""
+    """
+    Same rules as ``LoanRepaymentView.post`` (web repayment).
+
+    ``pending_repayment`` is a PENDING MoMo row confirmed by the payment
+    reconciler; it is marked SUCCESS in place instead of creating a new row.
+    """
     loan = _resolve_loan_for_repay(user, loan_id)
 
-    if loan.status != "DISBURSED":
+    if loan.status not in DEBT_LOAN_STATUSES:
         raise LoanOperationError("Loan is not disbursed or already completed")
 
     try:
@@ -555,6 +614,8 @@ def repay_loan(
     if amount <= 0:
         raise LoanOperationError("Invalid amount")
 
+    # Bring the penalty up to date before validating against the balance.
+    loan = refresh_loan_balance(loan.pk) or loan
     current_balance = loan.outstanding_balance
     if amount > current_balance:
         raise LoanOperationError(
@@ -567,18 +628,31 @@ def repay_loan(
         units_equivalent = round(amount / 500, 2)
 
     with transaction.atomic():
-        payment_ref = generate_random_string(12)
-        LoanRepayment.objects.create(
-            loan=loan,
-            amount_paid=amount,
-            units_paid=units_equivalent,
-            payment_reference=payment_ref,
-            is_on_time=_payment_on_time(loan),
-            payment_method=payment_method,
-            payment_status="SUCCESS",
-            paid_by=paid_by_user,
-            is_anonymous=is_anonymous,
-        )
+        if pending_repayment is not None:
+            repayment = LoanRepayment.objects.select_for_update().get(pk=pending_repayment.pk)
+            if repayment.payment_status != "PENDING":
+                raise LoanOperationError("Repayment has already been processed.")
+            payment_ref = repayment.payment_reference
+            repayment.units_paid = units_equivalent
+            repayment.is_on_time = _payment_on_time(loan)
+            repayment.payment_status = "SUCCESS"
+            repayment.momo_transaction_id = momo_transaction_id or repayment.momo_transaction_id
+            repayment.save(update_fields=[
+                "units_paid", "is_on_time", "payment_status", "momo_transaction_id", "updated_at",
+            ])
+        else:
+            payment_ref = generate_random_string(12)
+            LoanRepayment.objects.create(
+                loan=loan,
+                amount_paid=amount,
+                units_paid=units_equivalent,
+                payment_reference=payment_ref,
+                is_on_time=_payment_on_time(loan),
+                payment_method=payment_method,
+                payment_status="SUCCESS",
+                paid_by=paid_by_user,
+                is_anonymous=is_anonymous,
+            )
 
         meter = Meter.objects.filter(user=user, is_deleted=False).first()
         if not meter:
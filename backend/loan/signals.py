@@ -1,7 +1,17 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from loan.models import CreditScoreFactors
+from loan.models import (
+    CreditScoreFactors,
+    ElectricityTariff,
+    LoanApplication,
+    LoanRepayment,
+    LoanTier,
+    TariffBlock,
+    UserCreditSignal,
+)
+from loan.scoring import LOAN_PROFILE_FIELDS, PROFILE_SIGNAL_FIELDS
+from loan.tariff_cache import invalidate_tariff_cache
 
 User = get_user_model()
 
@@ -11,4 +21,77 @@ def create_credit_factors(sender, instance, created, **kwargs):
     if created:
         CreditScoreFactors.objects.get_or_create(user=instance)
 
-        
\ No newline at end of file
+
+@receiver(post_save, sender=ElectricityTariff)
+@receiver(post_delete, sender=ElectricityTariff)
+@receiver(post_save, sender=TariffBlock)
+@receiver(post_delete, sender=TariffBlock)
+def invalidate_tariff_snapshots(sender, **kwargs):
+    """Any tariff or block write makes every worker reload its billing snapshot."""
+    invalidate_tariff_cache()
+
+
+@receiver(post_save, sender=LoanRepayment)
+@receiver(post_delete, sender=LoanRepayment)
+def refresh_loan_balance_on_repayment(sender, instance, raw=False, **kwargs):
+    """Keep the loan's amount_paid_total/balance columns in the repayment's transaction."""
+    if raw:
+        return
+    from loan.ledger import refresh_loan_balance
+
+    refresh_loan_balance(instance.loan_id)
+
+
+@receiver(post_save, sender=LoanApplication)
+@receiver(post_delete, sender=LoanApplication)
+def invalidate_loan_gate_on_loan_write(sender, instance, **kwargs):
+    """Status and balance writes (repayments re-save the loan) reset the cached purchase gate."""
+    from loan.services import invalidate_loan_gate
+
+    invalidate_loan_gate(instance.user_id)
+
+
+@receiver(post_save, sender=LoanApplication)
+@receiver(post_delete, sender=LoanApplication)
+def mark_credit_profile_on_loan_write(sender, instance, raw=False, **kwargs):
+    """Applications, disbursements, repayments (which re-save the loan) and status changes move the trust ladder."""
+    if raw:
+        return
+    from loan.credit_profile import mark_credit_profiles_stale
+
+    mark_credit_profiles_stale([instance.user_id], reason=f"loan {instance.status.lower()}")
+
+
+@receiver(post_save, sender=UserCreditSignal)
+def mark_credit_profile_on_signal_write(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from loan.credit_profile import mark_credit_profiles_stale
+
+    mark_credit_profiles_stale([instance.user_id], reason="credit signal")
+
+
+@receiver(post_save, sender=LoanTier)
+@receiver(post_delete, sender=LoanTier)
+def mark_credit_profiles_on_tier_change(sender, raw=False, **kwargs):
+    """Tier thresholds, caps and rates feed every snapshot; readers recompute lazily."""
+    if raw:
+        return
+    from loan.credit_profile import mark_all_credit_profiles_stale
+
+    mark_all_credit_profiles_stale()
+
+
+_SCORING_PROFILE_FIELDS = frozenset(LOAN_PROFILE_FIELDS) | frozenset(PROFILE_SIGNAL_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def mark_credit_profile_on_profile_edit(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Profile answers feed the credit signal; saves limited to other fields (e.g. last_login) are ignored."""
+    if raw or created:
+        return
+    if update_fields is not None and not _SCORING_PROFILE_FIELDS.intersection(update_fields):
+        return
+    from loan.credit_profile import mark_credit_profiles_stale
+
+    mark_credit_profiles_stale([instance.pk], reason="profile edit")
@@ -0,0 +1,206 @@
+"""
+Versioned in-process tariff snapshots for the billing hot path.
+
+Tariffs change a few times a year, but every bill needs the active schedule and
+its blocks. Each worker keeps an immutable copy of all tariffs (blocks pre-sorted,
+rates as Decimal) and only reloads it when the shared version token in the cache
+changes. Writes to ElectricityTariff/TariffBlock bump the token via signals and
+the activation helpers in `loan.tariff_utils`.
+
+Point CACHE_REDIS_URL at Redis in production so the token is shared across
+workers; with the default per-process cache, snapshots also expire after
+TARIFF_SNAPSHOT_MAX_AGE_SECONDS so stale workers converge.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TARIFF_VERSION_CACHE_KEY = "billing:tariff_version"
+
+
+@dataclass(frozen=True)
+class TariffBlockSnapshot:
+    block_name: str
+    min_units: int
+    max_units: Optional[int]
+    rate_per_unit: Decimal
+    non_lifeline_rate: Optional[Decimal]
+    is_lifeline_block: bool
+    block_order: int
+
+
+@dataclass(frozen=True)
+class TariffSnapshot:
+    """Read-only view of an ElectricityTariff; `blocks` is a tuple sorted by block_order."""
+    pk: int
+    tariff_code: str
+    tariff_name: str
+    tariff_type: str
+    service_charge: Decimal
+    is_active: bool
+    effective_date: Optional[object]
+    effective_from: Optional[date]
+    effective_to: Optional[date]
+    blocks: tuple
+
+    @property
+    def id(self) -> int:
+        return self.pk
+
+    def covers(self, on_date: date) -> bool:
+        if self.effective_from is None or self.effective_from > on_date:
+            return False
+        return self.effective_to is None or self.effective_to >= on_date
+
+    @classmethod
+    def from_model(cls, tariff, blocks=None) -> "TariffSnapshot":
+        if blocks is None:
+            blocks = tariff.blocks.order_by("block_order")
+        return cls(
+            pk=tariff.pk,
+            tariff_code=tariff.tariff_code,
+            tariff_name=tariff.tariff_name,
+            tariff_type=tariff.tariff_type,
+            service_charge=Decimal(str(tariff.service_charge or 0)),
+            is_active=tariff.is_active,
+            effective_date=tariff.effective_date,
+            effective_from=tariff.effective_from,
+            effective_to=tariff.effective_to,
+            blocks=tuple(
+                TariffBlockSnapshot(
+                    block_name=block.block_name,
+                    min_units=block.min_units,
+                    max_units=block.max_units,
+                    rate_per_unit=Decimal(str(block.rate_per_unit)),
+                    non_lifeline_rate=(
+                        Decimal(str(block.non_lifeline_rate))
+                        if block.non_lifeline_rate is not None
+                        else None
+                    ),
+                    is_lifeline_block=block.is_lifeline_block,
+                    block_order=block.block_order,
+                )
+                for block in sorted(blocks, key=lambda b: b.block_order)
+            ),
+        )
+
+
+class _TariffSnapshotCache:
+    """Process-local holder; guarded by a lock so threads share one reload."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._loaded_at = 0.0
+        self._by_pk: dict[int, TariffSnapshot] = {}
+        self._active_by_date: dict[date, Optional[TariffSnapshot]] = {}
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._by_pk = {}
+            self._active_by_date = {}
+
+    def _is_fresh(self, version) -> bool:
+        max_age = getattr(settings, "TARIFF_SNAPSHOT_MAX_AGE_SECONDS", 300)
+        return (
+            self._version is not None
+            and self._version == version
+            and time.monotonic() - self._loaded_at < max_age
+        )
+
+    def _ensure_loaded(self):
+        version = current_tariff_version()
+        if self._is_fresh(version):
+            return
+        with self._lock:
+            if self._is_fresh(version):
+                return
+            from loan.models import ElectricityTariff
+
+            tariffs = ElectricityTariff.objects.prefetch_related("blocks")
+            self._by_pk = {
+                tariff.pk: TariffSnapshot.from_model(tariff, blocks=tariff.blocks.all())
+                for tariff in tariffs
+            }
+            self._active_by_date = {}
+            self._version = version
+            self._loaded_at = time.monotonic()
+            logger.debug("Tariff snapshots reloaded (version=%s, tariffs=%d)", version, len(self._by_pk))
+
+    def get(self, pk) -> Optional[TariffSnapshot]:
+        self._ensure_loaded()
+        return self._by_pk.get(pk)
+
+    def active_for(self, on_date: date) -> Optional[TariffSnapshot]:
+        self._ensure_loaded()
+        if on_date in self._active_by_date:
+            return self._active_by_date[on_date]
+
+        # Mirrors utils.billing.get_active_domestic_tariff, in memory.
+        active = [s for s in self._by_pk.values() if s.is_active and s.tariff_type == "DOMESTIC"]
+        versioned = [s for s in active if s.covers(on_date)]
+        if versioned:
+            snapshot = max(versioned, key=lambda s: s.effective_from)
+        elif active:
+            snapshot = max(active, key=lambda s: s.effective_date)
+        else:
+            snapshot = None
+
+        self._active_by_date[on_date] = snapshot
+        return snapshot
+
+
+_snapshots = _TariffSnapshotCache()
+
+
+def current_tariff_version():
+    """Shared version token; initialised on first read so every worker agrees."""
+    try:
+        version = cache.get(TARIFF_VERSION_CACHE_KEY)
+        if version is None:
+            cache.add(TARIFF_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+            version = cache.get(TARIFF_VERSION_CACHE_KEY)
+        return version
+    except Exception as exc:
+        logger.warning("Tariff version lookup failed, forcing reload: %s", exc)
+        return uuid.uuid4().hex
+
+
+def get_tariff_snapshot(on_date: Optional[date] = None) -> Optional[TariffSnapshot]:
+    """Active DOMESTIC tariff for `on_date` (today if None), served from the snapshot cache."""
+    return _snapshots.active_for(on_date or timezone.localdate())
+
+
+def snapshot_for_tariff(tariff) -> Optional[TariffSnapshot]:
+    """Snapshot for an explicit tariff (model or snapshot); falls back to a direct build."""
+    if tariff is None or isinstance(tariff, TariffSnapshot):
+        return tariff
+    return _snapshots.get(tariff.pk) or TariffSnapshot.from_model(tariff)
+
+
+def invalidate_tariff_cache() -> None:
+    """Bump the shared version once the current transaction commits."""
+    def _bump():
+        try:
+            cache.set(TARIFF_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        except Exception as exc:
+            logger.warning("Could not bump tariff version: %s", exc)
+        _snapshots.clear()
+
+    transaction.on_commit(_bump)
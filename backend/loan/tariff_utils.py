@@ -5,6 +5,7 @@ from __future__ import annotations
 from django.db import transaction
 
 from loan.models import ElectricityTariff, TariffBlock
+from loan.tariff_cache import invalidate_tariff_cache
 
 
 class TariffActivationError(Exception):
@@ -15,6 +16,8 @@ class TariffActivationError(Exception):
 def activate_tariff(tariff: ElectricityTariff) -> ElectricityTariff:
     """Set `tariff` as the sole active schedule; deactivate all others."""
     ElectricityTariff.objects.exclude(pk=tariff.pk).update(is_active=False)
+    # Queryset.update() skips post_save, so bump the billing snapshot version here.
+    invalidate_tariff_cache()
     if not tariff.is_active:
         tariff.is_active = True
         tariff.save(update_fields=["is_active"])
@@ -25,6 +28,7 @@ def ensure_single_active_on_save(tariff: ElectricityTariff, *, activating: bool)
     """When saving with is_active=True, deactivate every other tariff."""
     if activating and tariff.is_active:
         ElectricityTariff.objects.exclude(pk=tariff.pk).update(is_active=False)
+        invalidate_tariff_cache()
 
 
 def validate_can_deactivate(tariff: ElectricityTariff) -> None:
@@ -114,5 +118,5 @@ def seed_era_domestic_tariff() -> tuple[ElectricityTariff, bool]:
         )
 
     ElectricityTariff.objects.filter(tariff_code="CODE10.1").update(is_active=False)
-    activate_tariff(tariff)
+    activate_tariff(tariff)  # also invalidates the billing snapshots
     return tariff, created
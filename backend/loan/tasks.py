@@ -0,0 +1,33 @@
+from celery import shared_task
+
+
+@shared_task(name="loan.tasks.run_loan_lifecycle", ignore_result=True)
+def run_loan_lifecycle():
+    """Nightly task: persist due dates, overdue/default transitions and late penalties."""
+    from loan.lifecycle import run_loan_lifecycle as run
+
+    return run()
+
+
+@shared_task(name="loan.tasks.sweep_loan_states", ignore_result=True, expires=60)
+def sweep_loan_states():
+    """Periodic task: retry stranded disbursements and close fully paid loans."""
+    from loan.services import sweep_loan_states as sweep
+
+    return sweep()
+
+
+@shared_task(name="loan.tasks.refresh_credit_profile", ignore_result=True)
+def refresh_credit_profile(user_id, reason=""):
+    """Debounced task: recompute a user's credit profile snapshot after loan or profile events."""
+    from loan.credit_profile import refresh_credit_profile as refresh
+
+    return refresh(user_id, reason)
+
+
+@shared_task(name="loan.tasks.rescore_credit_factors", ignore_result=True)
+def rescore_credit_factors(dry_run=False):
+    """On-demand task: re-score every user's CreditScoreFactors after a weight or tier change (factor score only)."""
+    from loan.rescoring import rescore_credit_factors as rescore
+
+    return rescore(dry_run=dry_run)
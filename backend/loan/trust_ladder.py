@@ -9,9 +9,10 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 
+from django.db.models import Count, Exists, OuterRef, Q
 from django.utils import timezone
 
-from loan.models import LoanApplication
+from loan.models import LoanApplication, LoanRepayment
 
 # Everyone starts here (even with no profile / zero history).
 STARTER_MAX_LOAN = 30_000
@@ -38,25 +39,24 @@ class TrustSnapshot:
     trust_level: str
 
 
-def _loan_completed_on_time(loan: LoanApplication) -> bool:
-    if loan.status != "COMPLETED":
-        return False
-    return not loan.repayments.filter(is_on_time=False).exists()
-
-
 def compute_repayment_trust(user) -> TrustSnapshot:
-    loans = LoanApplication.objects.filter(user=user).prefetch_related("repayments")
-    completed = [loan for loan in loans if loan.status == "COMPLETED"]
-    defaulted_count = loans.filter(status="DEFAULTED").count()
-
-    on_time_completions = sum(1 for loan in completed if _loan_completed_on_time(loan))
-    late_completions = len(completed) - on_time_completions
-
-    active_overdue = False
-    for loan in loans.filter(status="DISBURSED"):
-        if loan.due_date and timezone.now() > loan.due_date:
-            active_overdue = True
-            break
+    # One aggregate: a completed loan is late if any of its repayments was.
+    late_repayments = LoanRepayment.objects.filter(loan=OuterRef("pk"), is_on_time=False)
+    counts = (
+        LoanApplication.objects.filter(user=user)
+        .annotate(has_late=Exists(late_repayments))
+        .aggregate(
+            completed=Count("pk", filter=Q(status="COMPLETED")),
+            late=Count("pk", filter=Q(status="COMPLETED", has_late=True)),
+            defaulted=Count("pk", filter=Q(status="DEFAULTED")),
+            overdue=Count("pk", filter=Q(status="DISBURSED", due_at__lt=timezone.now())),
+        )
+    )
+    completed_count = counts["completed"]
+    defaulted_count = counts["defaulted"]
+    late_completions = counts["late"]
+    on_time_completions = completed_count - late_completions
+    active_overdue = counts["overdue"] > 0
 
     score_delta = (
         on_time_completions * TRUST_SCORE_BONUS_ON_TIME
@@ -77,14 +77,14 @@ def compute_repayment_trust(user) -> TrustSnapshot:
         trust_cap = min(trust_cap, OVERDUE_CAP_CEILING)
 
     trust_level = _trust_level(
-        completed_count=len(completed),
+        completed_count=completed_count,
         on_time=on_time_completions,
         defaulted=defaulted_count,
         active_overdue=active_overdue,
     )
 
     return TrustSnapshot(
-        completed_loans=len(completed),
+        completed_loans=completed_count,
         on_time_completions=on_time_completions,
         late_completions=late_completions,
         defaulted_count=defaulted_count,
@@ -54,6 +54,7 @@ urlpatterns = [
     # AMI: apply wallet kWh to networked meter (no token)
     path('apply-wallet-units/', ApplyWalletToMeterView.as_view(), name='apply-wallet-units'),
     path('power-usage/', views.power_usage, name='power-usage'),
+    path('power-usage/refresh/', views.power_usage_refresh, name='power-usage-refresh'),
     # Estimate kWh yield for a given UGX amount (no side effects)
     path('estimate-units/', EstimateUnitsView.as_view(), name='estimate-units'),
 ]
\ No newline at end of file
@@ -37,15 +37,12 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-import time
-import threading
 from transactions.models import Transaction, UnitTransaction, TransactionType
+from transactions.momo_reconciliation import purchase_status
 from transactions.services import record_transaction_log
 from accounts.models import Wallet as AccountWallet
 from wallet.models import Wallet as MoneyWallet
 from wallet.models import Wallet as UnitWallet
-import time
-import threading
 from django.db import transaction as db_transaction
 from loan.models import ElectricityTariff, LoanApplication, LoanRepayment
 from utils.ami_gateway import apply_units_to_meter
@@ -339,6 +336,31 @@ def power_usage(request):
     return Response({"success": True, "data": report}, status=status_code)
 
 
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def power_usage_refresh(request):
+    """
+    POST /api/v1/meter/power-usage/refresh/
+
+    Queue a background sync for the Energy Usage report instead of blocking the
+    chart request. Body: meter_no, period=week|month|year, year, month.
+    """
+    from meter.usage_service import request_usage_refresh
+
+    year_raw = str(request.data.get("year") or "")
+    month_raw = str(request.data.get("month") or "")
+    result = request_usage_refresh(
+        request.user,
+        meter_no=request.data.get("meter_no"),
+        period=request.data.get("period", "week"),
+        year=int(year_raw) if year_raw.isdigit() else None,
+        month=int(month_raw) if month_raw.isdigit() else None,
+    )
+    if not result.get("eligible", True):
+        return Response({"success": False, "data": result}, status=status.HTTP_200_OK)
+    return Response({"success": True, "data": result}, status=status.HTTP_202_ACCEPTED)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def check_user_meter(request):
@@ -1579,8 +1601,8 @@ class BuyUnitsView(GenericAPIView):
     permission_classes = (IsAuthenticated,)
 
     def _get_active_tariff(self):
-        from utils.billing import get_active_domestic_tariff
-        return get_active_domestic_tariff()
+        from loan.tariff_cache import get_tariff_snapshot
+        return get_tariff_snapshot()
 
 
     def _create_purchase_and_update_balances(self, user, meter, units_purchased, reference_id):
@@ -1674,8 +1696,8 @@ class BuyUnitsView(GenericAPIView):
         if not tariff:
             return (amount / fallback_rate).quantize(Decimal("0.01")), None
 
-        blocks = tariff.blocks.all().order_by('block_order')
-        if not blocks.exists():
+        blocks = tariff.blocks
+        if not blocks:
             return (amount / fallback_rate).quantize(Decimal("0.01")), tariff
 
         remaining_amount = Decimal(str(amount))
@@ -1889,36 +1911,6 @@ class BuyUnitsView(GenericAPIView):
                         "tariff_applied": tariff.tariff_code if tariff else "DEFAULT_500",
                     }, status=status.HTTP_200_OK)
             
-            if settings.MTN_MOMO_CONFIG.get('ENVIRONMENT', 'sandbox') == 'sandbox':
-                # Generate external ID for tracking
-                external_id = str(uuid.uuid4())
-                
-                # Create pending transaction
-                try:
-                    transaction = Transaction.objects.create(
-                        wallet=account_wallet,
-                        amount=amount,
-                        phone_number=phone_number,
-                        status='PENDING',
-                        transaction_reference=external_id,
-                        message=f"Buy units - {amount} UGX"
-                    )
-                except Exception:
-                    return Response({
-                        "error": "Invalid phone number. Use full format e.g. +2567XXXXXXXX."
-                    }, status=status.HTTP_400_BAD_REQUEST)
-                
-                # Return pending response immediately
-                response_data = {
-                    "status": "PENDING",
-                    "message": "Simulating sandbox payment - Please wait...",
-                    "external_id": external_id,
-                    "transaction_id": transaction.id,
-                    "user_prompt": "Sandbox mode: Payment will auto-complete in 2 seconds",
-                    "estimated_units": float(estimated_units),
-                    "tariff_applied": tariff.tariff_code if tariff else "DEFAULT_500",
-                }
-                
             _, total_outstanding = self._get_active_loan_balances(user)
             estimated_buy_amount = max(Decimal("0"), amount - total_outstanding)
             estimated_units, tariff = self._calculate_units_from_tariff(estimated_buy_amount)
@@ -1955,13 +1947,8 @@ class BuyUnitsView(GenericAPIView):
                 response_data.update({
                     "message": "Simulating sandbox payment - Please wait...",
                     "external_id": momo_reference,
-                    "user_prompt": "Dev mode: payment will auto-complete in 2 seconds (no PIN required).",
+                    "user_prompt": "Dev mode: payment will auto-complete in a few seconds (no PIN required).",
                 })
-                threading.Thread(
-                    target=self._simulate_sandbox_payment,
-                    args=(user.id, str(amount), transaction.id, meter.id),
-                    daemon=True
-                ).start()
                 return Response(response_data, status=status.HTTP_200_OK)
 
             momo_service = MTNMoMoService()
@@ -1996,84 +1983,8 @@ class BuyUnitsView(GenericAPIView):
             return Response({
                 "error": "Failed to process buy units request"
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    
-    def _simulate_sandbox_payment(self, user_id, amount, transaction_id, meter_id):
-        """Simulate successful payment in dev mode after 2 seconds."""
-        logger.info(f"Sandbox: Starting payment simulation for user {user_id}")
-        time.sleep(2)
-        time.sleep(2)
-
-        try:
-            user = User.objects.get(id=user_id)
-        
-            meter = Meter.objects.get(id=meter_id)
-
-            with db_transaction.atomic():
-                amount_decimal = Decimal(str(amount))
-                units_purchased, tariff = self._calculate_units_from_tariff(amount_decimal)
-
-                # Update transaction status
-                transaction = Transaction.objects.get(id=transaction_id)
-                transaction.status = 'COMPLETED'
-                transaction.message = (
-                    f"Buy units - {amount_decimal} UGX | Token issued for {units_purchased} units | "
-                    f"Tariff: {tariff.tariff_code if tariff else 'DEFAULT_500'}"
-                )
-                transaction.save()
-
-                if units_purchased > 0:
-                    token, new_unit_balance = self._create_purchase_and_update_balances(
-                        user, meter, units_purchased, transaction.transaction_reference
-                    )
-                    
-                    self._record_purchase_history(
-                        user,
-                        amount_decimal,
-                        units_purchased,
-                        token,
-                        meter,
-                        "PHONE",
-                        transaction.transaction_reference,
-                    )
 
-            logger.info(
-                f"Sandbox: Payment complete for user {user_id}. "
-                f"token_units={units_purchased}"
-            )
-
-        except Meter.DoesNotExist:
-            logger.error(f"No meter found with ID {meter_id} for user {user_id}")
-            from meter.buy_units_payment import complete_buy_units_payment
 
-            user = User.objects.get(id=user_id)
-            ok, units_purchased, err = complete_buy_units_payment(
-                user, Decimal(str(amount)), transaction_id, meter_id
-            )
-            if ok:
-                logger.info(
-                    f"Sandbox: Payment complete for user {user_id}. units_to_wallet={units_purchased}"
-                )
-            else:
-                logger.error(f"Sandbox payment simulation error: {err}")
-        except User.DoesNotExist:
-            logger.error(f"User {user_id} not found during sandbox simulation")
-            try:
-                transaction = Transaction.objects.get(id=transaction_id)
-                transaction.status = 'FAILED'
-                transaction.save()
-            except Exception:
-                pass
-        except Exception as e:
-            logger.error(f"Sandbox payment simulation error: {str(e)}")
-            try:
-                transaction = Transaction.objects.get(id=transaction_id)
-                transaction.status = 'FAILED'
-                transaction.save()
-            except Exception:
-                pass
-    
-    
-    
 class CheckPaymentStatusView(GenericAPIView):
     permission_classes = (IsAuthenticated,)
     
@@ -2090,7 +2001,9 @@ class CheckPaymentStatusView(GenericAPIView):
                 id=transaction_id,
                 wallet__user=request.user
             )
-            
+            # Settled by the MoMo reconciler; pending rows are only nudged, never polled here.
+            purchase_status(transaction)
+
             if transaction.status == 'COMPLETED':
                 purchase_log = TransactionLog.objects.filter(
                     user=request.user,
@@ -2131,66 +2044,6 @@ class CheckPaymentStatusView(GenericAPIView):
                 }, status=status.HTTP_400_BAD_REQUEST)
 
             else:
-                from mtn_momo.config import should_simulate_payments
-                from meter.buy_units_payment import complete_buy_units_payment
-
-                if not should_simulate_payments() and transaction.transaction_reference:
-                    momo_service = MTNMoMoService()
-                    momo_status = momo_service.get_payment_status(transaction.transaction_reference)
-
-                    if momo_status.get("status") == "SUCCESS":
-                        meter = Meter.objects.filter(user=request.user).order_by("create_date").first()
-                        if meter:
-                            complete_buy_units_payment(
-                                request.user,
-                                transaction.amount,
-                                transaction.id,
-                                meter.id,
-                            )
-                        transaction.refresh_from_db()
-                    elif momo_status.get("status") == "FAILED":
-                        # Only mark as definitively failed when MoMo itself says so,
-                        # not when we couldn't reach the API (UNKNOWN).
-                        transaction.status = "FAILED"
-                        transaction.message = momo_status.get("message", "Payment failed")
-                        transaction.save(update_fields=["status", "message"])
-                        return Response({
-                            "status": "FAILED",
-                            "message": momo_status.get("message", "Payment failed"),
-                        }, status=status.HTTP_400_BAD_REQUEST)
-                    # UNKNOWN means we couldn't reach MoMo — fall through so the
-                    # client keeps polling rather than seeing a false failure.
-
-                if transaction.status == 'COMPLETED':
-                    unit_tx = UnitTransaction.objects.filter(
-                        sender=request.user,
-                        receiver=request.user,
-                        direction="IN",
-                        status="COMPLETED",
-                        create_date__gte=transaction.create_date
-                    ).order_by('-create_date').first()
-
-                    units_purchased = float(unit_tx.units) if unit_tx else 0
-
-                    return Response({
-                        "status": "SUCCESS",
-                        "message": "Payment completed successfully",
-                        "units_purchased": units_purchased,
-                        "wallet_balance": float(
-                            UnitBalance.objects.filter(user=request.user)
-                            .values_list("balance", flat=True)
-                            .first()
-                            or 0
-                        ),
-                        "token": None,
-                        "transaction": {
-                            "id": transaction.id,
-                            "amount": float(transaction.amount),
-                            "units": units_purchased,
-                            "timestamp": transaction.create_date.isoformat()
-                        }
-                    }, status=status.HTTP_200_OK)
-
                 return Response({
                     "status": "PENDING",
                     "message": "Payment still processing. Approve the MoMo prompt on your phone if you have not yet.",
@@ -2408,26 +2261,27 @@ class EstimateUnitsView(APIView):
 
         from utils.billing import (
             calculate_units_from_payment,
-            get_active_domestic_tariff,
             get_minimum_payment_for_units,
             get_monthly_tier_context,
             get_outstanding_deductions,
-            get_monthly_units_consumed,
+            load_billing_context,
         )
 
         deductions = get_outstanding_deductions(request.user)
         net_amount = max(Decimal("0"), amount - deductions)
-        tariff = get_active_domestic_tariff()
+        # One context = one round of tariff/consumption queries for the whole estimate.
+        billing_ctx = load_billing_context(request.user)
+        tariff = billing_ctx.tariff
         units, breakdown = calculate_units_from_payment(
             amount,
             request.user,
-            tariff=tariff,
             outstanding_bills=deductions,
             apply_deductions=False,
+            context=billing_ctx,
         )
-        minimum_payment = get_minimum_payment_for_units(request.user, tariff)
-        service_included = get_monthly_units_consumed(request.user) <= 0
-        tier_ctx = get_monthly_tier_context(request.user)
+        minimum_payment = get_minimum_payment_for_units(request.user, context=billing_ctx)
+        service_included = billing_ctx.already_bought <= 0
+        tier_ctx = get_monthly_tier_context(request.user, context=billing_ctx)
 
         return Response({
             "estimated_units": float(units),
@@ -10,24 +10,24 @@ from meter.models import Transaction as MeterLedgerTransaction
 from meter.models import generate_random_string
 from transactions.models import Transaction, TransactionType, UnitTransaction
 from transactions.services import record_transaction_log
-from utils.billing import calculate_units_from_payment, get_active_domestic_tariff
+from utils.billing import calculate_units_from_payment, load_billing_context
 from wallet.models import UnitBalance
 
 logger = logging.getLogger(__name__)
 
 
-def _calculate_units_from_tariff(amount, user):
-  tariff = get_active_domestic_tariff()
+def calculate_units_from_tariff(amount, user):
   if user is None:
     fallback_rate = Decimal("756.2")
     return (Decimal(str(amount)) / fallback_rate).quantize(Decimal("0.01")), None
+  billing_ctx = load_billing_context(user)
   units, _breakdown = calculate_units_from_payment(
     Decimal(str(amount)),
     user,
-    tariff=tariff,
     apply_deductions=False,
+    context=billing_ctx,
   )
-  return units, tariff
+  return units, billing_ctx.tariff
 
 
 def _apply_auto_loan_repayment(user, payment_amount, channel="WEB_PORTAL"):
@@ -101,13 +101,15 @@ def complete_buy_units_payment(user, amount_decimal, transaction_id, meter_id, c
           create_date__gte=transaction.create_date,
         ).order_by("-create_date").first()
         return True, Decimal(str(unit_tx.units if unit_tx else 0)), None
+      if transaction.status != "PENDING":
+        return False, Decimal("0"), f"Transaction is {transaction.status}"
 
       meter = Meter.objects.get(id=meter_id, user=user)
       payment_channel = channel or _detect_channel(transaction)
       amount_for_units, repaid_to_loans = _apply_auto_loan_repayment(
         user, amount_decimal, channel=payment_channel
       )
-      units_purchased, tariff = _calculate_units_from_tariff(amount_for_units, user)
+      units_purchased, tariff = calculate_units_from_tariff(amount_for_units, user)
 
       unit_balance, _ = UnitBalance.objects.get_or_create(user=user)
       unit_balance.add_units(
@@ -7,14 +7,24 @@ creates an in-app ``MeterNotification`` and queues an email (if the user has one
 Alert rules (avoids spam on every poll tick):
   - Notify when balance crosses from above threshold to at or below threshold.
   - While still low, send a reminder only after the cooldown window (default 6 hours).
+
+Each poll tick reads ThingsBoard for up to AMI_LOW_UNITS_POLL_CONCURRENCY meters
+at once and stops waiting after AMI_LOW_UNITS_POLL_DEADLINE_SECONDS. The limit is
+per process: reads left running by an earlier tick keep their slot until they
+finish, so a slow ThingsBoard shrinks later ticks instead of piling up threads.
 """
 from __future__ import annotations
 
 import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import timedelta
 from decimal import Decimal
 
 from django.conf import settings
+from django.db.models import OuterRef, Subquery
 from django.utils import timezone
 
 from meter.models import Meter, MeterBalanceSnapshot, MeterNotification
@@ -22,6 +32,11 @@ from meter.services import query_latest_units_from_thingsboard, record_balance_s
 
 logger = logging.getLogger(__name__)
 
+_read_pool_lock = threading.Lock()
+_read_pool = None
+_read_slots = None
+_reads_in_flight: set = set()
+
 
 def low_units_threshold_kwh() -> Decimal:
     return Decimal(str(getattr(settings, "AMI_LOW_UNITS_THRESHOLD_KWH", 5)))
@@ -33,15 +48,23 @@ def low_units_cooldown() -> timedelta:
 
 
 def should_send_low_units_alert(
-    meter: Meter, current: Decimal, previous: Decimal | None
+    meter: Meter,
+    current: Decimal,
+    previous: Decimal | None,
+    on_cooldown: bool | None = None,
 ) -> bool:
-    """True when balance is low and we should create a notification (not on cooldown)."""
+    """
+    True when balance is low and we should create a notification (not on cooldown).
+    Batch callers pass `on_cooldown` from `recently_alerted_meter_ids` to skip the query.
+    """
     threshold = low_units_threshold_kwh()
     if current > threshold:
         return False
     if previous is None or previous > threshold:
         return True
-    return not _recent_low_notification(meter)
+    if on_cooldown is None:
+        on_cooldown = _recent_low_notification(meter)
+    return not on_cooldown
 
 
 def create_low_units_notification(
@@ -106,6 +129,63 @@ def _recent_low_notification(meter: Meter) -> bool:
     ).exists()
 
 
+def _evaluate_reading(meter: Meter, previous: Decimal | None, current: Decimal) -> dict:
+    """Threshold/alert step shared by the single-meter check and the batch poller."""
+    threshold = low_units_threshold_kwh()
+    result = {
+        "meter_no": meter.meter_no,
+        "units_kwh": float(current),
+        "threshold_kwh": float(threshold),
+        "low": current <= threshold,
+        "alert_sent": False,
+    }
+
+    if should_send_low_units_alert(meter, current, previous):
+        notification = create_low_units_notification(meter, current, source="poll")
+        result["alert_sent"] = notification is not None
+        if notification:
+            result["notification_id"] = notification.id
+
+    return result
+
+
+def recently_alerted_meter_ids(meter_ids) -> set:
+    """Meters with a low-units notification inside the cooldown window (one query)."""
+    meter_ids = set(meter_ids)
+    if not meter_ids:
+        return set()
+    return set(
+        MeterNotification.objects.filter(
+            meter_id__in=meter_ids,
+            notification_type=MeterNotification.TYPE_LOW_UNITS,
+            occurred_at__gte=timezone.now() - low_units_cooldown(),
+        ).values_list("meter_id", flat=True)
+    )
+
+
+def evaluate_low_units_batch(evaluations, *, source: str = "poll") -> int:
+    """
+    Apply the alert rules to many readings at once. `evaluations` is a list of
+    (meter, previous_kwh | None, current_kwh, occurred_at | None) in time order;
+    cooldown state is loaded in one query and tracked in memory.
+    Returns the number of notifications created.
+    """
+    threshold = low_units_threshold_kwh()
+    on_cooldown = recently_alerted_meter_ids(
+        meter.pk
+        for meter, previous, current, _ in evaluations
+        if current <= threshold and previous is not None and previous <= threshold
+    )
+    alerts = 0
+    for meter, previous, current, occurred_at in evaluations:
+        if not should_send_low_units_alert(meter, current, previous, on_cooldown=meter.pk in on_cooldown):
+            continue
+        if create_low_units_notification(meter, current, source=source, occurred_at=occurred_at):
+            alerts += 1
+            on_cooldown.add(meter.pk)
+    return alerts
+
+
 def check_meter_low_units(meter: Meter) -> dict:
     """
     Read ThingsBoard, snapshot balance, and raise alert if threshold logic matches.
@@ -136,49 +216,217 @@ def check_meter_low_units(meter: Meter) -> dict:
         current,
         source=data.get("source", "thingsboard"),
     )
+    return _evaluate_reading(meter, previous, current)
 
-    threshold = low_units_threshold_kwh()
-    result = {
-        "meter_no": meter.meter_no,
-        "units_kwh": float(current),
-        "threshold_kwh": float(threshold),
-        "low": current <= threshold,
-        "alert_sent": False,
-    }
 
-    if should_send_low_units_alert(meter, current, previous):
-        notification = create_low_units_notification(meter, current, source="poll")
-        result["alert_sent"] = notification is not None
-        if notification:
-            result["notification_id"] = notification.id
+def poll_concurrency() -> int:
+    return max(1, int(getattr(settings, "AMI_LOW_UNITS_POLL_CONCURRENCY", 16)))
 
-    return result
+
+def poll_deadline_seconds() -> float:
+    """Wall-clock budget for one tick; defaults to the beat interval so ticks never pile up."""
+    default = getattr(settings, "AMI_LOW_UNITS_POLL_SECONDS", 2)
+    return max(0.5, float(getattr(settings, "AMI_LOW_UNITS_POLL_DEADLINE_SECONDS", 0) or default))
+
+
+def read_pool() -> tuple[ThreadPoolExecutor, threading.BoundedSemaphore]:
+    """
+    Process-wide pool for ThingsBoard reads and the semaphore bounding the reads
+    in flight (running or queued) to AMI_LOW_UNITS_POLL_CONCURRENCY.
+    """
+    global _read_pool, _read_slots
+    if _read_pool is None:
+        with _read_pool_lock:
+            if _read_pool is None:
+                size = poll_concurrency()
+                _read_slots = threading.BoundedSemaphore(size)
+                _read_pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix="ami-low-units")
+    return _read_pool, _read_slots
+
+
+def _submit_read(meter: Meter, timeout: float):
+    """Queue a read if a slot is free and the meter has none in flight; None otherwise."""
+    pool, slots = read_pool()
+    with _read_pool_lock:
+        if meter.pk in _reads_in_flight or not slots.acquire(blocking=False):
+            return None
+        _reads_in_flight.add(meter.pk)
+
+    def release(_future):
+        with _read_pool_lock:
+            _reads_in_flight.discard(meter.pk)
+        slots.release()
+
+    try:
+        future = pool.submit(_timed_read, meter, timeout)
+    except Exception:
+        release(None)
+        raise
+    future.add_done_callback(release)
+    return future
+
+
+def _timed_read(meter: Meter, timeout: float):
+    started = time.monotonic()
+    ok, msg, data = query_latest_units_from_thingsboard(meter, timeout=timeout)
+    return ok, msg, data, time.monotonic() - started
+
+
+def _percentile_ms(sorted_seconds: list[float], pct: float) -> float | None:
+    if not sorted_seconds:
+        return None
+    index = min(len(sorted_seconds) - 1, max(0, math.ceil(pct / 100 * len(sorted_seconds)) - 1))
+    return round(sorted_seconds[index] * 1000, 1)
 
 
 def poll_all_ami_low_units() -> dict:
-    """Poll every active AMI meter; used by Celery beat (default every 2 seconds)."""
-    meters = Meter.objects.filter(
-        architecture=Meter.ARCH_AMI,
-        status=Meter.STATUS_ACTIVE,
-        is_deleted=False,
-    ).select_related("user")
-
-    checked = 0
-    alerts = 0
-    errors = 0
+    """
+    Poll every active AMI meter; used by Celery beat (default every 2 seconds).
+
+    ThingsBoard reads run on the process-wide read pool over the shared
+    keep-alive session; the database work (previous balances, snapshots,
+    alerts) stays on the calling thread. Reads still outstanding at the tick
+    deadline are abandoned and counted as timeouts, so a slow ThingsBoard cannot
+    make ticks overlap. Meters that find no free slot, or still have a read in
+    flight from an earlier tick, are counted as skipped and retried next tick.
+    """
+    tick_started = time.monotonic()
+    previous_kwh = Subquery(
+        MeterBalanceSnapshot.objects.filter(meter=OuterRef("pk"))
+        .order_by("-recorded_at")
+        .values("remaining_kwh")[:1]
+    )
+    meters = [
+        meter
+        for meter in Meter.objects.filter(
+            architecture=Meter.ARCH_AMI,
+            status=Meter.STATUS_ACTIVE,
+            is_deleted=False,
+        )
+        .select_related("user")
+        .annotate(previous_kwh=previous_kwh)
+        if (meter.iot_device_token or "").strip()
+    ]
+
+    deadline = poll_deadline_seconds()
+    request_timeout = min(float(getattr(settings, "THINGSBOARD_TIMEOUT_SECONDS", 15)), deadline)
+    readings = []
+    timed_out = skipped = 0
+    futures = {}
     for meter in meters:
-        outcome = check_meter_low_units(meter)
-        if outcome.get("skipped"):
-            continue
-        checked += 1
-        if outcome.get("ok") is False:
+        future = _submit_read(meter, request_timeout)
+        if future is None:
+            skipped += 1
+        else:
+            futures[future] = meter
+    if futures:
+        done, pending = wait(futures, timeout=max(0.0, deadline - (time.monotonic() - tick_started)))
+        timed_out = len(pending)
+        for future in done:
+            meter = futures[future]
+            try:
+                readings.append((meter, *future.result()))
+            except Exception as exc:
+                logger.exception("Low-units read crashed for meter=%s", meter.meter_no)
+                readings.append((meter, False, str(exc), None, 0.0))
+
+    errors = 0
+    latencies = []
+    snapshots = []
+    evaluations = []
+    now = timezone.now()
+    for meter, ok, msg, data, elapsed in readings:
+        latencies.append(elapsed)
+        if not ok or not data:
             errors += 1
-        if outcome.get("alert_sent"):
-            alerts += 1
+            logger.debug("Low-units poll failed for meter=%s: %s", meter.meter_no, msg)
+            continue
+        current = Decimal(str(data["units_kwh"]))
+        snapshots.append(
+            MeterBalanceSnapshot(
+                meter=meter,
+                remaining_kwh=current,
+                recorded_at=now,
+                source=data.get("source", "thingsboard") or "thingsboard",
+            )
+        )
+        previous = Decimal(str(meter.previous_kwh)) if meter.previous_kwh is not None else None
+        evaluations.append((meter, previous, current, now))
 
-    return {
-        "meters_checked": checked,
+    if snapshots:
+        MeterBalanceSnapshot.objects.bulk_create(snapshots)
+    alerts = evaluate_low_units_batch(evaluations, source="poll")
+
+    latencies.sort()
+    metrics = {
+        "meters_checked": len(readings),
         "alerts_sent": alerts,
         "errors": errors,
+        "timeouts": timed_out,
+        "skipped_busy": skipped,
+        "latency_p50_ms": _percentile_ms(latencies, 50),
+        "latency_p95_ms": _percentile_ms(latencies, 95),
+        "tick_ms": round((time.monotonic() - tick_started) * 1000, 1),
         "threshold_kwh": float(low_units_threshold_kwh()),
     }
+    log = logger.warning if timed_out or skipped else logger.debug
+    log(
+        "AMI low-units tick: checked=%s alerts=%s errors=%s timeouts=%s skipped=%s p50=%sms p95=%sms tick=%sms",
+        metrics["meters_checked"],
+        alerts,
+        errors,
+        timed_out,
+        skipped,
+        metrics["latency_p50_ms"],
+        metrics["latency_p95_ms"],
+        metrics["tick_ms"],
+    )
+    return metrics
+
+
+def ingest_balance_readings(readings, *, source: str = "thingsboard_webhook") -> dict:
+    """
+    Store a batch of pushed balances and alert on them.
+
+    `readings` is a list of (meter, units_kwh, occurred_at). Previous balances
+    are loaded with one query, readings for the same meter are chained in
+    occurred_at order, snapshots are bulk-inserted and alerts evaluated with
+    `evaluate_low_units_batch`.
+    """
+    if not readings:
+        return {"snapshots": 0, "low": 0, "alerts_sent": 0}
+
+    readings = sorted(readings, key=lambda r: r[2])
+    meter_ids = {meter.pk for meter, _, _ in readings}
+    previous: dict[int, Decimal] = {}
+    for row in Meter.objects.filter(pk__in=meter_ids).annotate(
+        previous_kwh=Subquery(
+            MeterBalanceSnapshot.objects.filter(meter=OuterRef("pk"))
+            .order_by("-recorded_at")
+            .values("remaining_kwh")[:1]
+        )
+    ).values("pk", "previous_kwh"):
+        if row["previous_kwh"] is not None:
+            previous[row["pk"]] = Decimal(str(row["previous_kwh"]))
+
+    snapshots = []
+    evaluations = []
+    for meter, units_kwh, occurred_at in readings:
+        snapshots.append(
+            MeterBalanceSnapshot(
+                meter=meter,
+                remaining_kwh=units_kwh,
+                recorded_at=occurred_at,
+                source=source,
+            )
+        )
+        evaluations.append((meter, previous.get(meter.pk), units_kwh, occurred_at))
+        previous[meter.pk] = units_kwh
+
+    MeterBalanceSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+    threshold = low_units_threshold_kwh()
+    return {
+        "snapshots": len(snapshots),
+        "low": sum(1 for _, _, current, _ in evaluations if current <= threshold),
+        "alerts_sent": evaluate_low_units_batch(evaluations, source="webhook"),
+    }
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 22:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meter', '0022_alter_meternotification_notification_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meter',
+            name='thingsboard_device_id',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='meter',
+            name='thingsboard_device_token',
+            field=models.CharField(blank=True, default='', max_length=128),
+        ),
+    ]
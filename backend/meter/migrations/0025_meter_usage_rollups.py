@@ -0,0 +1,81 @@
+# Generated by Django 5.2 on 2026-10-17 22:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+
+
+def backfill_usage_rollups(apps, schema_editor):
+    """Build monthly and yearly rollups from the daily rows that already exist."""
+    MeterUsageDaily = apps.get_model('meter', 'MeterUsageDaily')
+    MeterUsageMonthly = apps.get_model('meter', 'MeterUsageMonthly')
+    MeterUsageYearly = apps.get_model('meter', 'MeterUsageYearly')
+
+    monthly = list(
+        MeterUsageDaily.objects.annotate(month=TruncMonth('usage_date'))
+        .values('meter_id', 'month')
+        .annotate(total=Sum('kwh_used'), days=Count('id', filter=Q(kwh_used__gt=0)))
+        .values_list('meter_id', 'month', 'total', 'days')
+    )
+    MeterUsageMonthly.objects.bulk_create(
+        [
+            MeterUsageMonthly(meter_id=meter_id, month=month, kwh_used=total or 0, days_with_data=days)
+            for meter_id, month, total, days in monthly
+        ],
+        batch_size=1000,
+    )
+
+    yearly = {}
+    for meter_id, month, total, days in monthly:
+        bucket = yearly.setdefault((meter_id, month.year), [0, 0])
+        bucket[0] += total or 0
+        bucket[1] += days
+    MeterUsageYearly.objects.bulk_create(
+        [
+            MeterUsageYearly(meter_id=meter_id, year=year, kwh_used=total, days_with_data=days)
+            for (meter_id, year), (total, days) in yearly.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meter', '0024_usageaggregationcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeterUsageMonthly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month.')),
+                ('kwh_used', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('days_with_data', models.PositiveSmallIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('meter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_usage', to='meter.meter')),
+            ],
+            options={
+                'ordering': ['-month'],
+                'constraints': [models.UniqueConstraint(fields=('meter', 'month'), name='unique_meter_usage_month')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MeterUsageYearly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('kwh_used', models.DecimalField(decimal_places=4, default=0, max_digits=16)),
+                ('days_with_data', models.PositiveSmallIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('meter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='yearly_usage', to='meter.meter')),
+            ],
+            options={
+                'ordering': ['-year'],
+                'constraints': [models.UniqueConstraint(fields=('meter', 'year'), name='unique_meter_usage_year')],
+            },
+        ),
+        migrations.RunPython(backfill_usage_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2 on 2026-10-17 23:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0020_momo_reconciliation'),
+        ('meter', '0025_meter_usage_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['create_date'], name='meter_trans_create__b9ae77_idx'),
+        ),
+    ]
@@ -75,6 +75,10 @@ class Meter(TimestampMixin):
         blank=True,
         help_text="ThingsBoard device access token used to push purchased units."
     )
+    # Tenant-API device UUID, resolved lazily by meter.services and valid only
+    # while iot_device_token still equals thingsboard_device_token.
+    thingsboard_device_id = models.CharField(max_length=64, blank=True, default="")
+    thingsboard_device_token = models.CharField(max_length=128, blank=True, default="")
     # STS pending units: credited but not yet loaded via STS token.
     # AMI: kWh queued when ThingsBoard delivery fails (auto-retried).
     pending_units = models.DecimalField(
@@ -272,6 +276,65 @@ class MeterUsageDaily(TimestampMixin):
         return f"{self.meter.meter_no} {self.usage_date}: {self.kwh_used} kWh"
 
 
+class MeterUsageMonthly(models.Model):
+    """Per-month rollup of MeterUsageDaily, rewritten whenever a day in the month changes."""
+
+    meter = models.ForeignKey(
+        Meter, on_delete=models.CASCADE, related_name="monthly_usage"
+    )
+    month = models.DateField(help_text="First day of the month.")
+    kwh_used = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    days_with_data = models.PositiveSmallIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-month"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["meter", "month"],
+                name="unique_meter_usage_month",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.meter.meter_no} {self.month:%Y-%m}: {self.kwh_used} kWh"
+
+
+class MeterUsageYearly(models.Model):
+    """Per-year rollup of MeterUsageMonthly."""
+
+    meter = models.ForeignKey(
+        Meter, on_delete=models.CASCADE, related_name="yearly_usage"
+    )
+    year = models.PositiveSmallIntegerField()
+    kwh_used = models.DecimalField(max_digits=16, decimal_places=4, default=0)
+    days_with_data = models.PositiveSmallIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-year"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["meter", "year"],
+                name="unique_meter_usage_year",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.meter.meter_no} {self.year}: {self.kwh_used} kWh"
+
+
+class UsageAggregationCheckpoint(models.Model):
+    """High-water mark for an incremental usage job (one row per job name)."""
+
+    name = models.CharField(max_length=64, unique=True)
+    last_snapshot_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ snapshot {self.last_snapshot_id}"
+
+
 
 class MeterToken(TimestampMixin):
     TOKEN_SOURCE_CHOICES = [
@@ -397,6 +460,7 @@ class Transaction(TimestampMixin):
         ordering = ['-create_date']
         indexes = [
             models.Index(fields=['user', 'create_date']),
+            models.Index(fields=['create_date']),
             models.Index(fields=['transaction_type', 'status']),
             models.Index(fields=['meter', 'create_date']),
             models.Index(fields=['is_flagged']),
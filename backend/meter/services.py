@@ -1,14 +1,42 @@
+import base64
+import json
 import logging
+import threading
+import time
 from datetime import datetime
 from decimal import Decimal
 
 import requests
 from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
+from requests.adapters import HTTPAdapter
 
 
 logger = logging.getLogger(__name__)
 
+_session_lock = threading.Lock()
+_session = None
+
+
+def thingsboard_session():
+    """
+    Process-wide keep-alive session for ThingsBoard calls. The connection pool is
+    sized for the low-units poller so concurrent reads reuse sockets instead of
+    opening a fresh TCP/TLS connection per request.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool_size = max(1, int(getattr(settings, "AMI_LOW_UNITS_POLL_CONCURRENCY", 16)))
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
 
 def _thingsboard_base_url():
     """URL used for outbound server→ThingsBoard HTTP calls."""
@@ -100,7 +128,7 @@ def push_units_to_thingsboard(meter, units, reference_id=""):
     req_kwargs = _thingsboard_request_kwargs()
 
     try:
-        response = requests.post(url, json=payload, **req_kwargs)
+        response = thingsboard_session().post(url, json=payload, **req_kwargs)
         if 200 <= response.status_code < 300:
             return True, "ThingsBoard push successful."
         logger.warning(
@@ -147,7 +175,7 @@ def _read_remaining_from_thingsboard_scope(token, base_url, timeout, scope_key):
     url = f"{base_url}/api/v1/{token}/attributes"
     params = {scope_key: "remaining_units"}
     req_kwargs = {**_thingsboard_request_kwargs(), "timeout": timeout}
-    response = requests.get(url, params=params, **req_kwargs)
+    response = thingsboard_session().get(url, params=params, **req_kwargs)
     if not (200 <= response.status_code < 300):
         return None, response
 
@@ -164,7 +192,7 @@ def _read_remaining_from_thingsboard_telemetry(token, base_url, timeout):
     url = f"{base_url}/api/v1/{token}/telemetry"
     params = {"keys": "remaining_units", "limit": 1}
     req_kwargs = {**_thingsboard_request_kwargs(), "timeout": timeout}
-    response = requests.get(url, params=params, **req_kwargs)
+    response = thingsboard_session().get(url, params=params, **req_kwargs)
     if not (200 <= response.status_code < 300):
         return None, response
 
@@ -174,10 +202,51 @@ def _read_remaining_from_thingsboard_telemetry(token, base_url, timeout):
     return remaining, response
 
 
-def query_latest_units_from_thingsboard(meter):
+# Where a device keeps remaining_units, in full-probe order.
+_UNITS_SOURCES = ("sharedKeys", "serverKeys", "clientKeys", "telemetry")
+
+
+def _units_source_cache_key(token):
+    return f"thingsboard:units_source:{token}"
+
+
+def _cached_units_source(token):
+    """Scope that answered last time for this device token, or None (cache errors are a miss)."""
+    try:
+        return cache.get(_units_source_cache_key(token))
+    except Exception as exc:
+        logger.debug("ThingsBoard units-source cache read failed: %s", exc)
+        return None
+
+
+def _remember_units_source(token, source):
+    ttl = int(getattr(settings, "THINGSBOARD_UNITS_SOURCE_CACHE_SECONDS", 86400))
+    try:
+        cache.set(_units_source_cache_key(token), source, ttl)
+    except Exception as exc:
+        logger.debug("ThingsBoard units-source cache write failed: %s", exc)
+
+
+def _forget_units_source(token):
+    try:
+        cache.delete(_units_source_cache_key(token))
+    except Exception as exc:
+        logger.debug("ThingsBoard units-source cache delete failed: %s", exc)
+
+
+def _read_remaining_from_source(token, base_url, timeout, source):
+    if source == "telemetry":
+        return _read_remaining_from_thingsboard_telemetry(token, base_url, timeout)
+    return _read_remaining_from_thingsboard_scope(token, base_url, timeout, source)
+
+
+def query_latest_units_from_thingsboard(meter, timeout=None):
     """
     Read live remaining kWh from ThingsBoard (`remaining_units` shared/server/client
-    attribute, with telemetry fallback).
+    attribute, with telemetry fallback). The source that answered is cached per
+    device token, so later reads go straight to it and only a miss re-probes.
+    `timeout` overrides THINGSBOARD_TIMEOUT_SECONDS per request (the poller caps it
+    to its tick deadline).
     Returns (ok: bool, message: str, data: dict | None).
     """
     token = _meter_device_token(meter)
@@ -197,39 +266,34 @@ def query_latest_units_from_thingsboard(meter):
     if not base_url:
         return False, "THINGSBOARD_BASE_URL is not configured.", None
 
-    timeout = int(getattr(settings, "THINGSBOARD_TIMEOUT_SECONDS", 8))
+    if timeout is None:
+        timeout = int(getattr(settings, "THINGSBOARD_TIMEOUT_SECONDS", 8))
 
     try:
         remaining = None
-        for scope_key in ("sharedKeys", "serverKeys", "clientKeys"):
-            remaining, response = _read_remaining_from_thingsboard_scope(
-                token, base_url, timeout, scope_key
-            )
+        cached_source = _cached_units_source(token)
+        probe_order = list(_UNITS_SOURCES)
+        if cached_source in probe_order:
+            probe_order.remove(cached_source)
+            probe_order.insert(0, cached_source)
+
+        for source in probe_order:
+            remaining, response = _read_remaining_from_source(token, base_url, timeout, source)
             if remaining is not None:
+                if source != cached_source:
+                    _remember_units_source(token, source)
                 break
+            if source == cached_source:
+                _forget_units_source(token)
             if response is not None and not (200 <= response.status_code < 300):
                 logger.warning(
-                    "ThingsBoard attribute read failed for meter=%s scope=%s status=%s body=%s",
+                    "ThingsBoard remaining_units read failed for meter=%s source=%s status=%s body=%s",
                     meter.meter_no,
-                    scope_key,
+                    source,
                     response.status_code,
                     response.text[:300],
                 )
 
-        if remaining is None:
-            remaining, telemetry_response = _read_remaining_from_thingsboard_telemetry(
-                token, base_url, timeout
-            )
-            if remaining is None and telemetry_response is not None and not (
-                200 <= telemetry_response.status_code < 300
-            ):
-                logger.warning(
-                    "ThingsBoard telemetry read failed for meter=%s status=%s body=%s",
-                    meter.meter_no,
-                    telemetry_response.status_code,
-                    telemetry_response.text[:300],
-                )
-
         if remaining is None:
             return False, "ThingsBoard device has no remaining_units attribute.", None
 
@@ -255,8 +319,59 @@ def record_balance_snapshot(meter, remaining_kwh, source="thingsboard"):
     )
 
 
-def _thingsboard_tenant_token():
-    """Obtain a short-lived ThingsBoard tenant JWT (cached per process)."""
+# Fallback lifetime when a tenant JWT carries no readable `exp` claim.
+_TENANT_TOKEN_FALLBACK_TTL_SECONDS = 900
+
+
+def _jwt_expiry(token):
+    """`exp` claim (epoch seconds) from a JWT payload, without verifying the signature."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+
+class _TenantTokenManager:
+    """
+    Process-wide tenant JWT. Threads share one login; the token is renewed
+    THINGSBOARD_TOKEN_REFRESH_MARGIN_SECONDS before its `exp` claim.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0.0
+
+    def _is_fresh(self):
+        margin = int(getattr(settings, "THINGSBOARD_TOKEN_REFRESH_MARGIN_SECONDS", 60))
+        return self._token is not None and time.time() < self._expires_at - margin
+
+    def get(self):
+        if self._is_fresh():
+            return self._token, "OK"
+        with self._lock:
+            if self._is_fresh():
+                return self._token, "OK"
+            token, msg = _login_tenant()
+            if token:
+                self._token = token
+                self._expires_at = _jwt_expiry(token) or time.time() + _TENANT_TOKEN_FALLBACK_TTL_SECONDS
+            return token, msg
+
+    def invalidate(self, token=None):
+        """Drop the cached JWT (only if it is still `token`, when given)."""
+        with self._lock:
+            if token is None or token == self._token:
+                self._token = None
+                self._expires_at = 0.0
+
+
+_tenant_tokens = _TenantTokenManager()
+
+
+def _login_tenant():
     username = getattr(settings, "THINGSBOARD_TENANT_USERNAME", "") or ""
     password = getattr(settings, "THINGSBOARD_TENANT_PASSWORD", "") or ""
     base_url = _thingsboard_base_url()
@@ -266,7 +381,7 @@ def _thingsboard_tenant_token():
     url = f"{base_url}/api/auth/login"
     req_kwargs = _thingsboard_request_kwargs()
     try:
-        response = requests.post(
+        response = thingsboard_session().post(
             url,
             json={"username": username, "password": password},
             **req_kwargs,
@@ -281,18 +396,44 @@ def _thingsboard_tenant_token():
         return None, _thingsboard_connection_error_message(exc, action="log in to")
 
 
-def _find_thingsboard_device_id(meter, tenant_token):
+def _thingsboard_tenant_token():
+    """Obtain a short-lived ThingsBoard tenant JWT (cached per process until near expiry)."""
+    return _tenant_tokens.get()
+
+
+def _tenant_request(method, path, **kwargs):
+    """
+    Tenant REST call with the cached JWT. A 401 drops the token and retries once
+    with a fresh login. Returns (response | None, message); network errors raise.
+    """
+    headers = kwargs.pop("headers", None) or {}
+    for attempt in range(2):
+        tenant_token, msg = _thingsboard_tenant_token()
+        if not tenant_token:
+            return None, msg
+        response = thingsboard_session().request(
+            method,
+            f"{_thingsboard_base_url()}{path}",
+            headers={**headers, "X-Authorization": f"Bearer {tenant_token}"},
+            **{**_thingsboard_request_kwargs(), **kwargs},
+        )
+        if response.status_code != 401 or attempt:
+            return response, "OK"
+        _tenant_tokens.invalidate(tenant_token)
+    return response, "OK"
+
+
+def _find_thingsboard_device_id(meter):
     """Resolve ThingsBoard device UUID from the meter access token."""
-    base_url = _thingsboard_base_url()
-    req_kwargs = _thingsboard_request_kwargs()
     device_token = _meter_device_token(meter)
-    headers = {"X-Authorization": f"Bearer {tenant_token}"}
 
     # Prefer lookup by access token text search
-    url = f"{base_url}/api/tenant/devices"
+    path = "/api/tenant/devices"
     params = {"pageSize": 50, "page": 0, "textSearch": device_token}
     try:
-        response = requests.get(url, headers=headers, params=params, **req_kwargs)
+        response, msg = _tenant_request("get", path, params=params)
+        if response is None:
+            return None, msg
         if 200 <= response.status_code < 300:
             for item in response.json().get("data", []):
                 dev_id = item.get("id", {}).get("id")
@@ -304,7 +445,9 @@ def _find_thingsboard_device_id(meter, tenant_token):
     # Fallback: search by meter number
     params = {"pageSize": 50, "page": 0, "textSearch": meter.meter_no}
     try:
-        response = requests.get(url, headers=headers, params=params, **req_kwargs)
+        response, msg = _tenant_request("get", path, params=params)
+        if response is None:
+            return None, msg
         if 200 <= response.status_code < 300:
             for item in response.json().get("data", []):
                 dev_id = item.get("id", {}).get("id")
@@ -316,6 +459,47 @@ def _find_thingsboard_device_id(meter, tenant_token):
     return None, "ThingsBoard device not found for meter."
 
 
+def _thingsboard_device_id(meter, refresh=False):
+    """
+    Device UUID for the meter, from the mapping stored on the meter when it still
+    belongs to the current access token; otherwise looked up and stored.
+    """
+    token = _meter_device_token(meter)
+    if not refresh and meter.thingsboard_device_id and meter.thingsboard_device_token == token:
+        return meter.thingsboard_device_id, "OK"
+
+    device_id, msg = _find_thingsboard_device_id(meter)
+    if device_id and meter.pk:
+        from meter.models import Meter
+
+        Meter.all_objects.filter(pk=meter.pk).update(
+            thingsboard_device_id=device_id,
+            thingsboard_device_token=token,
+        )
+        meter.thingsboard_device_id = device_id
+        meter.thingsboard_device_token = token
+    return device_id, msg
+
+
+def _device_request(meter, method, path_template, **kwargs):
+    """
+    Tenant call against the meter's device (`{device_id}` in the path). A 404 on a
+    stored mapping re-resolves the device once, e.g. after it was re-provisioned.
+    Returns (response | None, message); network errors raise.
+    """
+    stored = bool(meter.thingsboard_device_id)
+    device_id, msg = _thingsboard_device_id(meter)
+    if not device_id:
+        return None, msg
+    response, msg = _tenant_request(method, path_template.format(device_id=device_id), **kwargs)
+    if response is not None and response.status_code == 404 and stored:
+        device_id, msg = _thingsboard_device_id(meter, refresh=True)
+        if not device_id:
+            return None, msg
+        response, msg = _tenant_request(method, path_template.format(device_id=device_id), **kwargs)
+    return response, msg
+
+
 def set_shared_remaining_units(meter, value):
     """
     Write remaining_units on the device shared scope (tenant REST API).
@@ -325,28 +509,16 @@ def set_shared_remaining_units(meter, value):
     if token.startswith("dev-"):
         return True, "Dev stub — attribute sync skipped."
 
-    tenant_token, msg = _thingsboard_tenant_token()
-    if not tenant_token:
-        return False, msg
-
-    device_id, msg = _find_thingsboard_device_id(meter, tenant_token)
-    if not device_id:
-        return False, msg
-
-    base_url = _thingsboard_base_url()
-    url = f"{base_url}/api/plugins/telemetry/DEVICE/{device_id}/SHARED_SCOPE"
-    headers = {
-        "X-Authorization": f"Bearer {tenant_token}",
-        "Content-Type": "application/json",
-    }
-    req_kwargs = _thingsboard_request_kwargs()
     try:
-        response = requests.post(
-            url,
+        response, msg = _device_request(
+            meter,
+            "post",
+            "/api/plugins/telemetry/DEVICE/{device_id}/SHARED_SCOPE",
             json={"remaining_units": float(Decimal(str(value)))},
-            headers=headers,
-            **req_kwargs,
+            headers={"Content-Type": "application/json"},
         )
+        if response is None:
+            return False, msg
         if 200 <= response.status_code < 300:
             return True, "remaining_units attribute updated."
         return False, f"Attribute write failed (HTTP {response.status_code})."
@@ -383,15 +555,6 @@ def query_usage_timeseries_from_thingsboard(meter, start_date, end_date):
         return False, "Dev token — use stub data.", None
 
     telemetry_key = getattr(settings, "THINGSBOARD_USAGE_TELEMETRY_KEY", "daily_kwh") or "daily_kwh"
-    tenant_token, msg = _thingsboard_tenant_token()
-    if not tenant_token:
-        return False, msg, None
-
-    device_id, msg = _find_thingsboard_device_id(meter, tenant_token)
-    if not device_id:
-        return False, msg, None
-
-    base_url = _thingsboard_base_url()
     start_ts = int(
         timezone.make_aware(datetime.combine(start_date, datetime.min.time())).timestamp() * 1000
     )
@@ -402,7 +565,6 @@ def query_usage_timeseries_from_thingsboard(meter, start_date, end_date):
         * 1000
     )
 
-    url = f"{base_url}/api/plugins/telemetry/DEVICE/{device_id}/values/timeseries"
     params = {
         "keys": telemetry_key,
         "startTs": start_ts,
@@ -412,11 +574,16 @@ def query_usage_timeseries_from_thingsboard(meter, start_date, end_date):
         "limit": 5000,
         "orderBy": "ASC",
     }
-    headers = {"X-Authorization": f"Bearer {tenant_token}"}
-    req_kwargs = _thingsboard_request_kwargs()
 
     try:
-        response = requests.get(url, headers=headers, params=params, **req_kwargs)
+        response, msg = _device_request(
+            meter,
+            "get",
+            "/api/plugins/telemetry/DEVICE/{device_id}/values/timeseries",
+            params=params,
+        )
+        if response is None:
+            return False, msg, None
         if not (200 <= response.status_code < 300):
             return (
                 False,
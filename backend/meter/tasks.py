@@ -4,7 +4,7 @@ from celery import shared_task
 from django.utils import timezone
 
 from meter.models import Meter
-from meter.usage_service import snapshot_all_ami_meters, sync_meter_usage
+from meter.usage_service import snapshot_all_ami_meters
 
 
 @shared_task(name="meter.tasks.snapshot_ami_meter_balances")
@@ -15,14 +15,49 @@ def snapshot_ami_meter_balances():
 
 @shared_task(name="meter.tasks.aggregate_daily_ami_usage")
 def aggregate_daily_ami_usage():
-    """Periodic task: aggregate yesterday's usage from snapshots / ThingsBoard."""
+    """
+    Periodic task: pull ThingsBoard daily telemetry (when the tenant API is
+    configured), then fold new balance snapshots into daily usage in one pass.
+    """
+    from django.conf import settings
+
+    from meter.usage_service import (
+        aggregate_usage_from_snapshots,
+        ensure_dev_stub_usage,
+        sync_thingsboard_daily_usage,
+    )
+
     yesterday = timezone.localdate() - timedelta(days=1)
     start = yesterday - timedelta(days=7)
-    count = 0
-    for meter in Meter.objects.filter(architecture=Meter.ARCH_AMI, status=Meter.STATUS_ACTIVE):
-        sync_meter_usage(meter, start, yesterday)
-        count += 1
-    return count
+    meters = Meter.objects.filter(architecture=Meter.ARCH_AMI, status=Meter.STATUS_ACTIVE)
+
+    telemetry_rows = 0
+    if getattr(settings, "THINGSBOARD_TENANT_USERNAME", "") and getattr(
+        settings, "THINGSBOARD_TENANT_PASSWORD", ""
+    ):
+        for meter in meters.exclude(iot_device_token__startswith="dev-"):
+            telemetry_rows += sync_thingsboard_daily_usage(meter, start, yesterday)
+
+    for meter in meters.filter(iot_device_token__startswith="dev-"):
+        ensure_dev_stub_usage(meter, start, yesterday)
+
+    result = aggregate_usage_from_snapshots()
+    result["telemetry_rows"] = telemetry_rows
+    return result
+
+
+@shared_task(name="meter.tasks.refresh_meter_usage")
+def refresh_meter_usage(meter_id, start_iso, end_iso):
+    """On-demand Energy Usage sync for one meter (queued by the report's refresh action)."""
+    from datetime import date
+
+    from meter.usage_service import sync_meter_usage
+
+    meter = Meter.objects.filter(pk=meter_id, architecture=Meter.ARCH_AMI).first()
+    if meter is None:
+        return False
+    sync_meter_usage(meter, date.fromisoformat(start_iso), date.fromisoformat(end_iso))
+    return True
 
 
 @shared_task(name="meter.tasks.retry_pending_ami_deliveries")
@@ -17,11 +17,19 @@ from decimal import Decimal
 from typing import Any
 
 from django.conf import settings
-from django.db.models import Sum
-from django.db.models.functions import ExtractMonth
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Min, OuterRef, Q, Subquery, Sum, Window
+from django.db.models.functions import Coalesce, ExtractYear, Lag, TruncDate, TruncMonth
 from django.utils import timezone
 
-from meter.models import Meter, MeterBalanceSnapshot, MeterUsageDaily
+from meter.models import (
+    Meter,
+    MeterBalanceSnapshot,
+    MeterUsageDaily,
+    MeterUsageMonthly,
+    MeterUsageYearly,
+    UsageAggregationCheckpoint,
+)
 from meter.services import (
     query_latest_units_from_thingsboard,
     query_usage_timeseries_from_thingsboard,
@@ -127,9 +135,108 @@ def upsert_daily_usage(
             "source": source,
         },
     )
+    refresh_usage_rollups({(meter.pk, usage_date.replace(day=1))})
     return obj
 
 
+def bulk_upsert_daily_usage(rows, source: str) -> int:
+    """
+    Upsert many (meter_id, usage_date, kwh_used) rows with one INSERT … ON CONFLICT.
+    Later duplicates of the same meter/day win. Returns the number of rows written.
+    """
+    latest = {}
+    for meter_id, usage_date, kwh_used in rows:
+        latest[(meter_id, usage_date)] = max(Decimal("0"), Decimal(str(kwh_used)))
+    if not latest:
+        return 0
+
+    MeterUsageDaily.objects.bulk_create(
+        [
+            MeterUsageDaily(meter_id=meter_id, usage_date=usage_date, kwh_used=kwh, source=source)
+            for (meter_id, usage_date), kwh in latest.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["meter", "usage_date"],
+        update_fields=["kwh_used", "source", "modify_date"],
+        batch_size=1000,
+    )
+    refresh_usage_rollups({(meter_id, usage_date.replace(day=1)) for meter_id, usage_date in latest})
+    return len(latest)
+
+
+def refresh_usage_rollups(meter_months) -> None:
+    """
+    Recompute `MeterUsageMonthly` for the given (meter_id, first-of-month) pairs and
+    `MeterUsageYearly` for their years, then invalidate those meters' cached reports.
+    Called by every writer of `MeterUsageDaily`.
+    """
+    meter_months = set(meter_months)
+    if not meter_months:
+        return
+
+    meter_ids = {meter_id for meter_id, _ in meter_months}
+    first = min(month for _, month in meter_months)
+    last = max(month for _, month in meter_months)
+    monthly = {
+        (row["meter_id"], row["month"]): row
+        for row in MeterUsageDaily.objects.filter(
+            meter_id__in=meter_ids,
+            usage_date__gte=first,
+            usage_date__lt=_next_month(last),
+        )
+        .annotate(month=TruncMonth("usage_date"))
+        .values("meter_id", "month")
+        .annotate(total=Sum("kwh_used"), days=Count("id", filter=Q(kwh_used__gt=0)))
+    }
+    MeterUsageMonthly.objects.bulk_create(
+        [
+            MeterUsageMonthly(
+                meter_id=meter_id,
+                month=month,
+                kwh_used=(monthly.get((meter_id, month)) or {}).get("total") or Decimal("0"),
+                days_with_data=(monthly.get((meter_id, month)) or {}).get("days") or 0,
+            )
+            for meter_id, month in meter_months
+        ],
+        update_conflicts=True,
+        unique_fields=["meter", "month"],
+        update_fields=["kwh_used", "days_with_data", "updated_at"],
+    )
+
+    meter_years = {(meter_id, month.year) for meter_id, month in meter_months}
+    years = {year for _, year in meter_years}
+    yearly = {
+        (row["meter_id"], row["year"]): row
+        for row in MeterUsageMonthly.objects.filter(meter_id__in=meter_ids, month__year__in=years)
+        .annotate(year=ExtractYear("month"))
+        .values("meter_id", "year")
+        .annotate(total=Sum("kwh_used"), days=Sum("days_with_data"))
+    }
+    MeterUsageYearly.objects.bulk_create(
+        [
+            MeterUsageYearly(
+                meter_id=meter_id,
+                year=year,
+                kwh_used=(yearly.get((meter_id, year)) or {}).get("total") or Decimal("0"),
+                days_with_data=(yearly.get((meter_id, year)) or {}).get("days") or 0,
+            )
+            for meter_id, year in meter_years
+        ],
+        update_conflicts=True,
+        unique_fields=["meter", "year"],
+        update_fields=["kwh_used", "days_with_data", "updated_at"],
+    )
+
+    for meter_id in meter_ids:
+        _bump_usage_report_version(meter_id)
+
+
+def _next_month(month_start: date) -> date:
+    if month_start.month == 12:
+        return date(month_start.year + 1, 1, 1)
+    return date(month_start.year, month_start.month + 1, 1)
+
+
 def sync_thingsboard_daily_usage(meter: Meter, start: date, end: date) -> int:
     """Pull daily kWh from ThingsBoard telemetry and store in MeterUsageDaily."""
     ok, msg, rows = query_usage_timeseries_from_thingsboard(meter, start, end)
@@ -138,13 +245,10 @@ def sync_thingsboard_daily_usage(meter: Meter, start: date, end: date) -> int:
             logger.debug("TB usage sync skipped for %s: %s", meter.meter_no, msg)
         return 0
 
-    count = 0
-    for row in rows:
-        usage_date = row["date"]
-        kwh = Decimal(str(row["kwh_used"]))
-        upsert_daily_usage(meter, usage_date, kwh, MeterUsageDaily.SOURCE_THINGSBOARD)
-        count += 1
-    return count
+    return bulk_upsert_daily_usage(
+        ((meter.pk, row["date"], row["kwh_used"]) for row in rows),
+        MeterUsageDaily.SOURCE_THINGSBOARD,
+    )
 
 
 def ensure_dev_stub_usage(meter: Meter, start: date, end: date) -> None:
@@ -154,35 +258,165 @@ def ensure_dev_stub_usage(meter: Meter, start: date, end: date) -> None:
         return
 
     rng = random.Random(hash(meter.meter_no) ^ start.toordinal())
+    existing = set(
+        MeterUsageDaily.objects.filter(
+            meter=meter, usage_date__gte=start, usage_date__lte=end
+        ).values_list("usage_date", flat=True)
+    )
+    rows = []
     current = start
     while current <= end:
-        if not MeterUsageDaily.objects.filter(meter=meter, usage_date=current).exists():
+        if current not in existing:
             base = 1.2 + (current.weekday() / 6) * 0.8
             kwh = Decimal(str(round(base + rng.uniform(-0.3, 1.5), 2)))
-            upsert_daily_usage(meter, current, kwh, MeterUsageDaily.SOURCE_STUB)
+            rows.append((meter.pk, current, kwh))
         current += timedelta(days=1)
+    bulk_upsert_daily_usage(rows, MeterUsageDaily.SOURCE_STUB)
 
 
 def sync_meter_usage(meter: Meter, start: date, end: date) -> None:
-    """Refresh daily usage rows for a meter over a date range."""
+    """
+    Refresh daily usage rows (and, through them, the rollups) for a meter over a
+    date range. Runs in the background; reports never call it inline.
+    """
     sync_thingsboard_daily_usage(meter, start, end)
+    aggregate_meter_usage_from_snapshots(meter, start, end)
+    ensure_dev_stub_usage(meter, start, end)
 
-    current = start
-    while current <= end:
-        existing = MeterUsageDaily.objects.filter(meter=meter, usage_date=current).first()
-        if existing and existing.source in (
-            MeterUsageDaily.SOURCE_THINGSBOARD,
-            MeterUsageDaily.SOURCE_WEBHOOK,
-        ):
-            current += timedelta(days=1)
+
+SNAPSHOT_AGGREGATION_CHECKPOINT = "daily_usage_from_snapshots"
+
+
+def _snapshot_daily_totals(meter_from_day: dict[int, date]) -> dict[tuple[int, date], Decimal]:
+    """
+    kWh used per (meter, local day) from consecutive balance snapshots, for each
+    meter from its given day onwards. One query: LAG over recorded_at yields each
+    snapshot's predecessor (the last snapshot before the window for the first
+    row), only decreasing readings are streamed back, and they are summed here.
+    Rises are top-ups and ignored, as in `aggregate_daily_from_snapshots`.
+    """
+    window_start_day = min(meter_from_day.values())
+    window_start = timezone.make_aware(datetime.combine(window_start_day, datetime.min.time()))
+    before_window = Subquery(
+        MeterBalanceSnapshot.objects.filter(
+            meter_id=OuterRef("meter_id"),
+            recorded_at__lt=window_start,
+        )
+        .order_by("-recorded_at", "-id")
+        .values("remaining_kwh")[:1]
+    )
+    readings = (
+        MeterBalanceSnapshot.objects.filter(
+            meter_id__in=meter_from_day.keys(),
+            recorded_at__gte=window_start,
+        )
+        .annotate(
+            previous_kwh=Coalesce(
+                Window(
+                    Lag("remaining_kwh"),
+                    partition_by=[F("meter_id")],
+                    order_by=[F("recorded_at").asc(), F("id").asc()],
+                ),
+                before_window,
+            ),
+            day=TruncDate("recorded_at"),
+        )
+        .annotate(used=F("previous_kwh") - F("remaining_kwh"))
+        .filter(used__gt=0)
+        .values_list("meter_id", "day", "used")
+    )
+
+    totals: dict[tuple[int, date], Decimal] = {}
+    for meter_id, day, used in readings.iterator(chunk_size=5000):
+        if day < meter_from_day[meter_id]:
             continue
+        key = (meter_id, day)
+        totals[key] = totals.get(key, Decimal("0")) + Decimal(str(used))
+    return totals
 
-        computed = aggregate_daily_from_snapshots(meter, current)
-        if computed is not None and computed > 0:
-            upsert_daily_usage(meter, current, computed, MeterUsageDaily.SOURCE_SNAPSHOT)
-        current += timedelta(days=1)
 
-    ensure_dev_stub_usage(meter, start, end)
+def _write_snapshot_usage(meter_from_day: dict[int, date], until: date | None = None) -> int:
+    """
+    Upsert snapshot-derived daily usage for each meter from its given day (up
+    to `until`), leaving days filled from ThingsBoard telemetry or the webhook
+    alone. Returns the number of days written.
+    """
+    totals = _snapshot_daily_totals(meter_from_day)
+    external = set(
+        MeterUsageDaily.objects.filter(
+            meter_id__in=meter_from_day.keys(),
+            usage_date__gte=min(meter_from_day.values()),
+            source__in=(MeterUsageDaily.SOURCE_THINGSBOARD, MeterUsageDaily.SOURCE_WEBHOOK),
+        ).values_list("meter_id", "usage_date")
+    )
+    return bulk_upsert_daily_usage(
+        (
+            (meter_id, day, kwh.quantize(Decimal("0.0001")))
+            for (meter_id, day), kwh in totals.items()
+            if (meter_id, day) not in external and (until is None or day <= until)
+        ),
+        MeterUsageDaily.SOURCE_SNAPSHOT,
+    )
+
+
+def aggregate_meter_usage_from_snapshots(meter: Meter, start: date, end: date) -> int:
+    """
+    Rebuild one meter's snapshot-sourced days in [start, end] for an on-demand
+    refresh, no further back than AMI_USAGE_REAGGREGATE_MAX_DAYS. The global
+    high-water mark is left to the beat task, whose next pass rewrites the same
+    rows idempotently.
+    """
+    max_days = max(1, int(getattr(settings, "AMI_USAGE_REAGGREGATE_MAX_DAYS", 31)))
+    start = max(start, _today_local() - timedelta(days=max_days))
+    if start > end:
+        return 0
+    return _write_snapshot_usage({meter.pk: start}, until=end)
+
+
+def aggregate_usage_from_snapshots() -> dict[str, int]:
+    """
+    Incrementally rebuild snapshot-sourced `MeterUsageDaily` rows.
+
+    Only meters with snapshots newer than the stored high-water mark are touched,
+    from the earliest day of those new snapshots (clamped to
+    AMI_USAGE_REAGGREGATE_MAX_DAYS back) to today. Days already filled from
+    ThingsBoard telemetry or the webhook are left alone. Results are written
+    with one bulk upsert and the mark advances to the newest snapshot seen.
+    """
+    checkpoint, _ = UsageAggregationCheckpoint.objects.get_or_create(
+        name=SNAPSHOT_AGGREGATION_CHECKPOINT
+    )
+    high_water = MeterBalanceSnapshot.objects.aggregate(top=Max("id"))["top"] or 0
+    if high_water <= checkpoint.last_snapshot_id:
+        return {"meters": 0, "days_written": 0, "last_snapshot_id": checkpoint.last_snapshot_id}
+
+    max_days = max(1, int(getattr(settings, "AMI_USAGE_REAGGREGATE_MAX_DAYS", 31)))
+    floor_day = _today_local() - timedelta(days=max_days)
+    floor = timezone.make_aware(datetime.combine(floor_day, datetime.min.time()))
+    dirty = (
+        MeterBalanceSnapshot.objects.filter(
+            id__gt=checkpoint.last_snapshot_id,
+            id__lte=high_water,
+            recorded_at__gte=floor,
+        )
+        .values("meter_id")
+        .annotate(first_seen=Min("recorded_at"))
+    )
+    meter_from_day = {
+        row["meter_id"]: max(floor_day, timezone.localdate(row["first_seen"])) for row in dirty
+    }
+
+    written = _write_snapshot_usage(meter_from_day) if meter_from_day else 0
+
+    checkpoint.last_snapshot_id = high_water
+    checkpoint.save(update_fields=["last_snapshot_id", "updated_at"])
+    logger.info(
+        "Snapshot usage aggregation: meters=%s days=%s high_water=%s",
+        len(meter_from_day),
+        written,
+        high_water,
+    )
+    return {"meters": len(meter_from_day), "days_written": written, "last_snapshot_id": high_water}
 
 
 def snapshot_meter_balance(meter: Meter) -> bool:
@@ -210,11 +444,7 @@ def snapshot_all_ami_meters() -> int:
 
 
 def available_usage_years(meter: Meter) -> list[int]:
-    years = (
-        MeterUsageDaily.objects.filter(meter=meter)
-        .dates("usage_date", "year", order="DESC")
-    )
-    result = [d.year for d in years]
+    result = list(MeterUsageYearly.objects.filter(meter=meter).values_list("year", flat=True))
     if not result:
         result = [_today_local().year]
     return sorted(set(result), reverse=True)
@@ -276,36 +506,41 @@ def _fill_missing_days(start: date, end: date, rows: list[MeterUsageDaily]) -> l
     return result
 
 
-def get_power_usage_report(
-    user,
-    meter_no: str | None,
-    period: str = "week",
-    year: int | None = None,
-    month: int | None = None,
-) -> dict[str, Any]:
-    ami_meters = get_user_ami_meters(user)
-    if not ami_meters:
-        return {
-            "eligible": False,
-            "message": "This is only for AMI meter users.",
-        }
+def _usage_report_version_key(meter_id: int) -> str:
+    return f"power_usage:version:{meter_id}"
 
-    if meter_no:
-        meter = next((m for m in ami_meters if m.meter_no == meter_no), None)
-        if not meter:
-            return {"eligible": False, "message": "AMI meter not found on your account."}
-    else:
-        meter = ami_meters[0]
 
-    start, end = _date_range_for_period(period, year, month)
-    sync_meter_usage(meter, start, end)
+def _usage_report_version(meter_id: int):
+    try:
+        return cache.get_or_set(_usage_report_version_key(meter_id), 1, None)
+    except Exception as exc:
+        logger.debug("Usage report cache unavailable: %s", exc)
+        return None
+
+
+def _bump_usage_report_version(meter_id: int) -> None:
+    try:
+        cache.set(_usage_report_version_key(meter_id), timezone.now().timestamp(), None)
+    except Exception as exc:
+        logger.debug("Usage report cache bump failed: %s", exc)
 
+
+_MONTH_NAMES = [
+    "Jan", "Feb", "Mar", "Apr", "May", "Jun",
+    "Jul", "Aug", "Sep", "Oct", "Nov", "Dec",
+]
+
+
+def _build_usage_report(meter: Meter, period: str, start: date, end: date) -> dict[str, Any]:
+    """Meter-specific part of the report, read from the daily/monthly/yearly rollups only."""
     rows = list(
         MeterUsageDaily.objects.filter(
             meter=meter,
             usage_date__gte=start,
             usage_date__lte=end,
-        ).order_by("usage_date")
+        )
+        .only("usage_date", "kwh_used", "source")
+        .order_by("usage_date")
     )
     daily = _fill_missing_days(start, end, rows)
     summary = _build_summary([d for d in daily if d["kwh_used"] > 0])
@@ -320,32 +555,19 @@ def get_power_usage_report(
 
     monthly_breakdown = []
     if period == "year":
-        agg = (
-            MeterUsageDaily.objects.filter(
-                meter=meter,
-                usage_date__gte=start,
-                usage_date__lte=end,
-            )
-            .annotate(month=ExtractMonth("usage_date"))
-            .values("month")
-            .annotate(
-                total=Sum("kwh_used"),
-                avg=Sum("kwh_used"),  # simplified; daily avg shown in UI from total/days
-            )
-            .order_by("month")
-        )
-        month_names = [
-            "Jan", "Feb", "Mar", "Apr", "May", "Jun",
-            "Jul", "Aug", "Sep", "Oct", "Nov", "Dec",
-        ]
-        for item in agg:
-            m = int(item["month"])
+        for item in MeterUsageMonthly.objects.filter(
+            meter=meter,
+            month__gte=start.replace(day=1),
+            month__lte=end,
+        ).order_by("month"):
+            month_end = min(_next_month(item.month) - timedelta(days=1), end)
+            days_in_range = (month_end - item.month).days + 1
             monthly_breakdown.append(
                 {
-                    "month": m,
-                    "label": month_names[m - 1],
-                    "total_kwh": round(float(item["total"] or 0), 2),
-                    "average_daily_kwh": round(float(item["total"] or 0) / 30, 2),
+                    "month": item.month.month,
+                    "label": _MONTH_NAMES[item.month.month - 1],
+                    "total_kwh": round(float(item.kwh_used), 2),
+                    "average_daily_kwh": round(float(item.kwh_used) / days_in_range, 2),
                 }
             )
 
@@ -359,11 +581,101 @@ def get_power_usage_report(
         "daily": daily,
         "monthly": monthly_breakdown,
         "available_years": available_usage_years(meter),
+        "data_source": data_source,
+        "generated_at": timezone.now().isoformat(),
+    }
+
+
+def resolve_usage_meter(user, meter_no: str | None):
+    """
+    (meter, ami_meters, error_report) for the usage endpoints; `error_report` is the
+    ineligible response body when the user has no matching AMI meter.
+    """
+    ami_meters = get_user_ami_meters(user)
+    if not ami_meters:
+        return None, ami_meters, {
+            "eligible": False,
+            "message": "This is only for AMI meter users.",
+        }
+
+    if meter_no:
+        meter = next((m for m in ami_meters if m.meter_no == meter_no), None)
+        if not meter:
+            return None, ami_meters, {"eligible": False, "message": "AMI meter not found on your account."}
+        return meter, ami_meters, None
+    return ami_meters[0], ami_meters, None
+
+
+def get_power_usage_report(
+    user,
+    meter_no: str | None,
+    period: str = "week",
+    year: int | None = None,
+    month: int | None = None,
+) -> dict[str, Any]:
+    """
+    Energy Usage report from precomputed rollups. Never syncs inline: data is kept
+    fresh by the background pipeline, or on demand via `request_usage_refresh`.
+    Responses are cached per (meter, period, range) for POWER_USAGE_CACHE_SECONDS
+    and invalidated whenever the meter's rollups change.
+    """
+    meter, ami_meters, error = resolve_usage_meter(user, meter_no)
+    if error:
+        return error
+
+    start, end = _date_range_for_period(period, year, month)
+    version = _usage_report_version(meter.pk)
+    cache_key = f"power_usage:report:{meter.pk}:{version}:{period}:{start}:{end}"
+    report = None
+    if version is not None:
+        report = cache.get(cache_key)
+    if report is None:
+        report = _build_usage_report(meter, period, start, end)
+        if version is not None:
+            cache.set(cache_key, report, int(getattr(settings, "POWER_USAGE_CACHE_SECONDS", 60)))
+
+    return {
+        **report,
         "available_meters": [
             {"meter_no": m.meter_no, "label": m.label or "Home"}
             for m in ami_meters
         ],
-        "data_source": data_source,
+    }
+
+
+def request_usage_refresh(
+    user,
+    meter_no: str | None,
+    period: str = "week",
+    year: int | None = None,
+    month: int | None = None,
+) -> dict[str, Any]:
+    """
+    Queue a background sync of the report's date range. Repeat requests for the
+    same meter within POWER_USAGE_REFRESH_COOLDOWN_SECONDS are not re-queued.
+    """
+    from meter.tasks import refresh_meter_usage
+    from utils.general import dispatch_task
+
+    meter, _ami_meters, error = resolve_usage_meter(user, meter_no)
+    if error:
+        return error
+
+    start, end = _date_range_for_period(period, year, month)
+    cooldown = int(getattr(settings, "POWER_USAGE_REFRESH_COOLDOWN_SECONDS", 60))
+    try:
+        queued = cache.add(f"power_usage:refresh:{meter.pk}", 1, cooldown)
+    except Exception:
+        queued = True
+    if queued:
+        dispatch_task(refresh_meter_usage, meter.pk, start.isoformat(), end.isoformat())
+
+    return {
+        "eligible": True,
+        "meter_no": meter.meter_no,
+        "queued": bool(queued),
+        "range": {"start": start.isoformat(), "end": end.isoformat()},
+        "message": "Usage refresh queued." if queued else "A refresh is already in progress.",
     }
 
 
@@ -0,0 +1,304 @@
+"""
+Process-wide HTTP plumbing for the MTN MoMo Collection API.
+
+- `momo_session()`: one keep-alive requests.Session per process, pooled so the
+  payment reconciler's parallel status checks reuse TLS connections.
+- `collection_tokens`: the Collection access token, cached in-process and in the
+  shared cache (Redis) so every thread and worker reuses one token until
+  MOMO_TOKEN_REFRESH_MARGIN_SECONDS before its `expires_in`. Inside that margin
+  a single caller refreshes while the others keep using the current token.
+- `momo_breaker`: after MOMO_BREAKER_FAILURES consecutive transport errors or
+  5xx replies, calls fail fast (CircuitOpenError) for MOMO_BREAKER_RESET_SECONDS;
+  then one trial call decides whether the circuit closes again.
+- `momo_client_stats()`: token hit/miss and per-call latency counters for this
+  process.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Used when MoMo omits `expires_in` (the Collection API issues 3600s tokens).
+_FALLBACK_TOKEN_TTL_SECONDS = 3600
+# How long other workers wait for the one refreshing a shared token.
+_REFRESH_LOCK_SECONDS = 15
+_REFRESH_WAIT_SECONDS = 2.0
+
+
+def _setting(name, default):
+  return type(default)(getattr(settings, name, default))
+
+
+class CircuitOpenError(requests.RequestException):
+  """MoMo is failing; the call was not attempted."""
+
+
+_session_lock = threading.Lock()
+_session = None
+
+
+def momo_session():
+  global _session
+  if _session is None:
+    with _session_lock:
+      if _session is None:
+        pool_size = max(1, _setting("MOMO_RECONCILE_CONCURRENCY", 8))
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session = session
+  return _session
+
+
+class _ClientStats:
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._counters = Counter()
+    self._calls = {}
+
+  def incr(self, name, amount=1):
+    with self._lock:
+      self._counters[name] += amount
+
+  def observe(self, operation, seconds, error=False):
+    with self._lock:
+      entry = self._calls.setdefault(operation, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+      elapsed_ms = seconds * 1000
+      entry["count"] += 1
+      entry["errors"] += int(error)
+      entry["total_ms"] += elapsed_ms
+      entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+
+  def snapshot(self):
+    with self._lock:
+      calls = {
+        operation: {
+          "count": entry["count"],
+          "errors": entry["errors"],
+          "avg_ms": round(entry["total_ms"] / entry["count"], 1) if entry["count"] else None,
+          "max_ms": round(entry["max_ms"], 1),
+        }
+        for operation, entry in self._calls.items()
+      }
+      return {
+        "token_hits": self._counters["token_hits"],
+        "token_shared_hits": self._counters["token_shared_hits"],
+        "token_misses": self._counters["token_misses"],
+        "token_refresh_failures": self._counters["token_refresh_failures"],
+        "breaker_rejections": self._counters["breaker_rejections"],
+        "calls": calls,
+      }
+
+
+_stats = _ClientStats()
+
+
+class _CircuitBreaker:
+  """Consecutive-failure breaker: closed → open → half-open (one trial) → closed."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._failures = 0
+    self._opened_at = None
+    self._trial_in_flight = False
+
+  @property
+  def state(self):
+    with self._lock:
+      if self._opened_at is None:
+        return "closed"
+      if time.monotonic() - self._opened_at >= _setting("MOMO_BREAKER_RESET_SECONDS", 30):
+        return "half-open"
+      return "open"
+
+  def allow(self):
+    with self._lock:
+      if self._opened_at is None:
+        return True
+      if self._trial_in_flight:
+        return False
+      if time.monotonic() - self._opened_at < _setting("MOMO_BREAKER_RESET_SECONDS", 30):
+        return False
+      self._trial_in_flight = True
+      return True
+
+  def record_success(self):
+    with self._lock:
+      if self._opened_at is not None:
+        logger.info("MoMo circuit closed")
+      self._failures = 0
+      self._opened_at = None
+      self._trial_in_flight = False
+
+  def record_failure(self):
+    with self._lock:
+      self._failures += 1
+      trial_failed = self._trial_in_flight
+      self._trial_in_flight = False
+      if trial_failed or (
+        self._opened_at is None and self._failures >= max(1, _setting("MOMO_BREAKER_FAILURES", 5))
+      ):
+        if self._opened_at is None:
+          logger.warning("MoMo circuit opened after %s consecutive failures", self._failures)
+        self._opened_at = time.monotonic()
+
+
+momo_breaker = _CircuitBreaker()
+
+
+def momo_request(operation, method, url, **kwargs):
+  """
+  One MoMo HTTP call over the pooled session, guarded by the breaker and timed
+  under `operation`. Raises CircuitOpenError while the circuit is open.
+  """
+  if not momo_breaker.allow():
+    _stats.incr("breaker_rejections")
+    raise CircuitOpenError("MoMo is temporarily unavailable (circuit open)")
+  started = time.perf_counter()
+  try:
+    response = momo_session().request(method, url, **kwargs)
+  except requests.RequestException:
+    _stats.observe(operation, time.perf_counter() - started, error=True)
+    momo_breaker.record_failure()
+    raise
+  server_error = response.status_code >= 500
+  _stats.observe(operation, time.perf_counter() - started, error=server_error)
+  if server_error:
+    momo_breaker.record_failure()
+  else:
+    momo_breaker.record_success()
+  return response
+
+
+class _CollectionTokenCache:
+  """
+  Access token shared by threads (in-process) and workers (shared cache).
+  `fetch()` returns `(token, expires_in)` or `(None, None)`.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._key = None
+    self._token = None
+    self._expires_at = 0.0
+
+  @staticmethod
+  def cache_key(*identity):
+    digest = hashlib.sha1("|".join(str(part) for part in identity).encode()).hexdigest()[:16]
+    return f"momo:token:{digest}"
+
+  def _margin(self):
+    return max(0, _setting("MOMO_TOKEN_REFRESH_MARGIN_SECONDS", 120))
+
+  def _local(self, key):
+    if self._key != key:
+      return None, 0.0
+    return self._token, self._expires_at
+
+  def _adopt(self, key, token, expires_at):
+    self._key, self._token, self._expires_at = key, token, expires_at
+
+  def get(self, key, fetch):
+    token, expires_at = self._local(key)
+    now = time.time()
+    if token and now < expires_at - self._margin():
+      _stats.incr("token_hits")
+      return token
+    if token and now < expires_at:
+      # Refresh ahead: one caller renews, everyone else keeps the current token.
+      if not self._lock.acquire(blocking=False):
+        _stats.incr("token_hits")
+        return token
+      try:
+        return self._refresh(key, fetch, fallback=token)
+      finally:
+        self._lock.release()
+    with self._lock:
+      token, expires_at = self._local(key)
+      if token and time.time() < expires_at - self._margin():
+        _stats.incr("token_hits")
+        return token
+      return self._refresh(key, fetch, fallback=token if token and time.time() < expires_at else None)
+
+  def _shared(self, key):
+    try:
+      entry = cache.get(key)
+    except Exception as exc:
+      logger.debug("MoMo token cache read failed: %s", exc)
+      return None
+    if entry and time.time() < entry["expires_at"] - self._margin():
+      return entry
+    return None
+
+  def _refresh(self, key, fetch, fallback=None):
+    entry = self._shared(key)
+    if entry:
+      self._adopt(key, entry["token"], entry["expires_at"])
+      _stats.incr("token_shared_hits")
+      return entry["token"]
+
+    lock_key = f"{key}:refresh"
+    try:
+      have_lock = cache.add(lock_key, 1, _REFRESH_LOCK_SECONDS)
+    except Exception:
+      have_lock = True
+    if not have_lock:
+      # Another worker is fetching; use its token if it lands shortly.
+      deadline = time.monotonic() + _REFRESH_WAIT_SECONDS
+      while time.monotonic() < deadline:
+        time.sleep(0.1)
+        entry = self._shared(key)
+        if entry:
+          self._adopt(key, entry["token"], entry["expires_at"])
+          _stats.incr("token_shared_hits")
+          return entry["token"]
+
+    try:
+      _stats.incr("token_misses")
+      token, expires_in = fetch()
+      if not token:
+        _stats.incr("token_refresh_failures")
+        return fallback
+      ttl = int(expires_in or _FALLBACK_TOKEN_TTL_SECONDS)
+      expires_at = time.time() + ttl
+      self._adopt(key, token, expires_at)
+      try:
+        cache.set(key, {"token": token, "expires_at": expires_at}, ttl)
+      except Exception as exc:
+        logger.debug("MoMo token cache write failed: %s", exc)
+      return token
+    finally:
+      if have_lock:
+        try:
+          cache.delete(lock_key)
+        except Exception:
+          pass
+
+  def invalidate(self, key, token):
+    """Drop `token` (rejected by MoMo) locally and from the shared cache."""
+    with self._lock:
+      if self._key == key and self._token == token:
+        self._token = None
+        self._expires_at = 0.0
+    try:
+      entry = cache.get(key)
+      if entry and entry.get("token") == token:
+        cache.delete(key)
+    except Exception as exc:
+      logger.debug("MoMo token cache invalidate failed: %s", exc)
+
+
+collection_tokens = _CollectionTokenCache()
+
+
+def momo_client_stats():
+  return {**_stats.snapshot(), "breaker_state": momo_breaker.state}
@@ -5,6 +5,7 @@ import uuid
 import requests
 from django.conf import settings
 
+from .client import collection_tokens, momo_request
 from .config import MTN_MOMO_CONFIG, MTN_TEST_NUMBERS
 
 logger = logging.getLogger(__name__)
@@ -36,11 +37,17 @@ class MTNMoMoService:
       return "1", "EUR"
     return str(int(ugx_amount)), "UGX"
 
+  def _token_cache_key(self):
+    return collection_tokens.cache_key(self.base_url, self.api_user_id, self.environment)
+
   def get_api_token(self):
+    """Collection access token, shared across threads and workers until near expiry."""
     if not self.api_user_id or not self.api_key:
       logger.error("MTN API user id or API key not configured")
       return None
+    return collection_tokens.get(self._token_cache_key(), self._fetch_api_token)
 
+  def _fetch_api_token(self):
     url = f"{self.base_url}/collection/token/"
     credentials = f"{self.api_user_id}:{self.api_key}"
     encoded_credentials = base64.b64encode(credentials.encode()).decode()
@@ -50,15 +57,39 @@ class MTNMoMoService:
     }
 
     try:
-      response = requests.post(url, headers=headers, timeout=self._timeout)
+      response = momo_request("token", "post", url, headers=headers, timeout=self._timeout)
       if response.status_code == 200:
-        token = response.json().get("access_token")
+        data = response.json()
+        token = data.get("access_token")
         if token:
-          return token
+          return token, data.get("expires_in")
       logger.error("Token request failed: %s - %s", response.status_code, response.text)
     except requests.RequestException as exc:
       logger.error("Token request error: %s", exc)
-    return None
+    return None, None
+
+  def _authorized_request(self, operation, method, url, headers, **kwargs):
+    """
+    Bearer-authenticated call. A 401 drops the cached token and retries once
+    with a fresh one. Returns None when no token can be obtained.
+    """
+    response = None
+    for attempt in range(2):
+      token = self.get_api_token()
+      if not token:
+        return None
+      response = momo_request(
+        operation,
+        method,
+        url,
+        headers={**headers, "Authorization": f"Bearer {token}"},
+        timeout=self._timeout,
+        **kwargs,
+      )
+      if response.status_code != 401 or attempt:
+        return response
+      collection_tokens.invalidate(self._token_cache_key(), token)
+    return response
 
   def request_payment(self, amount, phone_number, reference_id, external_id, payer_message=None):
     """
@@ -72,17 +103,12 @@ class MTNMoMoService:
     elif not phone_number.startswith("256") or len(phone_number) != 12:
       return {"status": "FAILED", "message": "Invalid Uganda phone number (use 256XXXXXXXXX)"}
 
-    token = self.get_api_token()
-    if not token:
-      return {"status": "FAILED", "message": "Could not get MTN API token. Check MoMo credentials."}
-
     if not reference_id:
       reference_id = str(uuid.uuid4())
 
     momo_amount, currency = self._charge_amount_and_currency(amount)
     url = f"{self.base_url}/collection/v1_0/requesttopay"
     headers = {
-      "Authorization": f"Bearer {token}",
       "X-Reference-Id": reference_id,
       "X-Target-Environment": self.environment,
       "Content-Type": "application/json",
@@ -103,7 +129,9 @@ class MTNMoMoService:
     logger.info("MoMo requesttopay ref=%s external=%s payload=%s", reference_id, external_id, payload)
 
     try:
-      response = requests.post(url, headers=headers, json=payload, timeout=self._timeout)
+      response = self._authorized_request("request_to_pay", "post", url, headers, json=payload)
+      if response is None:
+        return {"status": "FAILED", "message": "Could not get MTN API token. Check MoMo credentials."}
       if response.status_code == 202:
         sandbox_hint = ""
         if self.environment == "sandbox":
@@ -132,21 +160,18 @@ class MTNMoMoService:
 
   def get_payment_status(self, reference_id):
     """Poll MoMo using the X-Reference-Id from requesttopay."""
-    token = self.get_api_token()
-    if not token:
-      # Return UNKNOWN rather than FAILED — a token error doesn't mean the
-      # payment itself failed; the caller should keep polling or retry later.
-      return {"status": "UNKNOWN", "message": "Could not get API token"}
-
     url = f"{self.base_url}/collection/v1_0/requesttopay/{reference_id}"
     headers = {
-      "Authorization": f"Bearer {token}",
       "X-Target-Environment": self.environment,
       "Ocp-Apim-Subscription-Key": self.subscription_key,
     }
 
     try:
-      response = requests.get(url, headers=headers, timeout=self._timeout)
+      response = self._authorized_request("payment_status", "get", url, headers)
+      if response is None:
+        # Return UNKNOWN rather than FAILED — a token error doesn't mean the
+        # payment itself failed; the caller should keep polling or retry later.
+        return {"status": "UNKNOWN", "message": "Could not get API token"}
       if response.status_code == 200:
         data = response.json()
         raw_status = data.get("status", "FAILED")
@@ -164,6 +189,9 @@ class MTNMoMoService:
           "message": f"Payment {raw_status.lower()}",
         }
       logger.error("Status check failed: %s - %s", response.status_code, response.text)
+      if response.status_code >= 500:
+        # MoMo-side outage: the payment itself is still undecided.
+        return {"status": "UNKNOWN", "message": f"Status check failed ({response.status_code})"}
       return {
         "status": "FAILED",
         "message": f"Status check failed ({response.status_code}): {response.text}",
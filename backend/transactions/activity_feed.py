@@ -0,0 +1,626 @@
+"""
+Write side of the materialised activity feed (`ActivityFeedEntry`).
+
+Every table that records a user's money or unit movements is a feed source.
+`transactions.signals` calls `record_activity(instance)` after each save; the
+MoMo reconciler calls it after its queryset status updates, which bypass
+signals. A source row produces one entry per user it concerns (both parties of
+a unit share), keyed by (user, source, source_id), so later saves refresh the
+same entry in place.
+
+Entries are deduplicated at insert by `reference_key`: a reference already held
+by an entry from a source of equal or higher rank is not shown twice, and an
+entry from a higher-ranked source takes the reference over. Ranks follow the
+order the history has always preferred — TransactionLog first, then MoMo
+payments, the meter ledger, shares, repayments, loan applications and loan
+disbursements. Loan application/disbursement references are namespaced by type
+so they only collide with TransactionLog rows of the same type. TransactionLog
+rows never hide each other: repayments and the completion of one loan are all
+logged under its loan_id, so only the first log registers the reference (to
+hide lower-ranked rows) and later logs with it are stored without a key.
+
+Each insert, refresh or removal also adjusts the user's `ActivityDailyTotal`
+bucket for that UTC day and type in the same transaction, so statement totals
+over a date range never have to scan the feed.
+
+`backfill_activity_feed` rebuilds the feed and the daily totals from the sources.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from typing import Any, Iterable, Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+
+from loan.models import LoanApplication, LoanDisbursement, LoanRepayment
+from meter.models import Transaction as MeterLedgerTransaction
+from share.models import ShareTransaction
+from transactions.models import ActivityDailyTotal, ActivityFeedEntry
+from transactions.models import Transaction as PaymentTransaction
+from transactions.models import TransactionLog, TransactionType
+
+logger = logging.getLogger(__name__)
+
+_ZERO = Decimal("0")
+# Scales of ActivityFeedEntry.amount / .units, so bucket deltas match what is stored.
+_MONEY = Decimal("0.01")
+_UNITS = Decimal("0.0001")
+
+METER_LEDGER_TYPE_MAP = {
+    MeterLedgerTransaction.TYPE_PURCHASE: TransactionType.UNIT_PURCHASE,
+    MeterLedgerTransaction.TYPE_GENERATE_TOKEN: TransactionType.TOKEN_GENERATE,
+    MeterLedgerTransaction.TYPE_TRANSFER_OUT: TransactionType.UNIT_SHARE,
+    MeterLedgerTransaction.TYPE_TRANSFER_IN: TransactionType.UNIT_SHARE,
+    MeterLedgerTransaction.TYPE_REPAYMENT_AUTO: TransactionType.LOAN_REPAYMENT,
+    MeterLedgerTransaction.TYPE_REPAYMENT_DIRECT: TransactionType.LOAN_REPAYMENT,
+    MeterLedgerTransaction.TYPE_CREDIT: TransactionType.UNIT_PURCHASE,
+    MeterLedgerTransaction.TYPE_REFUND: TransactionType.UNIT_PURCHASE,
+}
+
+# Reference types that only dedup against TransactionLog rows of the same type.
+_TYPED_REFERENCES = {TransactionType.LOAN_APPLICATION, TransactionType.LOAN_DISBURSEMENT}
+
+
+def _infer_channel_from_text(text: str | None) -> str | None:
+    if not text:
+        return None
+    upper = text.upper()
+    if "USSD" in upper:
+        return "USSD"
+    return None
+
+
+def _reference_key(transaction_type: str, ref) -> Optional[str]:
+    key = str(ref).strip() if ref is not None else ""
+    if not key:
+        return None
+    if transaction_type in _TYPED_REFERENCES:
+        key = f"{transaction_type}:{key}"
+    return key[:255]
+
+
+def _fields(
+    *,
+    entry_id: str,
+    transaction_type: str,
+    created_at,
+    status: str = "COMPLETED",
+    amount=None,
+    units=None,
+    direction: str = "",
+    reference_id=None,
+    reference_key=None,
+    details: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    return {
+        "entry_id": entry_id,
+        "transaction_type": transaction_type,
+        "created_at": created_at,
+        "status": status,
+        "amount": amount,
+        "units": units,
+        "direction": direction,
+        "reference_id": reference_id,
+        "reference_key": reference_key,
+        "details": details or {},
+    }
+
+
+class _FeedSource:
+    """How one source table maps onto feed entries."""
+
+    name: str
+    rank: int
+    model = None
+    # Saves limited to other fields (save(update_fields=...)) leave the entry as is.
+    watched: frozenset = frozenset()
+    # Rows of this source that share a reference are shown once.
+    dedup_own_refs = True
+
+    def qualifies(self, row) -> bool:
+        return True
+
+    def build(self, row) -> list[tuple[int, dict[str, Any]]]:
+        """(user_id, entry fields) for each user the row belongs to."""
+        raise NotImplementedError
+
+    def backfill_rows(self, user_ids):
+        raise NotImplementedError
+
+
+class _LogSource(_FeedSource):
+    name = ActivityFeedEntry.SOURCE_LOG
+    rank = 6
+    model = TransactionLog
+    watched = frozenset({"transaction_type", "amount", "units", "status", "reference_id", "details"})
+    dedup_own_refs = False  # every log row is shown
+
+    def build(self, log):
+        details = dict(log.details or {})
+        if "channel" not in details:
+            inferred = _infer_channel_from_text(str(details.get("message", "")))
+            if inferred:
+                details["channel"] = inferred
+        direction = str(details.get("direction") or "").upper()
+        return [(
+            log.user_id,
+            _fields(
+                entry_id=f"log-{log.id}",
+                transaction_type=log.transaction_type,
+                created_at=log.created_at,
+                status=log.status,
+                amount=log.amount,
+                units=log.units,
+                direction=direction if direction in ("IN", "OUT") else "",
+                reference_id=log.reference_id,
+                reference_key=_reference_key(log.transaction_type, log.reference_id),
+                details=details,
+            ),
+        )]
+
+    def backfill_rows(self, user_ids):
+        rows = TransactionLog.objects.all()
+        if user_ids is not None:
+            rows = rows.filter(user_id__in=user_ids)
+        return rows.order_by("created_at", "pk")
+
+
+class _PaymentSource(_FeedSource):
+    name = ActivityFeedEntry.SOURCE_PAYMENT
+    rank = 5
+    model = PaymentTransaction
+    watched = frozenset({"amount", "status", "phone_number", "message", "transaction_reference", "wallet"})
+
+    def build(self, pt):
+        ref = pt.transaction_reference or f"PAY-{pt.id}"
+        channel = _infer_channel_from_text(pt.message) or "WEB_PORTAL"
+        return [(
+            pt.wallet.user_id,
+            _fields(
+                entry_id=f"pay-{pt.id}",
+                transaction_type=TransactionType.UNIT_PURCHASE,
+                created_at=pt.create_date,
+                status=(pt.status or "PENDING").upper(),
+                amount=pt.amount,
+                reference_id=ref,
+                reference_key=_reference_key(TransactionType.UNIT_PURCHASE, ref),
+                details={
+                    "channel": channel,
+                    "phone_number": str(pt.phone_number),
+                    "message": pt.message,
+                    "source": "momo_payment",
+                },
+            ),
+        )]
+
+    def backfill_rows(self, user_ids):
+        rows = PaymentTransaction.objects.select_related("wallet")
+        if user_ids is not None:
+            rows = rows.filter(wallet__user_id__in=user_ids)
+        return rows.order_by("create_date", "pk")
+
+
+class _MeterLedgerSource(_FeedSource):
+    name = ActivityFeedEntry.SOURCE_METER
+    rank = 4
+    model = MeterLedgerTransaction
+    watched = frozenset({
+        "transaction_type", "amount_kwh", "amount_ugx", "source", "destination", "meter",
+        "sts_token", "payment_reference", "status", "channel",
+    })
+
+    def build(self, mt):
+        tx_type = METER_LEDGER_TYPE_MAP.get(mt.transaction_type, TransactionType.UNIT_PURCHASE)
+        return [(
+            mt.user_id,
+            _fields(
+                entry_id=f"meter-{mt.transaction_id}",
+                transaction_type=tx_type,
+                created_at=mt.create_date,
+                status=mt.status,
+                amount=mt.amount_ugx or None,
+                units=mt.amount_kwh or None,
+                reference_id=mt.payment_reference or str(mt.transaction_id),
+                # Rows without a payment reference are keyed by their own UUID,
+                # which nothing else references, so they never need dedup.
+                reference_key=_reference_key(tx_type, mt.payment_reference),
+                details={
+                    "channel": mt.channel,
+                    "meter_no": mt.meter.meter_no if mt.meter_id else mt.destination,
+                    "destination": mt.destination,
+                    "source": mt.source,
+                    "sts_token": mt.sts_token or None,
+                    "meter_event_type": mt.transaction_type,
+                },
+            ),
+        )]
+
+    def backfill_rows(self, user_ids):
+        rows = MeterLedgerTransaction.objects.select_related("meter")
+        if user_ids is not None:
+            rows = rows.filter(user_id__in=user_ids)
+        return rows.order_by("create_date", "pk")
+
+
+class _ShareSource(_FeedSource):
+    name = ActivityFeedEntry.SOURCE_SHARE
+    rank = 3
+    model = ShareTransaction
+    watched = frozenset({"status", "units", "message", "verified_at"})
+
+    def qualifies(self, share):
+        return share.status == "COMPLETED"
+
+    def build(self, share):
+        channel = _infer_channel_from_text(share.message) or "WEB_PORTAL"
+        parties = [(share.sender_id, True)]
+        if share.receiver_id != share.sender_id:
+            parties.append((share.receiver_id, False))
+        built = []
+        for user_id, is_sender in parties:
+            built.append((
+                user_id,
+                _fields(
+                    entry_id=f"share-{share.id}",
+                    transaction_type=TransactionType.UNIT_SHARE,
+                    created_at=share.verified_at or share.create_date,
+                    status=share.status,
+                    units=share.units,
+                    direction="OUT" if is_sender else "IN",
+                    reference_id=share.share_transaction_id,
+                    reference_key=_reference_key(TransactionType.UNIT_SHARE, share.share_transaction_id),
+                    details={
+                        "channel": channel,
+                        "direction": "OUT" if is_sender else "IN",
+                        "counterparty": share.receiver.email if is_sender else share.sender.email,
+                        "receiver_meter": share.meter_receive.meter_no if share.meter_receive_id else None,
+                        "sender_meter": share.meter_send.meter_no if share.meter_send_id else None,
+                        "message": share.message,
+                    },
+                ),
+            ))
+        return built
+
+    def backfill_rows(self, user_ids):
+        rows = ShareTransaction.objects.filter(status="COMPLETED").select_related(
+            "meter_send", "meter_receive", "sender", "receiver"
+        )
+        if user_ids is not None:
+            rows = rows.filter(Q(sender_id__in=user_ids) | Q(receiver_id__in=user_ids))
+        return rows.order_by("create_date", "pk")
+
+
+class _RepaymentSource(_FeedSource):
+    name = ActivityFeedEntry.SOURCE_REPAYMENT
+    rank = 2
+    model = LoanRepayment
+    watched = frozenset({
+        "amount_paid", "units_paid", "payment_reference", "payment_method",
+        "payment_status", "momo_external_id",
+    })
+
+    def qualifies(self, repayment):
+        return repayment.payment_status == "SUCCESS"
+
+    def build(self, repayment):
+        channel = repayment.payment_method or "WEB_PORTAL"
+        if repayment.momo_external_id:
+            channel = "MOBILE_MONEY"
+        loan = repayment.loan
+        return [(
+            loan.user_id,
+            _fields(
+                entry_id=f"loanrepay-{repayment.id}",
+                transaction_type=TransactionType.LOAN_REPAYMENT,
+                created_at=repayment.payment_date,
+                status="COMPLETED",
+                amount=repayment.amount_paid,
+                units=repayment.units_paid,
+                reference_id=repayment.payment_reference,
+                reference_key=_reference_key(TransactionType.LOAN_REPAYMENT, repayment.payment_reference),
+                details={
+                    "channel": channel,
+                    "loan_id": loan.loan_id,
+                    "payment_method": repayment.payment_method,
+                    "auto_from_purchase": "buy_units" in (repayment.payment_reference or "").lower(),
+                },
+            ),
+        )]
+
+    def backfill_rows(self, user_ids):
+        rows = LoanRepayment.objects.filter(payment_status="SUCCESS").select_related("loan")
+        if user_ids is not None:
+            rows = rows.filter(loan__user_id__in=user_ids)
+        return rows.order_by("payment_date", "pk")
+
+
+class _LoanApplicationSource(_FeedSource):
+    name = ActivityFeedEntry.SOURCE_LOAN_APPLICATION
+    rank = 1
+    model = LoanApplication
+    watched = frozenset({"loan_id", "status", "amount_requested", "amount_approved", "purpose", "loan_tier"})
+
+    def build(self, loan):
+        return [(
+            loan.user_id,
+            _fields(
+                entry_id=f"loanapp-{loan.id}",
+                transaction_type=TransactionType.LOAN_APPLICATION,
+                created_at=loan.created_at,
+                status=loan.status,
+                amount=loan.amount_requested,
+                reference_id=loan.loan_id,
+                reference_key=_reference_key(TransactionType.LOAN_APPLICATION, loan.loan_id),
+                details={
+                    "amount_approved": float(loan.amount_approved) if loan.amount_approved else None,
+                    "purpose": loan.purpose,
+                    "loan_tier": loan.loan_tier,
+                },
+            ),
+        )]
+
+    def backfill_rows(self, user_ids):
+        rows = LoanApplication.objects.all()
+        if user_ids is not None:
+            rows = rows.filter(user_id__in=user_ids)
+        return rows.order_by("created_at", "pk")
+
+
+class _LoanDisbursementSource(_FeedSource):
+    name = ActivityFeedEntry.SOURCE_LOAN_DISBURSEMENT
+    rank = 0
+    model = LoanDisbursement
+    watched = frozenset({"disbursed_amount", "units_disbursed", "meter", "loan_application"})
+
+    def build(self, disb):
+        loan = disb.loan_application
+        return [(
+            loan.user_id,
+            _fields(
+                entry_id=f"loandisb-{disb.id}",
+                transaction_type=TransactionType.LOAN_DISBURSEMENT,
+                created_at=disb.created_at,
+                status="COMPLETED",
+                amount=disb.disbursed_amount,
+                units=disb.units_disbursed,
+                reference_id=loan.loan_id,
+                reference_key=_reference_key(TransactionType.LOAN_DISBURSEMENT, loan.loan_id),
+                details={
+                    "loan_id": loan.loan_id,
+                    "meter_no": disb.meter.meter_no if disb.meter_id else None,
+                },
+            ),
+        )]
+
+    def backfill_rows(self, user_ids):
+        rows = LoanDisbursement.objects.select_related("loan_application", "meter")
+        if user_ids is not None:
+            rows = rows.filter(loan_application__user_id__in=user_ids)
+        return rows.order_by("created_at", "pk")
+
+
+# Highest rank first.
+SOURCES = (
+    _LogSource(),
+    _PaymentSource(),
+    _MeterLedgerSource(),
+    _ShareSource(),
+    _RepaymentSource(),
+    _LoanApplicationSource(),
+    _LoanDisbursementSource(),
+)
+FEED_MODELS = tuple(source.model for source in SOURCES)
+_BY_MODEL = {source.model: source for source in SOURCES}
+
+
+def entry_totals(transaction_type, direction, amount, units) -> tuple[Decimal, Decimal, Decimal, Decimal]:
+    """
+    (money_in, money_out, units_in, units_out) an entry adds to a statement:
+    disbursements bring money in; purchases and repayments send it out. Units
+    come in with purchases, disbursements and incoming shares, and go out with
+    tokens, AMI loads, repayments and outgoing shares.
+    """
+    tx_type = str(transaction_type or "")
+    direction = str(direction or "").upper()
+    amount = Decimal(str(amount)).quantize(_MONEY) if amount is not None else _ZERO
+    units = Decimal(str(units)).quantize(_UNITS) if units is not None else _ZERO
+    money_in = amount if tx_type == TransactionType.LOAN_DISBURSEMENT else _ZERO
+    money_out = amount if tx_type in (TransactionType.UNIT_PURCHASE, TransactionType.LOAN_REPAYMENT) else _ZERO
+    units_in = units_out = _ZERO
+    if tx_type == TransactionType.UNIT_SHARE:
+        if direction == "IN":
+            units_in = units
+        elif direction == "OUT":
+            units_out = units
+    elif tx_type in (TransactionType.UNIT_PURCHASE, TransactionType.LOAN_DISBURSEMENT):
+        units_in = units
+    elif tx_type in (TransactionType.TOKEN_GENERATE, TransactionType.WALLET_LOAD_AMI, TransactionType.LOAN_REPAYMENT):
+        units_out = units
+    return money_in, money_out, units_in, units_out
+
+
+def _totals_state(values) -> tuple:
+    """What an entry contributes to ActivityDailyTotal: (day, type, totals)."""
+    return (
+        values["created_at"].astimezone(dt_timezone.utc).date(),
+        values["transaction_type"],
+        entry_totals(values["transaction_type"], values["direction"], values["amount"], values["units"]),
+    )
+
+
+def _entry_values(entry: ActivityFeedEntry) -> dict[str, Any]:
+    return {name: getattr(entry, name) for name in ("created_at", "transaction_type", "direction", "amount", "units")}
+
+
+def _bump_totals(user_id: int, state: tuple, sign: int) -> None:
+    """Add (sign=1) or remove (sign=-1) one entry's contribution to its day bucket."""
+    day, tx_type, (money_in, money_out, units_in, units_out) = state
+    deltas = {
+        "entry_count": sign,
+        "money_in": sign * money_in,
+        "money_out": sign * money_out,
+        "units_in": sign * units_in,
+        "units_out": sign * units_out,
+    }
+    bucket = ActivityDailyTotal.objects.filter(user_id=user_id, day=day, transaction_type=tx_type)
+    increments = {name: F(name) + value for name, value in deltas.items()}
+    if bucket.update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            ActivityDailyTotal.objects.create(user_id=user_id, day=day, transaction_type=tx_type, **deltas)
+    except IntegrityError:
+        # Another writer created the bucket first; fall through to the increment.
+        bucket.update(**increments)
+
+
+def _store(source: _FeedSource, source_id: int, user_id: int, fields: dict[str, Any]) -> None:
+    entries = ActivityFeedEntry.objects.select_for_update()
+    own = entries.filter(user_id=user_id, source=source.name, source_id=source_id).first()
+    key = fields["reference_key"]
+    if key:
+        holder = entries.filter(user_id=user_id, reference_key=key)
+        if own is not None:
+            holder = holder.exclude(pk=own.pk)
+        holder = holder.first()
+        if holder is not None:
+            if holder.source == source.name and not source.dedup_own_refs:
+                # Another row of this source holds the reference; show this one unkeyed.
+                fields = {**fields, "reference_key": None}
+            elif holder.rank >= source.rank:
+                # Already shown by an equal or higher-priority source.
+                if own is not None:
+                    own.delete()
+                    _bump_totals(user_id, _totals_state(_entry_values(own)), -1)
+                return
+            else:
+                holder.delete()
+                _bump_totals(user_id, _totals_state(_entry_values(holder)), -1)
+
+    new_state = _totals_state(fields)
+    if own is not None:
+        old_state = _totals_state(_entry_values(own))
+        for name, value in fields.items():
+            setattr(own, name, value)
+        own.save(update_fields=list(fields))
+        if old_state != new_state:
+            _bump_totals(user_id, old_state, -1)
+            _bump_totals(user_id, new_state, 1)
+        return
+    ActivityFeedEntry.objects.create(
+        user_id=user_id, source=source.name, source_id=source_id, rank=source.rank, **fields
+    )
+    _bump_totals(user_id, new_state, 1)
+
+
+def record_activity(instance, update_fields: Optional[Iterable[str]] = None) -> None:
+    """
+    Add or refresh the feed entries for one saved source row. Failures are logged
+    and rolled back to a savepoint so they never break the caller's transaction;
+    `backfill_activity_feed` repairs anything missed.
+    """
+    source = _BY_MODEL.get(type(instance))
+    if source is None or not instance.pk:
+        return
+    if update_fields and source.watched.isdisjoint(update_fields):
+        return
+    if not source.qualifies(instance):
+        return
+    try:
+        with transaction.atomic():
+            for user_id, fields in source.build(instance):
+                try:
+                    with transaction.atomic():
+                        _store(source, instance.pk, user_id, fields)
+                except IntegrityError:
+                    # A concurrent writer inserted the same row or reference; retry once.
+                    _store(source, instance.pk, user_id, fields)
+    except Exception:
+        logger.exception("Activity feed update failed for %s pk=%s", source.name, instance.pk)
+
+
+def backfill_activity_feed(user_ids: Optional[Iterable[int]] = None, batch_size: int = 1000) -> int:
+    """
+    Rebuild feed entries from the source tables (all users, or only `user_ids`).
+    Sources are read in rank order, each oldest first, which gives the same
+    dedup outcome as the live hooks. Returns the number of entries written.
+    """
+    user_ids = set(user_ids) if user_ids is not None else None
+    # (user_id, reference_key) → name of the source that registered it.
+    seen_keys: dict[tuple[int, str], str] = {}
+    rows: list[ActivityFeedEntry] = []
+    for source in SOURCES:
+        for row in source.backfill_rows(user_ids).iterator(chunk_size=batch_size):
+            if not source.qualifies(row):
+                continue
+            for user_id, fields in source.build(row):
+                if user_ids is not None and user_id not in user_ids:
+                    continue
+                key = fields["reference_key"]
+                holder = seen_keys.get((user_id, key)) if key else None
+                if holder is None:
+                    if key:
+                        seen_keys[(user_id, key)] = source.name
+                elif holder == source.name and not source.dedup_own_refs:
+                    fields = {**fields, "reference_key": None}
+                else:
+                    continue
+                rows.append(
+                    ActivityFeedEntry(
+                        user_id=user_id, source=source.name, source_id=row.pk, rank=source.rank, **fields
+                    )
+                )
+
+    existing = ActivityFeedEntry.objects.all()
+    existing_totals = ActivityDailyTotal.objects.all()
+    if user_ids is not None:
+        existing = existing.filter(user_id__in=user_ids)
+        existing_totals = existing_totals.filter(user_id__in=user_ids)
+    with transaction.atomic():
+        existing.delete()
+        ActivityFeedEntry.objects.bulk_create(rows, batch_size=batch_size)
+        existing_totals.delete()
+        ActivityDailyTotal.objects.bulk_create(_daily_totals(user_ids), batch_size=batch_size)
+    logger.info("Backfilled %d activity feed entries", len(rows))
+    return len(rows)
+
+
+def _daily_totals(user_ids: Optional[set[int]]) -> list[ActivityDailyTotal]:
+    """Daily buckets recomputed from the feed as it stands."""
+    entries = ActivityFeedEntry.objects.all()
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+    grouped = (
+        entries.annotate(day=TruncDate("created_at", tzinfo=dt_timezone.utc))
+        .values("user_id", "day", "transaction_type", "direction")
+        .annotate(n=Count("pk"), amount_sum=Sum("amount"), units_sum=Sum("units"))
+        .order_by()
+    )
+    buckets: dict[tuple, ActivityDailyTotal] = {}
+    for row in grouped:
+        key = (row["user_id"], row["day"], row["transaction_type"])
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = ActivityDailyTotal(
+                user_id=row["user_id"],
+                day=row["day"],
+                transaction_type=row["transaction_type"],
+                entry_count=0,
+                money_in=_ZERO,
+                money_out=_ZERO,
+                units_in=_ZERO,
+                units_out=_ZERO,
+            )
+        money_in, money_out, units_in, units_out = entry_totals(
+            row["transaction_type"], row["direction"], row["amount_sum"], row["units_sum"]
+        )
+        bucket.entry_count += row["n"]
+        bucket.money_in += money_in
+        bucket.money_out += money_out
+        bucket.units_in += units_in
+        bucket.units_out += units_out
+    return list(buckets.values())
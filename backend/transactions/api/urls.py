@@ -1,5 +1,5 @@
-from django.urls import path
-from .views import BuyUnitsView, TransactionHistoryView, TransactionStatementEmailView
+from django.urls import path, re_path
+from .views import BuyUnitsView, TransactionHistoryView, TransactionStatementEmailView, TransactionStatementExportView
 
 
 
@@ -9,4 +9,5 @@ urlpatterns = [
     path('buy-units/', BuyUnitsView.as_view(), name="buy-units"),
     path('history/', TransactionHistoryView.as_view(), name="transaction-history"),
     path('statement/email/', TransactionStatementEmailView.as_view(), name="transaction-statement-email"),
+    re_path(r'^statement/export/(?P<file_format>csv|pdf)/$', TransactionStatementExportView.as_view(), name="transaction-statement-export"),
 ]
\ No newline at end of file
@@ -4,7 +4,7 @@ from datetime import date
 from decimal import Decimal
 from django.utils.timezone import now
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from meter.models import Meter, MeterToken, generate_random_string
 from transactions.models import UnitTransaction, TransactionLog, TransactionType
 from .serializers import BuyUnitSerializer
@@ -19,7 +19,14 @@ import uuid
 from rest_framework.views import APIView
 from django.db.models import Q
 from datetime import datetime
-from transactions.unified_history import collect_unified_history, filter_history, paginate_history, summarize_history
+from transactions.unified_history import (
+    InvalidCursor,
+    history_page,
+    iter_history,
+    parse_history_filters,
+    summarize_history,
+)
+from transactions.statements import iter_statement_csv, iter_statement_pdf
 from transactions.tasks import handle_send_transaction_statement_email
 from utils.general import dispatch_task
 
@@ -33,28 +40,33 @@ class TransactionHistoryView(APIView):
             transaction_type = request.query_params.get('type')
             start_date = request.query_params.get('start_date')
             end_date = request.query_params.get('end_date')
+            cursor = request.query_params.get('cursor') or None
             page = int(request.query_params.get('page', 1))
-            page_size = int(request.query_params.get('page_size', 5))
+            page_size = min(int(request.query_params.get('page_size', 5)), 500)
 
-            entries = collect_unified_history(user)
-            entries = filter_history(
-                entries,
+            filters = parse_history_filters(
                 transaction_type=transaction_type,
                 start_date=start_date,
                 end_date=end_date,
             )
-            summary = summarize_history(entries)
-            page_entries, total = paginate_history(entries, page, page_size)
-
-            return Response({
+            result = history_page(user, filters, page_size=page_size, cursor=cursor, page=page)
+            payload = {
                 'success': True,
-                'total': total,
                 'page': page,
                 'page_size': page_size,
-                'transactions': page_entries,
-                'summary': summary,
-            }, status=status.HTTP_200_OK)
-
+                'transactions': result['transactions'],
+                'has_more': result['has_more'],
+                'next_cursor': result['next_cursor'],
+            }
+            # Totals cover the whole filtered range; cursor pages reuse the first page's.
+            if not cursor:
+                summary = summarize_history(user, filters)
+                payload['total'] = summary['transactions_count']
+                payload['summary'] = summary
+            return Response(payload, status=status.HTTP_200_OK)
+
+        except InvalidCursor:
+            return Response({'error': 'Invalid cursor.'}, status=400)
         except ValueError as ve:
             logger.warning(f"Invalid filter params: {str(ve)}")
             return Response({'error': 'Invalid date format. Use YYYY-MM-DD.'}, status=400)
@@ -89,6 +101,43 @@ class TransactionStatementEmailView(APIView):
             status=status.HTTP_200_OK,
         )
 
+
+class TransactionStatementExportView(APIView):
+    """Download the filtered history as CSV or PDF, streamed straight from the activity feed."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, file_format):
+        user = request.user
+        start_date = request.query_params.get('start_date') or None
+        end_date = request.query_params.get('end_date') or None
+        try:
+            filters = parse_history_filters(
+                transaction_type=request.query_params.get('type'),
+                start_date=start_date,
+                end_date=end_date,
+            )
+        except ValueError:
+            return Response({'error': 'Invalid date format. Use YYYY-MM-DD.'}, status=400)
+
+        entries = iter_history(user, filters)
+        filename = f"gpawa-statement-{start_date or 'all'}-to-{end_date or 'now'}.{file_format}"
+        if file_format == 'csv':
+            response = StreamingHttpResponse(iter_statement_csv(entries), content_type='text/csv')
+        else:
+            response = StreamingHttpResponse(
+                iter_statement_pdf(
+                    user_email=user.email,
+                    start_date=start_date or 'All time',
+                    end_date=end_date or 'Now',
+                    summary=summarize_history(user, filters),
+                    entries=entries,
+                ),
+                content_type='application/pdf',
+            )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
 def is_start_of_new_month():
     today = now().date()
     return today.day == 1 
@@ -0,0 +1,141 @@
+"""
+Per-user monthly consumption counters (`MonthlyConsumption`).
+
+Tier placement and the once-a-month service charge depend on how many kWh a
+user has bought this calendar month. Rather than summing `UnitTransaction` and
+`meter.Transaction` on every bill, purchases adjust a `(user, year_month)` row
+inside the same atomic block that records them.
+
+A purchase counts when it is either:
+  - a COMPLETED self-credit `UnitTransaction` (sender == receiver, direction IN), or
+  - a COMPLETED `meter.Transaction` of type PURCHASE.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import date
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from transactions.models import MonthlyConsumption
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(value) -> date:
+    """First day of the month `value` (date or aware datetime) falls in, in local time."""
+    if hasattr(value, "tzinfo") and hasattr(value, "hour"):
+        value = timezone.localtime(value) if timezone.is_aware(value) else value
+        value = value.date()
+    return value.replace(day=1)
+
+
+def unit_transaction_counts(tx) -> bool:
+    return (
+        tx.sender_id is not None
+        and tx.sender_id == tx.receiver_id
+        and tx.direction == "IN"
+        and tx.status == "COMPLETED"
+    )
+
+
+def meter_transaction_counts(tx) -> bool:
+    return tx.transaction_type == "PURCHASE" and tx.status == "COMPLETED"
+
+
+def apply_consumption_delta(user_id, when, units: Decimal, purchases: int) -> None:
+    """Add `units` kWh (negative to reverse) to the user's bucket for the month of `when`."""
+    units = Decimal(str(units or 0))
+    if not units and not purchases:
+        return
+
+    bucket = month_start(when or timezone.now())
+    qs = MonthlyConsumption.objects.filter(user_id=user_id, year_month=bucket)
+    with transaction.atomic():
+        updated = qs.update(
+            units_purchased=F("units_purchased") + units,
+            purchase_count=F("purchase_count") + purchases,
+        )
+        if not updated:
+            try:
+                with transaction.atomic():
+                    MonthlyConsumption.objects.create(
+                        user_id=user_id,
+                        year_month=bucket,
+                        units_purchased=units,
+                        purchase_count=max(purchases, 0),
+                        service_charge_paid=units > 0,
+                    )
+                return
+            except IntegrityError:
+                # Another purchase created the row first; fall through to the increment.
+                qs.update(
+                    units_purchased=F("units_purchased") + units,
+                    purchase_count=F("purchase_count") + purchases,
+                )
+        qs.filter(units_purchased__gt=0, service_charge_paid=False).update(service_charge_paid=True)
+        qs.filter(units_purchased__lte=0, service_charge_paid=True).update(service_charge_paid=False)
+
+
+def get_month_consumption(user, month_date: Optional[date] = None) -> Optional[MonthlyConsumption]:
+    """Single indexed lookup of the user's counter row (None if nothing bought this month)."""
+    bucket = month_start(month_date or timezone.localdate())
+    return MonthlyConsumption.objects.filter(user=user, year_month=bucket).first()
+
+
+def rebuild_monthly_consumption(user_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recompute counters from purchase history (all users, or only `user_ids`).
+    Returns the number of (user, month) rows written.
+    """
+    from meter.models import Transaction as MeterTransaction
+    from transactions.models import UnitTransaction
+
+    unit_qs = UnitTransaction.objects.filter(
+        sender_id=F("receiver_id"), direction="IN", status="COMPLETED"
+    )
+    meter_qs = MeterTransaction.objects.filter(
+        transaction_type=MeterTransaction.TYPE_PURCHASE,
+        status=MeterTransaction.STATUS_COMPLETED,
+    )
+    existing = MonthlyConsumption.objects.all()
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        unit_qs = unit_qs.filter(sender_id__in=user_ids)
+        meter_qs = meter_qs.filter(user_id__in=user_ids)
+        existing = existing.filter(user_id__in=user_ids)
+
+    totals: dict[tuple[int, date], list] = {}
+    grouped = [
+        unit_qs.annotate(month=TruncMonth("create_date")).values("sender_id", "month")
+        .annotate(units=Sum("units"), n=Count("id")).values_list("sender_id", "month", "units", "n"),
+        meter_qs.annotate(month=TruncMonth("create_date")).values("user_id", "month")
+        .annotate(units=Sum("amount_kwh"), n=Count("id")).values_list("user_id", "month", "units", "n"),
+    ]
+    for rows in grouped:
+        for user_id, month, units, count in rows.iterator():
+            key = (user_id, month_start(month))
+            bucket = totals.setdefault(key, [Decimal("0"), 0])
+            bucket[0] += Decimal(str(units or 0))
+            bucket[1] += int(count or 0)
+
+    rows = [
+        MonthlyConsumption(
+            user_id=user_id,
+            year_month=month,
+            units_purchased=units.quantize(Decimal("0.0001")),
+            purchase_count=count,
+            service_charge_paid=units > 0,
+        )
+        for (user_id, month), (units, count) in totals.items()
+    ]
+    with transaction.atomic():
+        existing.delete()
+        MonthlyConsumption.objects.bulk_create(rows, batch_size=1000)
+    logger.info("Rebuilt %d monthly consumption rows", len(rows))
+    return len(rows)
@@ -0,0 +1,37 @@
+"""
+Rebuild the activity feed (transaction history) and its daily totals from the
+source tables.
+
+Run once after deploying the feed, and after bulk data fixes:
+    python manage.py backfill_activity_feed
+    python manage.py backfill_activity_feed --user 42 --user 43
+"""
+from django.core.management.base import BaseCommand
+
+from transactions.activity_feed import backfill_activity_feed
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild ActivityFeedEntry rows (and ActivityDailyTotal buckets) from TransactionLog, "
+        "payments, the meter ledger, shares and loans"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            action="append",
+            type=int,
+            dest="user_ids",
+            help="Limit the rebuild to this user id (repeatable)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows read and inserted per batch (default 1000)",
+        )
+
+    def handle(self, *args, **options):
+        written = backfill_activity_feed(options.get("user_ids"), batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {written} activity feed entries."))
@@ -0,0 +1,27 @@
+"""
+Rebuild MonthlyConsumption counters from purchase history.
+
+Run after bulk data fixes or if counters are suspected to have drifted:
+    python manage.py rebuild_monthly_consumption
+    python manage.py rebuild_monthly_consumption --user 42 --user 43
+"""
+from django.core.management.base import BaseCommand
+
+from transactions.consumption import rebuild_monthly_consumption
+
+
+class Command(BaseCommand):
+    help = "Recompute per-user monthly kWh counters from UnitTransaction and meter.Transaction"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            action="append",
+            type=int,
+            dest="user_ids",
+            help="Limit the rebuild to this user id (repeatable)",
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild_monthly_consumption(options.get("user_ids"))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} monthly consumption rows."))
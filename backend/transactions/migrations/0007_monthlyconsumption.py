@@ -0,0 +1,74 @@
+# Generated by Django 5.2 on 2026-10-17 22:44
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+
+def backfill_monthly_consumption(apps, schema_editor):
+    """Seed counters from history so existing month-to-date totals survive the switch."""
+    UnitTransaction = apps.get_model('transactions', 'UnitTransaction')
+    MeterTransaction = apps.get_model('meter', 'Transaction')
+    MonthlyConsumption = apps.get_model('transactions', 'MonthlyConsumption')
+
+    grouped = [
+        UnitTransaction.objects.filter(sender_id=F('receiver_id'), direction='IN', status='COMPLETED')
+        .annotate(month=TruncMonth('create_date')).values('sender_id', 'month')
+        .annotate(units=Sum('units'), n=Count('id')).values_list('sender_id', 'month', 'units', 'n'),
+        MeterTransaction.objects.filter(transaction_type='PURCHASE', status='COMPLETED')
+        .annotate(month=TruncMonth('create_date')).values('user_id', 'month')
+        .annotate(units=Sum('amount_kwh'), n=Count('id')).values_list('user_id', 'month', 'units', 'n'),
+    ]
+    totals = {}
+    for rows in grouped:
+        for user_id, month, units, count in rows:
+            key = (user_id, month.date().replace(day=1))
+            bucket = totals.setdefault(key, [Decimal('0'), 0])
+            bucket[0] += Decimal(str(units or 0))
+            bucket[1] += count
+
+    MonthlyConsumption.objects.bulk_create(
+        [
+            MonthlyConsumption(
+                user_id=user_id,
+                year_month=month,
+                units_purchased=units.quantize(Decimal('0.0001')),
+                purchase_count=count,
+                service_charge_paid=units > 0,
+            )
+            for (user_id, month), (units, count) in totals.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0006_alter_transactionlog_transaction_type'),
+        ('meter', '0022_alter_meternotification_notification_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyConsumption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year_month', models.DateField(help_text='First day of the calendar month')),
+                ('units_purchased', models.DecimalField(decimal_places=4, default=0, max_digits=20)),
+                ('purchase_count', models.IntegerField(default=0)),
+                ('service_charge_paid', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_consumption', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'year_month'), name='uniq_monthly_consumption_user_month')],
+            },
+        ),
+        migrations.RunPython(backfill_monthly_consumption, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-17 23:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0018_user_phone_lookup_keys'),
+        ('transactions', '0007_monthlyconsumption'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='next_status_check_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='status_checks',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['next_status_check_at'], name='txn_pending_next_check_idx'),
+        ),
+    ]
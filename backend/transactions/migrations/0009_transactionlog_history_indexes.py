@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 23:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0008_momo_reconciliation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transactionlog',
+            index=models.Index(fields=['user', 'created_at'], name='txnlog_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionlog',
+            index=models.Index(fields=['user', 'reference_id'], name='txnlog_user_ref_idx'),
+        ),
+    ]
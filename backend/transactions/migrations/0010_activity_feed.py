@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-17 23:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0009_transactionlog_history_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityFeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('log', 'Transaction log'), ('payment', 'MoMo payment'), ('meter', 'Meter ledger'), ('share', 'Unit share'), ('repayment', 'Loan repayment'), ('loan_application', 'Loan application'), ('loan_disbursement', 'Loan disbursement')], max_length=20)),
+                ('source_id', models.BigIntegerField()),
+                ('rank', models.PositiveSmallIntegerField(help_text='Dedup priority of the source; higher wins')),
+                ('entry_id', models.CharField(max_length=64)),
+                ('transaction_type', models.CharField(choices=[('WALLET_DEPOSIT', 'Wallet Deposit'), ('WALLET_WITHDRAWAL', 'Wallet Withdrawal'), ('LOAN_APPLICATION', 'Loan Application'), ('LOAN_APPROVAL', 'Loan Approval'), ('LOAN_DISBURSEMENT', 'Loan Disbursement'), ('LOAN_REPAYMENT', 'Loan Repayment'), ('LOAN_COMPLETION', 'Loan Completion'), ('UNIT_PURCHASE', 'Unit Purchase'), ('UNIT_SHARE', 'Unit Share'), ('UNIT_TRANSFER', 'Unit Transfer'), ('TOKEN_GENERATE', 'STS Token Generated'), ('WALLET_LOAD_AMI', 'Wallet Load (AMI)')], max_length=50)),
+                ('status', models.CharField(max_length=20)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ('units', models.DecimalField(blank=True, decimal_places=4, max_digits=20, null=True)),
+                ('direction', models.CharField(blank=True, default='', max_length=3)),
+                ('reference_id', models.TextField(blank=True, null=True)),
+                ('reference_key', models.CharField(blank=True, max_length=255, null=True)),
+                ('details', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(help_text='When the transaction happened (history sort key)')),
+                ('recorded_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_feed', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at'], name='feed_user_created_idx'), models.Index(fields=['user', 'transaction_type', 'created_at'], name='feed_user_type_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'source', 'source_id'), name='uniq_feed_user_source_row'), models.UniqueConstraint(condition=models.Q(('reference_key__isnull', False)), fields=('user', 'reference_key'), name='uniq_feed_user_reference')],
+            },
+        ),
+    ]
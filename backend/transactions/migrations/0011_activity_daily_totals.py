@@ -0,0 +1,91 @@
+# Generated by Django 5.2 on 2026-10-17 23:26
+
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+MONEY_IN_TYPES = {'LOAN_DISBURSEMENT'}
+MONEY_OUT_TYPES = {'UNIT_PURCHASE', 'LOAN_REPAYMENT'}
+UNITS_IN_TYPES = {'UNIT_PURCHASE', 'LOAN_DISBURSEMENT'}
+UNITS_OUT_TYPES = {'TOKEN_GENERATE', 'WALLET_LOAD_AMI', 'LOAN_REPAYMENT'}
+
+
+def backfill_daily_totals(apps, schema_editor):
+    """Seed daily buckets from the existing feed so period summaries survive the switch."""
+    ActivityFeedEntry = apps.get_model('transactions', 'ActivityFeedEntry')
+    ActivityDailyTotal = apps.get_model('transactions', 'ActivityDailyTotal')
+
+    grouped = (
+        ActivityFeedEntry.objects.annotate(day=TruncDate('created_at', tzinfo=dt_timezone.utc))
+        .values('user_id', 'day', 'transaction_type', 'direction')
+        .annotate(n=Count('id'), amount=Sum('amount'), units=Sum('units'))
+        .order_by()
+    )
+    totals = {}
+    for row in grouped:
+        tx_type = row['transaction_type']
+        direction = (row['direction'] or '').upper()
+        amount = row['amount'] or Decimal('0')
+        units = row['units'] or Decimal('0')
+        bucket = totals.setdefault(
+            (row['user_id'], row['day'], tx_type),
+            {'entry_count': 0, 'money_in': Decimal('0'), 'money_out': Decimal('0'),
+             'units_in': Decimal('0'), 'units_out': Decimal('0')},
+        )
+        bucket['entry_count'] += row['n']
+        if tx_type in MONEY_IN_TYPES:
+            bucket['money_in'] += amount
+        elif tx_type in MONEY_OUT_TYPES:
+            bucket['money_out'] += amount
+        if tx_type == 'UNIT_SHARE':
+            if direction == 'IN':
+                bucket['units_in'] += units
+            elif direction == 'OUT':
+                bucket['units_out'] += units
+        elif tx_type in UNITS_IN_TYPES:
+            bucket['units_in'] += units
+        elif tx_type in UNITS_OUT_TYPES:
+            bucket['units_out'] += units
+
+    ActivityDailyTotal.objects.bulk_create(
+        [
+            ActivityDailyTotal(user_id=user_id, day=day, transaction_type=tx_type, **values)
+            for (user_id, day, tx_type), values in totals.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0010_activity_feed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityDailyTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text="UTC date of the entries' created_at")),
+                ('transaction_type', models.CharField(choices=[('WALLET_DEPOSIT', 'Wallet Deposit'), ('WALLET_WITHDRAWAL', 'Wallet Withdrawal'), ('LOAN_APPLICATION', 'Loan Application'), ('LOAN_APPROVAL', 'Loan Approval'), ('LOAN_DISBURSEMENT', 'Loan Disbursement'), ('LOAN_REPAYMENT', 'Loan Repayment'), ('LOAN_COMPLETION', 'Loan Completion'), ('UNIT_PURCHASE', 'Unit Purchase'), ('UNIT_SHARE', 'Unit Share'), ('UNIT_TRANSFER', 'Unit Transfer'), ('TOKEN_GENERATE', 'STS Token Generated'), ('WALLET_LOAD_AMI', 'Wallet Load (AMI)')], max_length=50)),
+                ('entry_count', models.IntegerField(default=0)),
+                ('money_in', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('money_out', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('units_in', models.DecimalField(decimal_places=4, default=0, max_digits=20)),
+                ('units_out', models.DecimalField(decimal_places=4, default=0, max_digits=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_daily_totals', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'day', 'transaction_type'), name='uniq_activity_total_user_day_type')],
+            },
+        ),
+        migrations.RunPython(backfill_daily_totals, migrations.RunPython.noop),
+    ]
@@ -58,6 +58,19 @@ class Transaction(TimestampMixin):
     phone_number = PhoneNumberField(blank=False, null=False)
     message = models.TextField(null=True, blank=True)
     transaction_reference = models.TextField(null=True, blank=True)
+    # MoMo status reconciliation (transactions.momo_reconciliation): polls so far
+    # and when the pending payment is next due for a check.
+    status_checks = models.PositiveSmallIntegerField(default=0)
+    next_status_check_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['next_status_check_at'],
+                condition=models.Q(status=PENDING),
+                name='txn_pending_next_check_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.transaction_id} - {self.wallet}"
@@ -86,5 +99,121 @@ class TransactionLog(models.Model):
     details = models.JSONField(null=True, blank=True) 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='txnlog_user_created_idx'),
+            models.Index(fields=['user', 'reference_id'], name='txnlog_user_ref_idx'),
+        ]
+
     def __str__(self):
         return f"{self.transaction_type} - {self.user.username} - {self.created_at}"
+
+
+class MonthlyConsumption(models.Model):
+    """
+    Materialised month-to-date kWh per user — the input to ERA tier placement and
+    the monthly service charge. Maintained in the same DB transaction as each
+    COMPLETED purchase by `transactions.signals`; rebuild with
+    `python manage.py rebuild_monthly_consumption`.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_consumption')
+    year_month = models.DateField(help_text="First day of the calendar month")
+    units_purchased = models.DecimalField(max_digits=20, decimal_places=4, default=0)
+    purchase_count = models.IntegerField(default=0)
+    service_charge_paid = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'year_month'], name='uniq_monthly_consumption_user_month'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.year_month:%Y-%m}: {self.units_purchased} kWh"
+
+
+class ActivityFeedEntry(models.Model):
+    """
+    Materialised transaction history: one row per history item per user, written
+    by `transactions.signals` as the source rows are saved (see
+    `transactions.activity_feed`). Rows are only appended or refreshed from their
+    source; a reference seen twice keeps the entry from the higher-ranked source.
+    Rebuild with `python manage.py backfill_activity_feed`.
+    """
+    SOURCE_LOG = 'log'
+    SOURCE_PAYMENT = 'payment'
+    SOURCE_METER = 'meter'
+    SOURCE_SHARE = 'share'
+    SOURCE_REPAYMENT = 'repayment'
+    SOURCE_LOAN_APPLICATION = 'loan_application'
+    SOURCE_LOAN_DISBURSEMENT = 'loan_disbursement'
+
+    SOURCE_CHOICES = [
+        (SOURCE_LOG, 'Transaction log'),
+        (SOURCE_PAYMENT, 'MoMo payment'),
+        (SOURCE_METER, 'Meter ledger'),
+        (SOURCE_SHARE, 'Unit share'),
+        (SOURCE_REPAYMENT, 'Loan repayment'),
+        (SOURCE_LOAN_APPLICATION, 'Loan application'),
+        (SOURCE_LOAN_DISBURSEMENT, 'Loan disbursement'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_feed')
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    source_id = models.BigIntegerField()
+    rank = models.PositiveSmallIntegerField(help_text="Dedup priority of the source; higher wins")
+    entry_id = models.CharField(max_length=64)
+    transaction_type = models.CharField(max_length=50, choices=TransactionType.choices)
+    status = models.CharField(max_length=20)
+    amount = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+    units = models.DecimalField(max_digits=20, decimal_places=4, null=True, blank=True)
+    direction = models.CharField(max_length=3, blank=True, default='')
+    reference_id = models.TextField(null=True, blank=True)
+    reference_key = models.CharField(max_length=255, null=True, blank=True)
+    details = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(help_text="When the transaction happened (history sort key)")
+    recorded_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='feed_user_created_idx'),
+            models.Index(fields=['user', 'transaction_type', 'created_at'], name='feed_user_type_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'source', 'source_id'], name='uniq_feed_user_source_row'),
+            models.UniqueConstraint(
+                fields=['user', 'reference_key'],
+                condition=models.Q(reference_key__isnull=False),
+                name='uniq_feed_user_reference',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.transaction_type} {self.entry_id} ({self.created_at:%Y-%m-%d %H:%M})"
+
+
+class ActivityDailyTotal(models.Model):
+    """
+    Running statement totals of the activity feed per user, UTC day and
+    transaction type. Adjusted in the same atomic block as each
+    `ActivityFeedEntry` insert, refresh or removal (`transactions.activity_feed`),
+    so a period summary sums at most one row per day and type. Rebuilt by
+    `python manage.py backfill_activity_feed`.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_daily_totals')
+    day = models.DateField(help_text="UTC date of the entries' created_at")
+    transaction_type = models.CharField(max_length=50, choices=TransactionType.choices)
+    entry_count = models.IntegerField(default=0)
+    money_in = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    money_out = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    units_in = models.DecimalField(max_digits=20, decimal_places=4, default=0)
+    units_out = models.DecimalField(max_digits=20, decimal_places=4, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day', 'transaction_type'], name='uniq_activity_total_user_day_type'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.day} {self.transaction_type}: {self.entry_count}"
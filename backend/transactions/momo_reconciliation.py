@@ -0,0 +1,321 @@
+"""
+Background reconciliation of pending MTN MoMo collections.
+
+Unit purchases (`transactions.Transaction`) and MoMo loan repayments
+(`loan.LoanRepayment`) are saved PENDING when the request-to-pay is sent.
+From then on this module owns them; no web request polls MoMo or waits for it.
+
+Celery beat runs `reconcile_due_payments` every MOMO_RECONCILE_INTERVAL_SECONDS:
+
+  1. Claim up to MOMO_RECONCILE_BATCH_SIZE due rows per kind with
+     SELECT ... FOR UPDATE SKIP LOCKED, bump `status_checks` and push
+     `next_status_check_at` out by an exponential backoff (base → max), so
+     overlapping ticks and workers never poll the same payment.
+  2. Poll MoMo for the whole batch on a bounded thread pool, outside any
+     database transaction.
+  3. Finalize on the calling thread: SUCCESS goes through
+     `complete_buy_units_payment` / `repay_loan`, FAILED marks the row failed,
+     and rows MoMo still reports PENDING after MOMO_PAYMENT_EXPIRY_SECONDS are
+     expired. UNKNOWN (network errors, open circuit breaker, 5xx) never
+     expires a row that reached MoMo, since MoMo may have collected the money;
+     it stays on the capped backoff until MoMo gives a definite answer.
+
+In simulated mode (no MoMo credentials) nothing is polled: a payment settles
+as successful once it is MOMO_SIMULATED_SETTLE_SECONDS old.
+
+Status endpoints only read the row; `nudge` asks for a prompt check of one
+pending payment (at most once per backoff base) without waiting for it.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from loan.models import LoanRepayment
+from transactions.models import FAILED, PENDING, Transaction
+
+logger = logging.getLogger(__name__)
+
+KIND_PURCHASE = "purchase"
+KIND_REPAYMENT = "repayment"
+KINDS = (KIND_PURCHASE, KIND_REPAYMENT)
+
+
+def _setting(name: str, default: int) -> int:
+    return int(getattr(settings, name, default))
+
+
+def batch_size() -> int:
+    return max(1, _setting("MOMO_RECONCILE_BATCH_SIZE", 100))
+
+
+def poll_concurrency() -> int:
+    return max(1, _setting("MOMO_RECONCILE_CONCURRENCY", 8))
+
+
+def backoff_seconds(checks: int) -> int:
+    """Delay before the next status check after `checks` earlier ones."""
+    base = max(1, _setting("MOMO_RECONCILE_BASE_SECONDS", 5))
+    cap = max(base, _setting("MOMO_RECONCILE_MAX_SECONDS", 300))
+    return min(cap, base * 2 ** min(checks, 16))
+
+
+def payment_expiry() -> timedelta:
+    return timedelta(seconds=max(60, _setting("MOMO_PAYMENT_EXPIRY_SECONDS", 3600)))
+
+
+def _pending(kind: str):
+    if kind == KIND_PURCHASE:
+        return Transaction.objects.filter(status=PENDING)
+    return LoanRepayment.objects.filter(payment_status="PENDING", payment_method="MOBILE_MONEY")
+
+
+def _created_at(kind: str, row):
+    return row.create_date if kind == KIND_PURCHASE else row.created_at
+
+
+def _reference(kind: str, row) -> str:
+    return (row.transaction_reference if kind == KIND_PURCHASE else row.momo_external_id) or ""
+
+
+def claim_due(kind: str, limit: int, now=None, pk=None) -> list:
+    """Lock, reschedule and return up to `limit` pending rows whose check is due."""
+    now = now or timezone.now()
+    due = _pending(kind).filter(Q(next_status_check_at__isnull=True) | Q(next_status_check_at__lte=now))
+    if pk is not None:
+        due = due.filter(pk=pk)
+    with db_transaction.atomic():
+        rows = list(
+            due.select_for_update(skip_locked=True)
+            .order_by(F("next_status_check_at").asc(nulls_first=True), "pk")[:limit]
+        )
+        for row in rows:
+            row.next_status_check_at = now + timedelta(seconds=backoff_seconds(row.status_checks))
+            row.status_checks += 1
+        if rows:
+            type(rows[0]).objects.bulk_update(rows, ["status_checks", "next_status_check_at"])
+    return rows
+
+
+def _poll(service, reference: str) -> dict:
+    if not reference:
+        return {"status": "UNKNOWN", "message": "No MoMo reference on payment"}
+    try:
+        return service.get_payment_status(reference)
+    except Exception as exc:
+        logger.warning("MoMo status check crashed for %s: %s", reference, exc)
+        return {"status": "UNKNOWN", "message": str(exc)}
+
+
+def _simulated_status(kind: str, row, now) -> dict:
+    settle = timedelta(seconds=max(0, _setting("MOMO_SIMULATED_SETTLE_SECONDS", 2)))
+    if now - _created_at(kind, row) < settle:
+        return {"status": "PENDING", "message": "Simulated payment settling"}
+    return {
+        "status": "SUCCESS",
+        "transaction_id": f"SANDBOX_{_reference(kind, row)}",
+        "message": "Simulated payment",
+    }
+
+
+def check_statuses(claimed: list[tuple[str, object]], now) -> list[dict]:
+    """MoMo status for each claimed (kind, row), in order."""
+    from mtn_momo.config import should_simulate_payments
+
+    if not claimed:
+        return []
+    if should_simulate_payments():
+        return [_simulated_status(kind, row, now) for kind, row in claimed]
+
+    from mtn_momo.services import MTNMoMoService
+
+    service = MTNMoMoService()
+    references = [_reference(kind, row) for kind, row in claimed]
+    if len(references) == 1:
+        return [_poll(service, references[0])]
+    with ThreadPoolExecutor(
+        max_workers=min(poll_concurrency(), len(references)),
+        thread_name_prefix="momo-reconcile",
+    ) as executor:
+        return list(executor.map(lambda reference: _poll(service, reference), references))
+
+
+def _expired(kind: str, row, result: dict, now) -> bool:
+    """Past the expiry and MoMo says the payment is still PENDING (or it never reached MoMo)."""
+    if now - _created_at(kind, row) < payment_expiry():
+        return False
+    if result.get("status") == "PENDING" or not _reference(kind, row):
+        return True
+    logger.warning(
+        "MoMo %s pk=%s is past its expiry but its status is unknown (%s); still checking",
+        kind, row.pk, result.get("message") or "no message",
+    )
+    return False
+
+
+def _fail_purchase(tx: Transaction, message: str, now) -> bool:
+    from transactions.activity_feed import record_activity
+
+    updated = Transaction.objects.filter(pk=tx.pk, status=PENDING).update(
+        status=FAILED, message=message, modify_date=now
+    )
+    if updated:
+        # Queryset updates skip post_save; refresh the history entry explicitly.
+        tx.status, tx.message, tx.modify_date = FAILED, message, now
+        record_activity(tx)
+    return bool(updated)
+
+
+def _finalize_purchase(tx: Transaction, result: dict, now) -> str:
+    from meter.buy_units_payment import complete_buy_units_payment
+    from meter.models import Meter
+
+    state = result.get("status")
+    if state == "SUCCESS":
+        user = tx.wallet.user
+        meter = Meter.objects.filter(user=user).order_by("create_date").first()
+        if meter is None:
+            _fail_purchase(tx, "Payment received but no meter is registered", now)
+            logger.error("MoMo purchase tx=%s paid but user=%s has no meter", tx.pk, user.pk)
+            return "failed"
+        ok, _units, err = complete_buy_units_payment(user, tx.amount, tx.pk, meter.pk)
+        if not ok:
+            logger.error("MoMo purchase tx=%s paid but could not be completed: %s", tx.pk, err)
+        return "completed" if ok else "failed"
+    if state == "FAILED":
+        _fail_purchase(tx, result.get("message") or "Payment failed", now)
+        return "failed"
+    if _expired(KIND_PURCHASE, tx, result, now):
+        _fail_purchase(tx, "Payment request expired", now)
+        return "expired"
+    return "pending"
+
+
+def _close_repayment(repayment: LoanRepayment, payment_status: str, now, **fields) -> bool:
+    return bool(
+        LoanRepayment.objects.filter(pk=repayment.pk, payment_status="PENDING").update(
+            payment_status=payment_status, updated_at=now, **fields
+        )
+    )
+
+
+def _finalize_repayment(repayment: LoanRepayment, result: dict, now) -> str:
+    from loan.services import LoanOperationError, repay_loan
+
+    state = result.get("status")
+    if state == "SUCCESS":
+        loan = repayment.loan
+        try:
+            repay_loan(
+                loan.user,
+                loan.pk,
+                repayment.amount_paid,
+                channel="WEB",
+                payment_method="MOBILE_MONEY",
+                pending_repayment=repayment,
+                momo_transaction_id=result.get("transaction_id"),
+            )
+            return "completed"
+        except LoanOperationError as exc:
+            # Collected by MoMo but the loan can no longer take it (closed or
+            # overpaid meanwhile); FAILED rows surface on the admin errors page.
+            if _close_repayment(repayment, "FAILED", now, momo_transaction_id=result.get("transaction_id")):
+                logger.error(
+                    "MoMo repayment %s paid but not applied to loan %s: %s",
+                    repayment.payment_reference,
+                    loan.loan_id,
+                    exc.message,
+                )
+            return "failed"
+    if state == "FAILED":
+        _close_repayment(repayment, "FAILED", now)
+        return "failed"
+    if _expired(KIND_REPAYMENT, repayment, result, now):
+        _close_repayment(repayment, "CANCELLED", now)
+        return "expired"
+    return "pending"
+
+
+_FINALIZERS = {
+    KIND_PURCHASE: _finalize_purchase,
+    KIND_REPAYMENT: _finalize_repayment,
+}
+
+
+def reconcile_due_payments(kinds=KINDS, limit: int | None = None, pk=None) -> dict:
+    """One reconciliation pass over due payments; returns tick metrics."""
+    started = time.monotonic()
+    now = timezone.now()
+    limit = limit or batch_size()
+    claimed = [(kind, row) for kind in kinds for row in claim_due(kind, limit, now, pk=pk)]
+    results = check_statuses(claimed, now)
+
+    outcomes = Counter()
+    for (kind, row), result in zip(claimed, results):
+        try:
+            outcomes[_FINALIZERS[kind](row, result, now)] += 1
+        except Exception:
+            logger.exception("MoMo reconciliation failed for %s pk=%s", kind, row.pk)
+            outcomes["errors"] += 1
+
+    metrics = {
+        "checked": len(claimed),
+        "completed": outcomes["completed"],
+        "failed": outcomes["failed"],
+        "expired": outcomes["expired"],
+        "pending": outcomes["pending"],
+        "errors": outcomes["errors"],
+        "tick_ms": round((time.monotonic() - started) * 1000, 1),
+    }
+    if claimed:
+        from mtn_momo.client import momo_client_stats
+
+        metrics["momo_client"] = momo_client_stats()
+        logger.info(
+            "MoMo reconcile: checked=%s completed=%s failed=%s expired=%s pending=%s errors=%s tick=%sms",
+            metrics["checked"],
+            metrics["completed"],
+            metrics["failed"],
+            metrics["expired"],
+            metrics["pending"],
+            metrics["errors"],
+            metrics["tick_ms"],
+        )
+    return metrics
+
+
+def nudge(kind: str, pk) -> bool:
+    """
+    Queue a check of one pending payment, at most once per backoff base. The
+    row's own schedule still applies, so repeated client polls cannot hammer MoMo.
+    """
+    if not cache.add(f"momo:nudge:{kind}:{pk}", 1, backoff_seconds(0)):
+        return False
+    from transactions.tasks import reconcile_momo_payment
+    from utils.general import dispatch_task
+
+    dispatch_task(reconcile_momo_payment, kind, pk)
+    return True
+
+
+def purchase_status(tx: Transaction) -> str:
+    """Refresh a purchase after nudging it; the DB row is the only source of truth."""
+    if tx.status == PENDING and nudge(KIND_PURCHASE, tx.pk):
+        tx.refresh_from_db(fields=["status", "message"])
+    return tx.status
+
+
+def repayment_status(repayment: LoanRepayment) -> str:
+    if repayment.payment_status == "PENDING" and nudge(KIND_REPAYMENT, repayment.pk):
+        repayment.refresh_from_db()
+    return repayment.payment_status
+
@@ -1,6 +1,15 @@
-from django.db.models.signals import pre_save
+from decimal import Decimal
+
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
 from django.dispatch import receiver
 
+from meter.models import Transaction as MeterTransaction
+from transactions.activity_feed import FEED_MODELS, record_activity
+from transactions.consumption import (
+    apply_consumption_delta,
+    meter_transaction_counts,
+    unit_transaction_counts,
+)
 from transactions.models import UnitTransaction
 from accounts.models import generate_random_string
 
@@ -9,3 +18,76 @@ from accounts.models import generate_random_string
 def generate_transaction_id(sender, instance, *args, **kwargs):
     if not instance.pk:
         instance.transaction_id = generate_random_string(16)
+
+
+# ---------------------------------------------------------------------------
+# Monthly consumption counters — see transactions.consumption
+# ---------------------------------------------------------------------------
+
+def _unit_tx_state(instance):
+    if not unit_transaction_counts(instance):
+        return None
+    return instance.sender_id, instance.create_date, Decimal(str(instance.units or 0))
+
+
+def _meter_tx_state(instance):
+    if not meter_transaction_counts(instance):
+        return None
+    return instance.user_id, instance.create_date, Decimal(str(instance.amount_kwh or 0))
+
+
+_STATE_READERS = {
+    UnitTransaction: _unit_tx_state,
+    MeterTransaction: _meter_tx_state,
+}
+
+
+@receiver(post_init, sender=UnitTransaction)
+@receiver(post_init, sender=MeterTransaction)
+def remember_consumption_state(sender, instance, **kwargs):
+    # Skip partially loaded rows: reading deferred fields here would cost a query each.
+    if not instance.pk or instance.get_deferred_fields():
+        instance._consumption_state = None
+        return
+    instance._consumption_state = _STATE_READERS[sender](instance)
+
+
+@receiver(post_save, sender=UnitTransaction)
+@receiver(post_save, sender=MeterTransaction)
+def update_monthly_consumption(sender, instance, **kwargs):
+    """Runs inside the caller's atomic block, so the counter commits with the purchase."""
+    before = getattr(instance, "_consumption_state", None)
+    after = _STATE_READERS[sender](instance)
+    if before == after:
+        return
+    if before:
+        apply_consumption_delta(before[0], before[1], -before[2], -1)
+    if after:
+        apply_consumption_delta(after[0], after[1], after[2], 1)
+    instance._consumption_state = after
+
+
+@receiver(post_delete, sender=UnitTransaction)
+@receiver(post_delete, sender=MeterTransaction)
+def release_monthly_consumption(sender, instance, **kwargs):
+    before = getattr(instance, "_consumption_state", None)
+    if before:
+        apply_consumption_delta(before[0], before[1], -before[2], -1)
+
+
+# ---------------------------------------------------------------------------
+# Activity feed — see transactions.activity_feed
+# ---------------------------------------------------------------------------
+
+def record_feed_activity(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    record_activity(instance, update_fields=update_fields)
+
+
+for _feed_model in FEED_MODELS:
+    post_save.connect(
+        record_feed_activity,
+        sender=_feed_model,
+        dispatch_uid=f"activity_feed_{_feed_model._meta.label_lower}",
+    )
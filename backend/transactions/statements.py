@@ -1,6 +1,58 @@
+"""
+Transaction statements (PDF and CSV) written from a stream of history entries.
+
+Both formats consume any iterable of history entries (normally
+`unified_history.iter_history`, which pages the activity feed) and yield the
+document in chunks, so memory stays flat however long the statement is:
+
+- `iter_statement_pdf` lays entries out over as many A4 pages as needed and
+  emits each page's content stream and page object as soon as it is full. Only
+  the byte offset of each object is kept (8 bytes each) for the cross-reference
+  table, and the page tree (whose /Count is known only at the end) is written
+  last.
+- `iter_statement_csv` yields one CSV line per entry.
+
+`write_statement_pdf` / `write_statement_csv` drain those generators into a
+file-like sink; the same generators back the streaming export endpoint.
+"""
 from __future__ import annotations
 
+import csv
+from array import array
 from datetime import datetime
+from typing import BinaryIO, Iterable, Iterator, TextIO
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+FONT_SIZE = 10
+LEADING = 12
+TOP_Y = 790
+BOTTOM_MARGIN = 50
+LINES_PER_PAGE = (TOP_Y - BOTTOM_MARGIN) // LEADING
+
+# Fixed object numbers; each page then takes two: its content stream and the page.
+_CATALOG_OBJ = 1
+_PAGES_OBJ = 2
+_FONT_OBJ = 3
+# Page-tree kids and xref rows are emitted this many at a time.
+_CHUNK_OBJECTS = 512
+
+CSV_COLUMNS = [
+    "created_at",
+    "transaction_type",
+    "status",
+    "amount_ugx",
+    "units_kwh",
+    "reference_id",
+    "channel",
+    "id",
+]
+
+
+def _page_objects(index: int) -> tuple[int, int]:
+    """(content stream, page) object numbers of the zero-based page `index`."""
+    first = _FONT_OBJ + 1 + 2 * index
+    return first, first + 1
 
 
 def _pdf_escape(text: str) -> str:
@@ -11,16 +63,9 @@ def _pdf_escape(text: str) -> str:
     )
 
 
-def build_statement_pdf_bytes(
-    *,
-    user_email: str,
-    start_date: str,
-    end_date: str,
-    summary: dict,
-    entries: list[dict],
-) -> bytes:
+def _summary_lines(*, user_email: str, start_date: str, end_date: str, summary: dict) -> list[str]:
     generated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    lines: list[str] = [
+    return [
         "gPawa Transaction Statement",
         f"Account: {user_email}",
         f"Period: {start_date} to {end_date}",
@@ -37,60 +82,158 @@ def build_statement_pdf_bytes(
         "",
         "Transactions",
     ]
-    for item in entries[:120]:
-        tx_date = item.get("created_at") or "-"
-        tx_type = item.get("transaction_type_display") or item.get("transaction_type") or "-"
-        status = item.get("status") or "-"
-        amount = item.get("amount")
-        units = item.get("units")
-        amount_txt = f"UGX {float(amount):,.2f}" if amount is not None else "-"
-        units_txt = f"{float(units):,.2f} kWh" if units is not None else "-"
-        lines.append(f"{tx_date} | {tx_type} | {status} | {amount_txt} | {units_txt}")
-
-    if len(entries) > 120:
-        lines.append(f"... {len(entries) - 120} more transactions not shown in this PDF.")
-
-    stream_lines = ["BT", "/F1 10 Tf", "50 790 Td", "12 TL"]
-    first = True
-    for raw in lines:
-        text = _pdf_escape(raw)
-        if first:
-            stream_lines.append(f"({text}) Tj")
-            first = False
-        else:
+
+
+def _entry_line(item: dict) -> str:
+    tx_date = item.get("created_at") or "-"
+    tx_type = item.get("transaction_type_display") or item.get("transaction_type") or "-"
+    status = item.get("status") or "-"
+    amount = item.get("amount")
+    units = item.get("units")
+    amount_txt = f"UGX {float(amount):,.2f}" if amount is not None else "-"
+    units_txt = f"{float(units):,.2f} kWh" if units is not None else "-"
+    return f"{tx_date} | {tx_type} | {status} | {amount_txt} | {units_txt}"
+
+
+def _content_stream(lines: list[str]) -> bytes:
+    stream_lines = ["BT", f"/F1 {FONT_SIZE} Tf", f"50 {TOP_Y} Td", f"{LEADING} TL"]
+    for index, raw in enumerate(lines):
+        if index:
             stream_lines.append("T*")
-            stream_lines.append(f"({text}) Tj")
+        stream_lines.append(f"({_pdf_escape(raw)}) Tj")
     stream_lines.append("ET")
-    stream = "\n".join(stream_lines).encode("latin-1", errors="replace")
-
-    objs: list[bytes] = [
-        b"<< /Type /Catalog /Pages 2 0 R >>",
-        b"<< /Type /Pages /Count 1 /Kids [3 0 R] >>",
-        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
-        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
-        f"<< /Length {len(stream)} >>\nstream\n".encode("latin-1") + stream + b"\nendstream",
-    ]
+    return "\n".join(stream_lines).encode("latin-1", errors="replace")
 
-    pdf = bytearray(b"%PDF-1.4\n")
-    offsets: list[int] = [0]
-    for idx, obj in enumerate(objs, start=1):
-        offsets.append(len(pdf))
-        pdf.extend(f"{idx} 0 obj\n".encode("latin-1"))
-        pdf.extend(obj)
-        pdf.extend(b"\nendobj\n")
-
-    xref_pos = len(pdf)
-    pdf.extend(f"xref\n0 {len(objs) + 1}\n".encode("latin-1"))
-    pdf.extend(b"0000000000 65535 f \n")
-    for off in offsets[1:]:
-        pdf.extend(f"{off:010d} 00000 n \n".encode("latin-1"))
-    pdf.extend(
-        (
-            "trailer\n"
-            f"<< /Size {len(objs) + 1} /Root 1 0 R >>\n"
-            "startxref\n"
-            f"{xref_pos}\n"
-            "%%EOF\n"
-        ).encode("latin-1")
-    )
-    return bytes(pdf)
+
+class _PdfObjects:
+    """Serialises numbered objects and remembers where each one starts (8 bytes per object)."""
+
+    def __init__(self):
+        self.position = 0
+        self.offsets = array("Q")
+
+    def raw(self, data: bytes) -> bytes:
+        self.position += len(data)
+        return data
+
+    def begin(self, number: int) -> bytes:
+        if len(self.offsets) <= number:
+            self.offsets.extend([0] * (number + 1 - len(self.offsets)))
+        self.offsets[number] = self.position
+        return self.raw(f"{number} 0 obj\n".encode("latin-1"))
+
+    def obj(self, number: int, body: bytes) -> bytes:
+        return self.begin(number) + self.raw(body + b"\nendobj\n")
+
+    def stream(self, number: int, data: bytes) -> bytes:
+        return self.obj(number, f"<< /Length {len(data)} >>\nstream\n".encode("latin-1") + data + b"\nendstream")
+
+    def xref_and_trailer(self) -> Iterator[bytes]:
+        size = len(self.offsets)
+        xref_pos = self.position
+        yield self.raw(f"xref\n0 {size}\n0000000000 65535 f \n".encode("latin-1"))
+        for start in range(1, size, _CHUNK_OBJECTS):
+            rows = (f"{offset:010d} 00000 n \n" for offset in self.offsets[start:start + _CHUNK_OBJECTS])
+            yield self.raw("".join(rows).encode("latin-1"))
+        yield self.raw(
+            f"trailer\n<< /Size {size} /Root {_CATALOG_OBJ} 0 R >>\nstartxref\n{xref_pos}\n%%EOF\n".encode("latin-1")
+        )
+
+
+def iter_statement_pdf(
+    *,
+    user_email: str,
+    start_date: str,
+    end_date: str,
+    summary: dict,
+    entries: Iterable[dict],
+) -> Iterator[bytes]:
+    """Yield a multi-page statement PDF chunk by chunk (roughly one page per chunk)."""
+    pdf = _PdfObjects()
+    yield pdf.raw(b"%PDF-1.4\n")
+    yield pdf.obj(_CATALOG_OBJ, f"<< /Type /Catalog /Pages {_PAGES_OBJ} 0 R >>".encode("latin-1"))
+    yield pdf.obj(_FONT_OBJ, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_count = 0
+
+    def emit_page(lines: list[str]) -> bytes:
+        nonlocal page_count
+        contents_obj, page_obj = _page_objects(page_count)
+        page_count += 1
+        return pdf.stream(contents_obj, _content_stream(lines)) + pdf.obj(
+            page_obj,
+            (
+                f"<< /Type /Page /Parent {_PAGES_OBJ} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                f"/Resources << /Font << /F1 {_FONT_OBJ} 0 R >> >> /Contents {contents_obj} 0 R >>"
+            ).encode("latin-1"),
+        )
+
+    def continuation_header() -> list[str]:
+        return [f"gPawa Transaction Statement - {user_email} - page {page_count + 1}", ""]
+
+    lines = _summary_lines(user_email=user_email, start_date=start_date, end_date=end_date, summary=summary)
+    written = 0
+    for item in entries:
+        if len(lines) >= LINES_PER_PAGE:
+            yield emit_page(lines)
+            lines = continuation_header()
+        lines.append(_entry_line(item))
+        written += 1
+    if not written:
+        lines.append("No transactions in this period.")
+    yield emit_page(lines)
+
+    # The page tree goes last, once /Count is known; its /Kids are streamed in slices.
+    yield pdf.begin(_PAGES_OBJ) + pdf.raw(f"<< /Type /Pages /Count {page_count} /Kids [".encode("latin-1"))
+    for start in range(0, page_count, _CHUNK_OBJECTS):
+        stop = min(start + _CHUNK_OBJECTS, page_count)
+        kids = " ".join(f"{_page_objects(index)[1]} 0 R" for index in range(start, stop))
+        yield pdf.raw(f"{kids} ".encode("latin-1"))
+    yield pdf.raw(b"] >>\nendobj\n")
+    yield from pdf.xref_and_trailer()
+
+
+def write_statement_pdf(sink: BinaryIO, **kwargs) -> int:
+    """Write the statement PDF to a binary file-like `sink`; returns bytes written."""
+    total = 0
+    for chunk in iter_statement_pdf(**kwargs):
+        sink.write(chunk)
+        total += len(chunk)
+    return total
+
+
+def build_statement_pdf_bytes(**kwargs) -> bytes:
+    return b"".join(iter_statement_pdf(**kwargs))
+
+
+class _Line:
+    """Write target for csv.writer that hands back the formatted line."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def iter_statement_csv(entries: Iterable[dict]) -> Iterator[str]:
+    """Yield the statement as CSV text, header first, one line per entry."""
+    writer = csv.writer(_Line())
+    yield writer.writerow(CSV_COLUMNS)
+    for item in entries:
+        yield writer.writerow([
+            item.get("created_at") or "",
+            item.get("transaction_type") or "",
+            item.get("status") or "",
+            "" if item.get("amount") is None else f"{float(item['amount']):.2f}",
+            "" if item.get("units") is None else f"{float(item['units']):.4f}",
+            item.get("reference_id") or "",
+            item.get("channel") or "",
+            item.get("id") or "",
+        ])
+
+
+def write_statement_csv(sink: TextIO, entries: Iterable[dict]) -> int:
+    """Write the statement CSV to a text file-like `sink`; returns rows written (excluding the header)."""
+    rows = -1
+    for line in iter_statement_csv(entries):
+        sink.write(line)
+        rows += 1
+    return rows
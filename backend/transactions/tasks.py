@@ -1,11 +1,16 @@
 from __future__ import annotations
 
+import tempfile
+
 from django.conf import settings
 from django.core.mail import EmailMessage
 from backend import celery_app as app
 from accounts.models import User
-from transactions.statements import build_statement_pdf_bytes
-from transactions.unified_history import filter_history, collect_unified_history, summarize_history
+from transactions.statements import write_statement_pdf
+from transactions.unified_history import iter_history, parse_history_filters, summarize_history
+
+# Statements larger than this spill from memory to a temporary file while being written.
+STATEMENT_SPOOL_BYTES = 2 * 1024 * 1024
 
 
 @app.task()
@@ -14,16 +19,21 @@ def handle_send_transaction_statement_email(user_id, start_date, end_date):
     if not user or not user.email:
         return False
 
-    entries = collect_unified_history(user)
-    entries = filter_history(entries, start_date=start_date, end_date=end_date)
-    summary = summarize_history(entries)
-    pdf_bytes = build_statement_pdf_bytes(
-        user_email=user.email,
-        start_date=start_date,
-        end_date=end_date,
-        summary=summary,
-        entries=entries,
-    )
+    filters = parse_history_filters(start_date=start_date, end_date=end_date)
+    summary = summarize_history(user, filters)
+    # Entries stream from the feed into a spooled file; only the finished PDF is
+    # read back, because the email attachment has to be in memory anyway.
+    with tempfile.SpooledTemporaryFile(max_size=STATEMENT_SPOOL_BYTES) as pdf_file:
+        write_statement_pdf(
+            pdf_file,
+            user_email=user.email,
+            start_date=start_date,
+            end_date=end_date,
+            summary=summary,
+            entries=iter_history(user, filters),
+        )
+        pdf_file.seek(0)
+        pdf_bytes = pdf_file.read()
 
     subject = f"gPawa transaction statement ({start_date} to {end_date})"
     body = (
@@ -47,3 +57,19 @@ def handle_send_transaction_statement_email(user_id, start_date, end_date):
     )
     msg.send()
     return True
+
+
+@app.task(name="transactions.tasks.reconcile_momo_payments", ignore_result=True, expires=30)
+def reconcile_momo_payments():
+    """Periodic task: settle due PENDING MoMo purchases and loan repayments."""
+    from transactions.momo_reconciliation import reconcile_due_payments
+
+    return reconcile_due_payments()
+
+
+@app.task(name="transactions.tasks.reconcile_momo_payment", ignore_result=True)
+def reconcile_momo_payment(kind, pk):
+    """Check one pending payment now (queued by status endpoints), if it is due."""
+    from transactions.momo_reconciliation import reconcile_due_payments
+
+    return reconcile_due_payments(kinds=(kind,), limit=1, pk=pk)
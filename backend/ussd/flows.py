@@ -0,0 +1,408 @@
+"""
+Account actions behind the USSD menus (buy, loans, share, tokens, AMI).
+
+Each helper takes the resolved user plus raw menu input and returns
+`(ok, message)` for the screen; menu wiring lives in `ussd.menus`.
+"""
+import uuid
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+
+from accounts.models import Wallet as AccountWallet
+from loan.services import (
+    LoanOperationError,
+    create_loan_application,
+    get_disbursed_loan_balances,
+    repay_loan,
+    user_can_purchase_units,
+)
+from meter.buy_units_payment import calculate_units_from_tariff
+from meter.models import Meter, MeterToken
+from meter.models import Transaction as MeterLedgerTransaction
+from meter.services import query_latest_units_from_thingsboard, record_balance_snapshot
+from share.flow import build_share_summary
+from transactions.api.generate_token import generate_numeric_token
+from transactions.models import Transaction, TransactionType, UnitTransaction
+from transactions.momo_reconciliation import purchase_status
+from transactions.services import record_transaction_log
+from utils.ami_gateway import apply_units_to_meter
+from wallet.models import Wallet as UnitWallet
+
+
+def parse_statement_date(raw: str):
+    try:
+        return datetime.strptime(str(raw).strip(), "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def start_buy_units(user, phone_number: str, amount_raw: str):
+    meter = Meter.objects.filter(user=user).first()
+    if not meter:
+        return False, "No meter found. Register your meter in app first."
+
+    can_buy, purchase_message = user_can_purchase_units(user)
+    if not can_buy:
+        return False, purchase_message
+
+    try:
+        amount = Decimal(str(amount_raw))
+    except (InvalidOperation, TypeError, ValueError):
+        return False, "Invalid amount."
+
+    if amount <= 0:
+        return False, "Amount must be greater than zero."
+
+    account_wallet = AccountWallet.objects.filter(user=user).order_by("-create_date").first()
+    if account_wallet is None:
+        account_wallet = AccountWallet.objects.create(user=user)
+
+    _, total_outstanding = get_disbursed_loan_balances(user)
+    estimated_buy_amount = max(Decimal("0"), amount - total_outstanding)
+    estimated_units, tariff = calculate_units_from_tariff(estimated_buy_amount, user)
+
+    momo_reference = str(uuid.uuid4())
+    try:
+        tx = Transaction.objects.create(
+            wallet=account_wallet,
+            amount=amount,
+            phone_number=phone_number,
+            status="PENDING",
+            transaction_reference=momo_reference,
+            message=f"USSD Buy units - {amount} UGX",
+        )
+    except Exception:
+        return False, "Invalid phone number format."
+
+    from mtn_momo.config import should_simulate_payments
+
+    if should_simulate_payments():
+        # Auto-completed by the MoMo reconciler after a short settle delay.
+        return True, (
+            f"Payment initiated.\nTxID: {tx.id}\nStatus: PENDING\n"
+            f"Estimated units: {estimated_units}\nTariff: {tariff.tariff_code if tariff else 'DEFAULT_500'}"
+        )
+
+    from mtn_momo.services import MTNMoMoService
+
+    momo_service = MTNMoMoService()
+    payment_result = momo_service.request_payment(
+        amount=amount,
+        phone_number=phone_number,
+        reference_id=momo_reference,
+        external_id=str(tx.id),
+        payer_message=f"gPAWA USSD top-up {amount} UGX",
+    )
+    if payment_result.get("status") != "PENDING":
+        tx.status = "FAILED"
+        tx.message = payment_result.get("message", "MoMo request failed")
+        tx.save(update_fields=["status", "message"])
+        return False, payment_result.get("message", "Failed to start mobile money payment.")
+
+    return True, (
+        f"MoMo prompt sent.\nEnter PIN on phone.\nTxID: {tx.id}\n"
+        f"Estimated units: {estimated_units}\nUse option 2 to check status."
+    )
+
+
+def check_buy_status(user, tx_id_raw: str):
+    try:
+        tx_id = int(tx_id_raw)
+    except (TypeError, ValueError):
+        return False, "Invalid transaction ID."
+
+    try:
+        transaction = Transaction.objects.get(id=tx_id, wallet__user=user)
+    except Transaction.DoesNotExist:
+        return False, "Transaction not found."
+
+    # The reconciler settles payments; this only reads the row (and nudges it).
+    purchase_status(transaction)
+
+    if transaction.status == "COMPLETED":
+        unit_tx = UnitTransaction.objects.filter(
+            sender=user,
+            receiver=user,
+            direction="IN",
+            status="COMPLETED",
+            create_date__gte=transaction.create_date,
+        ).order_by("-create_date").first()
+        units = float(unit_tx.units) if unit_tx else 0.0
+        return True, f"SUCCESS\nAmount: UGX {transaction.amount}\nUnits: {units}\nTxID: {transaction.id}"
+    if transaction.status == "FAILED":
+        return True, f"FAILED\nTxID: {transaction.id}"
+    return True, f"PENDING\nTxID: {transaction.id}"
+
+
+def submit_loan_application(user, amount_raw: str, tenure_months: int):
+    try:
+        loan = create_loan_application(
+            user,
+            amount_requested=amount_raw,
+            purpose="USSD application",
+            tenure_months=tenure_months,
+            channel="USSD",
+        )
+    except LoanOperationError as exc:
+        return False, exc.message
+
+    if loan.status == "DISBURSED":
+        disbursement = getattr(loan, "disbursement", None)
+        units = disbursement.units_disbursed if disbursement else "-"
+        return True, (
+            f"Loan approved & disbursed!\nID: {loan.id}\nLoanRef: {loan.loan_id}\n"
+            f"Approved UGX {loan.amount_approved}\n"
+            f"Units added: {units}\n"
+            f"Tenure: {loan.tenure_months} mo ({loan.tenure_months * 30} days)"
+        )
+    if loan.status == "APPROVED":
+        return True, (
+            f"Loan approved.\nID: {loan.id}\nLoanRef: {loan.loan_id}\n"
+            f"Approved UGX {loan.amount_approved}\n"
+            f"Tenure: {loan.tenure_months} mo ({loan.tenure_months * 30} days)\n"
+            f"Units are being credited. If they don't arrive shortly, contact support."
+        )
+    return True, f"Loan rejected.\nReason: {loan.rejection_reason}"
+
+
+def submit_loan_repayment(user, loan_id_raw: str | None, amount_raw: str):
+    try:
+        loan_key = None if loan_id_raw in (None, "", "0") else loan_id_raw
+        result = repay_loan(
+            user,
+            loan_key,
+            amount_raw,
+            channel="USSD",
+            payment_method="MOBILE_MONEY",
+        )
+    except LoanOperationError as exc:
+        return False, exc.message
+
+    return True, (
+        f"{result['message']}\nLoanRef: {result['loan_id']}\n"
+        f"Outstanding: UGX {result['outstanding_balance']}\n"
+        f"Units added: {result['units_added']}"
+    )
+
+
+def share_preview_for_ussd(user, receiver_meter_no: str, units_raw: str):
+    """Validate meter/units and return summary text before PIN entry."""
+    try:
+        units = Decimal(str(units_raw))
+    except (InvalidOperation, ValueError):
+        return False, "Invalid units."
+
+    if units < Decimal("2"):
+        return False, "Minimum 2 units required."
+
+    sender_wallet, _ = UnitWallet.objects.get_or_create(user=user)
+    if sender_wallet.balance < units:
+        return False, f"Insufficient units. Wallet balance is {sender_wallet.balance}."
+
+    try:
+        receiver_meter = Meter.objects.select_related("user").get(meter_no=receiver_meter_no)
+    except Meter.DoesNotExist:
+        return False, "Receiver meter not found."
+
+    if receiver_meter.user_id == user.id:
+        return False, (
+            "Cannot share to your own meter. "
+            "Use Manage->4 Apply wallet (AMI) or Tokens->2 (STS) to load units."
+        )
+
+    summary = build_share_summary(receiver_meter, units)
+    return True, summary
+
+
+def generate_sts_token(user, units_raw: str):
+    meter = Meter.objects.filter(user=user, architecture=Meter.ARCH_STS).first()
+    if not meter:
+        return False, "No STS meter found."
+
+    try:
+        amount = Decimal(str(units_raw))
+    except (InvalidOperation, ValueError):
+        return False, "Invalid units."
+
+    if amount <= 0:
+        return False, "Units must be greater than zero."
+
+    unit_wallet, _ = UnitWallet.objects.get_or_create(user=user)
+    if unit_wallet.balance < amount:
+        return False, f"Insufficient wallet. Balance: {float(unit_wallet.balance):.2f} kWh."
+
+    try:
+        with db_transaction.atomic():
+            locked = UnitWallet.objects.select_for_update().get(user=user)
+            if locked.balance < amount:
+                return False, "Insufficient wallet balance."
+            locked.balance -= amount
+            locked.save(update_fields=["balance"])
+            token_value = generate_numeric_token()
+            MeterToken.objects.create(
+                user=user,
+                token=token_value,
+                units=amount,
+                meter=meter,
+                source="PURCHASE",
+            )
+            MeterLedgerTransaction.objects.create(
+                user=user,
+                meter=meter,
+                transaction_type=MeterLedgerTransaction.TYPE_GENERATE_TOKEN,
+                amount_kwh=amount,
+                status=MeterLedgerTransaction.STATUS_COMPLETED,
+                channel=MeterLedgerTransaction.CHANNEL_USSD,
+                sts_token=token_value,
+                source="wallet",
+                destination=meter.meter_no,
+                payment_reference=f"TOKEN-{token_value}",
+            )
+            record_transaction_log(
+                user,
+                TransactionType.TOKEN_GENERATE,
+                units=amount,
+                status="COMPLETED",
+                reference_id=f"TOKEN-{token_value}",
+                details={
+                    "channel": "USSD",
+                    "meter_no": meter.meter_no,
+                    "token": token_value,
+                },
+            )
+        return True, f"Token: {token_value}\nUnits: {float(amount):.2f} kWh\nWallet: {float(locked.balance):.2f} kWh"
+    except Exception:
+        return False, "Failed to generate token."
+
+
+def apply_wallet_to_ami(user, units_raw: str, meter_no: str | None = None):
+    qs = Meter.objects.filter(user=user, architecture=Meter.ARCH_AMI)
+    if meter_no:
+        qs = qs.filter(meter_no=meter_no)
+    meter = qs.first()
+    if not meter:
+        return False, "No AMI meter found."
+
+    try:
+        amount = Decimal(str(units_raw))
+    except (InvalidOperation, ValueError):
+        return False, "Invalid units."
+
+    if amount <= 0:
+        return False, "Units must be greater than zero."
+
+    unit_wallet, _ = UnitWallet.objects.get_or_create(user=user)
+    if unit_wallet.balance < amount:
+        return False, f"Insufficient wallet. Balance: {float(unit_wallet.balance):.2f} kWh."
+
+    try:
+        with db_transaction.atomic():
+            locked = UnitWallet.objects.select_for_update().get(user=user)
+            if locked.balance < amount:
+                return False, "Insufficient wallet balance."
+            locked.balance -= amount
+            locked.save(update_fields=["balance"])
+            if not apply_units_to_meter(meter, amount):
+                raise ValueError("AMI apply failed")
+            meter.refresh_from_db(fields=["units"])
+            ref = uuid.uuid4().hex[:12]
+            record_transaction_log(
+                user,
+                TransactionType.WALLET_LOAD_AMI,
+                units=amount,
+                status="COMPLETED",
+                reference_id=f"USSD-AMI-{ref}",
+                details={
+                    "channel": "USSD",
+                    "meter_no": meter.meter_no,
+                },
+            )
+        return True, (
+            f"Applied {float(amount):.2f} kWh to {meter.meter_no}.\n"
+            f"Meter: {float(meter.units):.2f} kWh\n"
+            f"Wallet: {float(locked.balance):.2f} kWh"
+        )
+    except ValueError as exc:
+        return False, str(exc)
+    except Exception:
+        return False, "Failed to apply units to AMI meter."
+
+
+def user_meters_summary(user):
+    meters = list(Meter.objects.filter(user=user).order_by("create_date"))
+    if not meters:
+        return False, "No meters registered."
+    lines = ["Your meters:"]
+    for m in meters:
+        token_hint = "TB" if (m.iot_device_token or "").strip() else "no-token"
+        label = f" ({m.label})" if m.label and m.label != "Home" else ""
+        lines.append(
+            f"{m.meter_no}{label} | {m.architecture} | {float(m.units):.2f} kWh ({token_hint})"
+        )
+    return True, "\n".join(lines)
+
+
+def ami_meters_for_user(user):
+    return list(
+        Meter.objects.filter(user=user, architecture=Meter.ARCH_AMI).order_by("create_date")
+    )
+
+
+def ami_meter_picker_message(meters):
+    lines = ["Check units - pick meter:"]
+    for i, m in enumerate(meters, 1):
+        lines.append(f"{i}. {m.meter_no}")
+    return "\n".join(lines)
+
+
+def check_units_for_meter(user, meter_no: str):
+    try:
+        meter = Meter.objects.get(user=user, meter_no=meter_no, architecture=Meter.ARCH_AMI)
+    except Meter.DoesNotExist:
+        return False, "AMI meter not found on your account."
+
+    ok, msg, data = query_latest_units_from_thingsboard(meter)
+    if not ok or not data:
+        return False, msg or "Could not read units from ThingsBoard."
+
+    record_balance_snapshot(
+        meter,
+        data["units_kwh"],
+        source=data.get("source", "thingsboard"),
+    )
+
+    return True, (
+        f"Meter {meter.meter_no}\n"
+        f"Units: {data['units_kwh']:.2f} kWh"
+    )
+
+
+def notifications_summary(user):
+    from meter.models import MeterNotification
+
+    low_threshold = float(getattr(settings, "AMI_LOW_UNITS_THRESHOLD_KWH", 5))
+    unread = MeterNotification.objects.filter(user=user, is_read=False).count()
+    recent = list(
+        MeterNotification.objects.filter(user=user)
+        .select_related("meter")
+        .order_by("-occurred_at")[:5]
+    )
+    if not recent:
+        return True, f"No alerts.\nUnread: {unread}"
+
+    lines = [f"Alerts (unread: {unread}):"]
+    for n in recent:
+        mark = "*" if not n.is_read else ""
+        if n.notification_type == MeterNotification.TYPE_LOW_UNITS:
+            mno = n.meter.meter_no if n.meter else "?"
+            lines.append(
+                f"{mark}LOW BALANCE <= {low_threshold:.0f} kWh | Meter {mno}: "
+                f"{float(n.units_kwh):.2f} kWh remaining"
+            )
+        else:
+            lines.append(f"{mark}{(n.message or 'Alert update')[:120]}")
+    lines.append("Use menu 7 or Manage->2 to review alerts.")
+    return True, "\n".join(lines)
@@ -0,0 +1,269 @@
+"""
+USSD menu state machine.
+
+Menus are declared as a graph of `Node`s (see `ussd.menus`) and compiled once
+at import into a flat dispatch table: each node's numbered options become a
+dict lookup, so routing one input is O(1) regardless of menu depth.
+
+The session's `current_menu` is the cursor. Africa's Talking sends the whole
+dial string on every request, but only the segment(s) added since the stored
+`last_text` are fed to the machine; earlier choices are never replayed.
+Result and invalid-option screens only answer to `#` and `*`; any other input
+shows the same screen again.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Callable, Optional
+
+# USSD navigation keys (shown on every submenu / prompt / result screen).
+NAV_MAIN = "*"
+NAV_BACK = "#"
+MAIN_MENU_OPTION = "*: Main Menu"
+BACK_OPTION = "#: Back"
+
+ROOT = "root"
+# Session context key marking sessions driven by this machine.
+CURSOR_KEY = "cursor"
+# Session context key holding the result screen on display, for re-rendering.
+RESULT_KEY = "result_screen"
+
+
+def parse_steps(text: str) -> list[str]:
+    """
+    Parse Africa's Talking cumulative USSD text into steps.
+
+    `*` separates levels; a trailing `*` is the main-menu shortcut (otherwise lost
+    on split). `#` is the back shortcut (usually its own final segment).
+    """
+    if not text:
+        return []
+    raw = str(text).strip()
+    steps = [segment.strip() for segment in raw.split("*") if segment.strip() != ""]
+    if raw == NAV_MAIN or raw.endswith(NAV_MAIN):
+        if not steps or steps[-1] != NAV_MAIN:
+            steps.append(NAV_MAIN)
+    if steps and steps[-1] != NAV_BACK and steps[-1].endswith(NAV_BACK):
+        base = steps[-1][:-1].strip()
+        if base:
+            steps[-1] = base
+        else:
+            steps.pop()
+        steps.append(NAV_BACK)
+    return steps
+
+
+def new_inputs(text: str, session) -> tuple[list[str], bool]:
+    """
+    Inputs to feed the machine for this request and whether to start from root.
+
+    Only the suffix after the stored `last_text` is parsed when the provider
+    extends it; a session without a cursor (new, or started before this engine)
+    replays the full text from root. Providers that send only the latest input
+    are handled by taking the final segment.
+    """
+    text = (text or "").strip()
+    if not text:
+        return [], True
+    context = session.context or {}
+    if not context.get(CURSOR_KEY):
+        return parse_steps(text), True
+    previous = session.last_text or ""
+    if previous and text.startswith(previous) and len(text) > len(previous):
+        return parse_steps(text[len(previous):]), False
+    return parse_steps(text)[-1:], False
+
+
+@dataclass(frozen=True)
+class Screen:
+    """One USSD reply; `node` becomes the session cursor."""
+
+    kind: str  # "menu", "prompt", "done" or "end"
+    node: str
+    message: str
+    context: Optional[dict] = None
+    back: bool = True  # show "#: Back" in the footer
+
+    @property
+    def prefix(self) -> str:
+        return "END" if self.kind == "end" else "CON"
+
+    def render(self) -> str:
+        if self.kind == "end" or (self.node == ROOT and self.kind == "menu"):
+            return self.message
+        footer = nav_footer(self.node if self.back else "")
+        if self.kind == "done":
+            return f"{self.message}\n\n{footer}"
+        return f"{self.message}\n{footer}"
+
+
+def nav_footer(node: str) -> str:
+    """Back + main menu shortcuts on submenus and result screens."""
+    lines: list[str] = []
+    if node and node != ROOT:
+        lines.append(BACK_OPTION)
+    lines.append(MAIN_MENU_OPTION)
+    return "\n".join(lines)
+
+
+def menu(node: str, message: str, context: dict | None = None) -> Screen:
+    return Screen("menu", node, message, context)
+
+
+def prompt(node: str, message: str, context: dict | None = None) -> Screen:
+    return Screen("prompt", node, message, context)
+
+
+def done(node: str, message: str, context: dict | None = None, back: bool = True) -> Screen:
+    return Screen("done", node, message, context, back)
+
+
+def end(node: str, message: str) -> Screen:
+    return Screen("end", node, message)
+
+
+@dataclass
+class MenuRequest:
+    """Per-request state handed to node handlers."""
+
+    user: object
+    session: object
+    phone_number: str
+
+    @property
+    def context(self) -> dict:
+        return self.session.context or {}
+
+    @cached_property
+    def meter(self):
+        from meter.models import Meter
+
+        return Meter.objects.filter(user=self.user).first()
+
+    @cached_property
+    def wallet(self):
+        from wallet.models import Wallet as UnitWallet
+
+        wallet, _ = UnitWallet.objects.get_or_create(user=self.user)
+        return wallet
+
+
+@dataclass(frozen=True)
+class Node:
+    """
+    One menu state.
+
+    enter:    builds the screen shown when the node is reached (menus, prompts,
+              or actions that answer immediately). Result-only nodes omit it.
+    options:  numbered choices → child node key (menus).
+    accept:   handler for free-form input (prompts and pickers).
+    invalid:  reply for an unknown option. It lands on `invalid_node` when set;
+              otherwise it stays on this node without a "#: Back" line.
+    """
+
+    key: str
+    parent: str = ROOT
+    enter: Optional[Callable[[MenuRequest], Screen]] = None
+    options: dict = field(default_factory=dict)
+    accept: Optional[Callable[[MenuRequest, str], Screen]] = None
+    invalid: str = "Invalid option."
+    invalid_node: str = ""
+
+
+class MenuMachine:
+    """Compiled menu graph: node key → Node, with parents and options resolved up front."""
+
+    def __init__(self, nodes):
+        self.table: dict[str, Node] = {}
+        for node in nodes:
+            if node.key in self.table:
+                raise ValueError(f"Duplicate USSD node '{node.key}'")
+            self.table[node.key] = node
+        if ROOT not in self.table or self.table[ROOT].enter is None:
+            raise ValueError("USSD menu needs a 'root' node with an enter handler")
+
+        for node in self.table.values():
+            if node.parent not in self.table:
+                raise ValueError(f"USSD node '{node.key}' has unknown parent '{node.parent}'")
+            for choice, target in node.options.items():
+                child = self.table.get(target)
+                if child is None or child.enter is None:
+                    raise ValueError(f"USSD node '{node.key}' option {choice} → '{target}' cannot be entered")
+            if node.invalid_node and node.invalid_node not in self.table:
+                raise ValueError(f"USSD node '{node.key}' has unknown invalid_node '{node.invalid_node}'")
+
+        # Re-entering a result or picker node shows the nearest enterable one.
+        self._entry = {key: self._nearest(key, lambda n: n.enter) for key in self.table}
+
+    def _nearest(self, key: str, accepts) -> str:
+        seen = set()
+        current = key
+        while not accepts(self.table[current]):
+            if current in seen or current == ROOT:
+                raise ValueError(f"USSD node '{key}' has no suitable ancestor")
+            seen.add(current)
+            current = self.table[current].parent
+        return current
+
+    def node(self, key: str) -> Node:
+        return self.table.get(key) or self.table[ROOT]
+
+    def enter(self, request: MenuRequest, key: str) -> Screen:
+        return self.table[self._entry[self.node(key).key]].enter(request)
+
+    def step(self, request: MenuRequest, cursor: str, value: str) -> Screen:
+        """Apply one input at `cursor`."""
+        if value == NAV_MAIN:
+            return self.enter(request, ROOT)
+        current = self.node(cursor)
+        if value == NAV_BACK:
+            return self.enter(request, current.parent if current.key != ROOT else ROOT)
+
+        result = request.context.get(RESULT_KEY)
+        if result is not None:
+            # Result and invalid screens only answer to the navigation keys.
+            return done(current.key, result["message"], back=result.get("back", True))
+        target = current.options.get(value)
+        if target is not None:
+            return self.enter(request, target)
+        if current.accept is not None:
+            return current.accept(request, value)
+        if not current.options:
+            return self.enter(request, current.key)
+        return done(current.invalid_node or current.key, current.invalid, back=bool(current.invalid_node))
+
+    def run(self, request: MenuRequest, inputs: list[str], from_root: bool = False) -> Screen:
+        """
+        Feed `inputs` from the session cursor (or root) and return the final screen.
+        Context from intermediate screens is merged into the session as it goes.
+        """
+        session = request.session
+        cursor = ROOT if from_root else (session.current_menu or ROOT)
+        screen = self.enter(request, ROOT) if from_root else None
+        if screen is not None:
+            _apply(session, screen)
+        for value in inputs:
+            screen = self.step(request, cursor, value)
+            _apply(session, screen)
+            cursor = screen.node
+            if screen.kind == "end":
+                break
+        if screen is None:
+            screen = self.enter(request, cursor)
+            _apply(session, screen)
+        return screen
+
+
+def _apply(session, screen: Screen) -> None:
+    context = dict(session.context or {})
+    if screen.context:
+        context.update(screen.context)
+    context[CURSOR_KEY] = screen.node
+    if screen.kind == "done":
+        context[RESULT_KEY] = {"message": screen.message, "back": screen.back}
+    else:
+        context.pop(RESULT_KEY, None)
+    session.context = context
+    session.current_menu = screen.node
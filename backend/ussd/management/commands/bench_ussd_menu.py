@@ -0,0 +1,124 @@
+"""
+Replay USSD sessions through the entry view and report per-step latency.
+
+Each session is a list of cumulative `text` values as the provider sends them.
+The default set mirrors the read-only screens in scripts/generate_ussd_report.py;
+pass --file with a JSON list of sessions to replay recorded traffic. Everything
+runs in a transaction that is rolled back, but handlers still call external
+services (MoMo, ThingsBoard) for flows that reach them.
+
+Run:
+    python manage.py bench_ussd_menu
+    python manage.py bench_ussd_menu --phone +256701234567 --iterations 50
+    python manage.py bench_ussd_menu --file sessions.json --json
+"""
+import json
+import time
+import uuid
+from collections import defaultdict
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from accounts.models import User
+from ussd.views import ussd_entry
+
+DEFAULT_SESSIONS = [
+    ["", "1", "1*1"],
+    ["", "2", "2*1"],
+    ["", "2", "2*2"],
+    ["", "3", "3*1"],
+    ["", "3", "3*4"],
+    ["", "4", "4*#"],
+    ["", "5", "5*1"],
+    ["", "6", "6*1", "6*1*#", "6*1*#*2"],
+    ["", "7", "7*"],
+]
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark the USSD menu by replaying sessions and reporting per-step latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--phone", help="Caller MSISDN (default: first user with a phone number)")
+        parser.add_argument("--iterations", type=int, default=20, help="Replays of every session")
+        parser.add_argument("--file", help="JSON file with a list of sessions (lists of cumulative texts)")
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        sessions = DEFAULT_SESSIONS
+        if options["file"]:
+            with open(options["file"]) as fh:
+                sessions = json.load(fh)
+            if not all(isinstance(s, list) and s for s in sessions):
+                raise CommandError("--file must hold a JSON list of non-empty lists of texts.")
+
+        phone = options["phone"]
+        if not phone:
+            user = User.objects.exclude(phone_number__isnull=True).exclude(phone_number="").first()
+            if user is None:
+                raise CommandError("No user with a phone number; pass --phone.")
+            phone = str(user.phone_number)
+
+        samples = defaultdict(list)
+        queries = defaultdict(list)
+        factory = APIRequestFactory()
+        try:
+            with transaction.atomic():
+                for _ in range(max(options["iterations"], 1)):
+                    for session in sessions:
+                        session_id = f"bench-{uuid.uuid4().hex[:12]}"
+                        for text in session:
+                            request = factory.post(
+                                "/api/v1/ussd/entry/",
+                                {"sessionId": session_id, "serviceCode": "*123#", "phoneNumber": phone, "text": text},
+                                format="json",
+                            )
+                            with CaptureQueriesContext(connection) as captured:
+                                started = time.perf_counter()
+                                ussd_entry(request)
+                                elapsed = time.perf_counter() - started
+                            samples[text].append(elapsed * 1000)
+                            queries[text].append(len(captured.captured_queries))
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+        rows = []
+        for text, values in samples.items():
+            ms = np.asarray(values)
+            rows.append({
+                "text": text,
+                "count": int(ms.size),
+                "p50_ms": round(float(np.percentile(ms, 50)), 2),
+                "p95_ms": round(float(np.percentile(ms, 95)), 2),
+                "max_ms": round(float(ms.max()), 2),
+                "queries": int(np.median(queries[text])),
+            })
+        all_ms = np.concatenate([np.asarray(v) for v in samples.values()])
+        overall = {
+            "steps": int(all_ms.size),
+            "p50_ms": round(float(np.percentile(all_ms, 50)), 2),
+            "p95_ms": round(float(np.percentile(all_ms, 95)), 2),
+        }
+
+        if options["json"]:
+            self.stdout.write(json.dumps({"overall": overall, "steps": rows}, indent=2))
+            return
+
+        self.stdout.write(f"{'text':<16} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'queries':>8}")
+        for row in rows:
+            self.stdout.write(
+                f"{row['text'] or '(empty)':<16} {row['count']:>5} {row['p50_ms']:>9.2f} "
+                f"{row['p95_ms']:>9.2f} {row['max_ms']:>9.2f} {row['queries']:>8}"
+            )
+        self.stdout.write(
+            f"\n{overall['steps']:,} steps  p50={overall['p50_ms']:.2f} ms  p95={overall['p95_ms']:.2f} ms"
+        )
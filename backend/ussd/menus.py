@@ -0,0 +1,557 @@
+"""
+gPawa USSD menu graph.
+
+Declares every screen as a `Node` and compiles the graph into `USSD_MENU` at
+import. Node keys are the `UssdSession.current_menu` values, and each node's
+`parent` is where "#: Back" leads. Account actions live in `ussd.flows`.
+"""
+
+from decimal import Decimal, InvalidOperation
+
+from loan.models import LoanApplication
+from loan.services import (
+    format_loan_apply_preview_ussd,
+    format_loan_stats_ussd,
+    format_repay_loan_menu_ussd,
+    format_wallet_loan_summary,
+    get_repayable_loan,
+    get_user_loan_stats,
+)
+from loan.tenure import TENURE_PROMPT, validate_tenure_months
+from meter.models import Meter, MeterToken
+from share.flow import ShareFlowError, execute_share_units
+from transactions.tasks import handle_send_transaction_statement_email
+from ussd import flows
+from ussd.machine import ROOT, MenuMachine, Node, done, end, menu, prompt
+from utils.general import dispatch_task
+
+
+def _result(node: str, ok: bool, msg: str):
+    return done(node, msg if ok else f"Error: {msg}")
+
+
+def _positive_amount(raw: str):
+    try:
+        amount = Decimal(str(raw))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    return amount if amount > 0 else None
+
+
+def _pick(raw: str, options: list):
+    """1-based menu pick from `options`, or None."""
+    try:
+        index = int(raw)
+    except (TypeError, ValueError):
+        return None
+    if index < 1 or index > len(options):
+        return None
+    return options[index - 1]
+
+
+# --- Main menu --------------------------------------------------------------
+
+def _main_menu(req):
+    return menu(
+        ROOT,
+        "gPawa\n"
+        "1. Wallet & Meter\n"
+        "2. Buy Units\n"
+        "3. Loans\n"
+        "4. Share Units\n"
+        "5. My Tokens\n"
+        "6. Manage\n"
+        "7. Alerts\n"
+        "8. Exit\n"
+        "9. Energy Usage",
+    )
+
+
+# --- 1) Wallet & meter -------------------------------------------------------
+
+def _wallet_menu(req):
+    return menu("wallet_menu", "Wallet & Meter\n1. Summary\n2. Check units (AMI)")
+
+
+def _wallet_overview(req):
+    meter_no = req.meter.meter_no if req.meter else "Not registered"
+    return done(
+        "wallet_overview",
+        (
+            f"Wallet: {req.wallet.balance} units\n"
+            f"Meter: {meter_no}\n"
+            f"{format_wallet_loan_summary(get_user_loan_stats(req.user))}"
+        ),
+    )
+
+
+def _check_units(req):
+    ami_meters = flows.ami_meters_for_user(req.user)
+    if not ami_meters:
+        return done("check_units", "No AMI meter on your account.")
+    if len(ami_meters) == 1:
+        ok, msg = flows.check_units_for_meter(req.user, ami_meters[0].meter_no)
+        return _result("check_units", ok, msg)
+    return menu(
+        "check_units_pick",
+        flows.ami_meter_picker_message(ami_meters),
+        context={"ami_meter_nos": [m.meter_no for m in ami_meters]},
+    )
+
+
+def _check_units_pick(req, value):
+    meter_nos = req.context.get("ami_meter_nos") or [m.meter_no for m in flows.ami_meters_for_user(req.user)]
+    meter_no = _pick(value, meter_nos)
+    if meter_no is None:
+        return done("check_units", "Invalid meter selection.")
+    ok, msg = flows.check_units_for_meter(req.user, meter_no)
+    return _result("check_units", ok, msg)
+
+
+# --- 2) Buy units ------------------------------------------------------------
+
+def _buy_menu(req):
+    return menu("buy_menu", "Buy Units\n1. Start purchase\n2. Check payment status")
+
+
+def _buy_amount(req):
+    return prompt("buy_amount", "Enter amount in UGX:")
+
+
+def _buy_amount_entered(req, value):
+    amount = _positive_amount(value)
+    if amount is None:
+        return done("buy_result", "Error: Invalid amount.")
+    ok, msg = flows.start_buy_units(req.user, req.phone_number, str(amount))
+    context = {}
+    if ok:
+        tx_line = [line for line in msg.split("\n") if line.startswith("TxID:")]
+        if tx_line:
+            try:
+                context["last_buy_transaction_id"] = int(tx_line[0].split(":")[1].strip())
+            except Exception:
+                pass
+    return done("buy_result", msg if ok else f"Error: {msg}", context=context)
+
+
+def _buy_status(req):
+    hint = ""
+    last_tx = req.context.get("last_buy_transaction_id")
+    if last_tx:
+        hint = f"\nTip: use {last_tx}"
+    return prompt("buy_status", f"Enter transaction ID:{hint}")
+
+
+def _buy_status_entered(req, value):
+    if value == "0":
+        value = str(req.context.get("last_buy_transaction_id", ""))
+    ok, msg = flows.check_buy_status(req.user, value)
+    return _result("buy_status_result", ok, msg)
+
+
+# --- 3) Loans ----------------------------------------------------------------
+
+def _loans_menu(req):
+    return menu(
+        "loans_menu",
+        "Loans\n"
+        "1. Latest loan\n"
+        "2. Apply for loan\n"
+        "3. Repay loan\n"
+        "4. Loan stats",
+    )
+
+
+def _loan_latest(req):
+    loan = LoanApplication.objects.filter(user=req.user).order_by("-created_at").first()
+    if not loan:
+        return done("loan_latest", "No loan record found.")
+    return done(
+        "loan_latest",
+        (
+            f"LoanID: {loan.id}\nRef: {loan.loan_id}\nStatus: {loan.status}\n"
+            f"Requested: UGX {loan.amount_requested}\nApproved: UGX {loan.amount_approved or 0}\n"
+            f"Tenure: {loan.tenure_months} mo ({loan.tenure_months * 30} days)\n"
+            f"Outstanding: UGX {loan.outstanding_balance}"
+        ),
+    )
+
+
+def _loan_apply(req):
+    loan_stats = get_user_loan_stats(req.user)
+    preview = format_loan_apply_preview_ussd(loan_stats)
+    if not loan_stats.get("is_loan_eligible"):
+        return done("loan_apply_ineligible", preview)
+    return prompt("loan_apply_amount", preview)
+
+
+def _loan_apply_amount_entered(req, value):
+    if _positive_amount(value) is None:
+        return done("loan_apply_result", "Error: Invalid amount.")
+    return prompt("loan_apply_tenure", TENURE_PROMPT, context={"loan_apply_amount": value})
+
+
+def _loan_apply_tenure_entered(req, value):
+    try:
+        tenure = validate_tenure_months(value)
+    except ValueError as exc:
+        return done("loan_apply_result", f"Error: {exc}")
+    ok, msg = flows.submit_loan_application(req.user, req.context.get("loan_apply_amount"), tenure)
+    return _result("loan_apply_result", ok, msg)
+
+
+def _loan_repay(req):
+    repayable = get_repayable_loan(req.user)
+    if not repayable:
+        return done("loan_repay_result", "No active loan to repay.")
+    return menu(
+        "loan_repay_pick",
+        format_repay_loan_menu_ussd(repayable),
+        context={
+            "repay_loan_pk": repayable.id,
+            "repay_outstanding": str(repayable.outstanding_balance),
+        },
+    )
+
+
+def _loan_repay_full(req):
+    active = get_repayable_loan(req.user)
+    if not active:
+        return done("loan_repay_result", "No active loan to repay.")
+    ok, msg = flows.submit_loan_repayment(req.user, None, float(active.outstanding_balance))
+    return _result("loan_repay_result", ok, msg)
+
+
+def _loan_repay_partial(req):
+    return prompt("loan_repay_partial", "Enter partial repayment amount UGX:")
+
+
+def _loan_repay_partial_entered(req, value):
+    ok, msg = flows.submit_loan_repayment(req.user, None, value)
+    return _result("loan_repay_result", ok, msg)
+
+
+def _loan_stats(req):
+    return done("loan_stats", format_loan_stats_ussd(get_user_loan_stats(req.user)))
+
+
+# --- 4) Share units — meter → units → transfer -------------------------------
+
+def _share_meter(req):
+    return prompt("share_meter", "Enter receiver meter number:")
+
+
+def _share_meter_entered(req, value):
+    return prompt("share_units", "Enter units to share (min 2):", context={"share_meter_no": value})
+
+
+def _share_units_entered(req, value):
+    receiver_meter_no = req.context.get("share_meter_no") or ""
+    preview_ok, preview_msg = flows.share_preview_for_ussd(req.user, receiver_meter_no, value)
+    if not preview_ok:
+        return done("share_preview_error", f"Error: {preview_msg}")
+    try:
+        result = execute_share_units(
+            sender=req.user,
+            receiver_meter_no=receiver_meter_no,
+            units=Decimal(str(value)),
+            channel="USSD",
+        )
+    except ShareFlowError as exc:
+        return done("share_result", f"Error: {exc.message}")
+    msg_suffix = ""
+    if result.get("share_token"):
+        msg_suffix = f"\nToken: {result['share_token']}"
+    elif result.get("receiver_architecture") == Meter.ARCH_AMI:
+        msg_suffix = "\nAMI meter topped up."
+    return done(
+        "share_result",
+        (
+            f"Share completed.\nRef: {result['transaction_id']}\n"
+            f"To: {result['receiver_meter']} ({result.get('receiver_name', '')})\n"
+            f"Units: {result['units_shared']}\n"
+            f"Wallet: {result['new_sender_wallet_balance']} kWh"
+            f"{msg_suffix}"
+        ),
+    )
+
+
+# --- 5) Tokens ---------------------------------------------------------------
+
+def _tokens_menu(req):
+    return menu("tokens_menu", "My Tokens\n1. List unused\n2. Generate STS token")
+
+
+def _tokens_unused(req):
+    tokens = MeterToken.objects.filter(user=req.user, is_used=False).order_by("-create_date")[:3]
+    if not tokens:
+        return done("tokens", "No active tokens found.")
+    lines = ["Active tokens:"]
+    for t in tokens:
+        lines.append(f"{t.token} | {t.units}u | {t.source}")
+    return done("tokens", "\n".join(lines))
+
+
+def _token_generate(req):
+    return prompt(
+        "token_generate_amount",
+        f"Enter kWh from wallet (max {float(req.wallet.balance):.2f}):",
+    )
+
+
+def _token_generate_entered(req, value):
+    ok, msg = flows.generate_sts_token(req.user, value)
+    return _result("token_generate", ok, msg)
+
+
+# --- 6) Manage ---------------------------------------------------------------
+
+def _manage_menu(req):
+    return menu(
+        "manage_menu",
+        "Manage\n"
+        "1. My meters\n"
+        "2. Alerts\n"
+        "3. Apply wallet (AMI)\n"
+        "4. Email statement (PDF)",
+    )
+
+
+def _manage_meters(req):
+    ok, msg = flows.user_meters_summary(req.user)
+    return _result("manage_meters", ok, msg)
+
+
+def _manage_alerts(req):
+    _, msg = flows.notifications_summary(req.user)
+    return done("manage_alerts", msg)
+
+
+def _apply_ami(req):
+    ami_meters = flows.ami_meters_for_user(req.user)
+    if not ami_meters:
+        return done("apply_ami", "No AMI meter on your account.")
+    if len(ami_meters) == 1:
+        return prompt(
+            "apply_ami_amount",
+            f"Apply kWh to {ami_meters[0].meter_no}\nEnter amount:",
+            context={"apply_ami_meter": ami_meters[0].meter_no},
+        )
+    return menu(
+        "apply_ami_pick",
+        flows.ami_meter_picker_message(ami_meters).replace("Check units", "Apply to"),
+        context={"ami_meter_nos": [m.meter_no for m in ami_meters], "apply_ami_meter": None},
+    )
+
+
+def _apply_ami_pick(req, value):
+    meter_nos = req.context.get("ami_meter_nos") or [m.meter_no for m in flows.ami_meters_for_user(req.user)]
+    meter_no = _pick(value, meter_nos)
+    if meter_no is None:
+        return done("apply_ami", "Invalid meter selection.")
+    return prompt(
+        "apply_ami_amount",
+        f"Enter kWh to apply to {meter_no}:",
+        context={"apply_ami_meter": meter_no},
+    )
+
+
+def _apply_ami_amount_entered(req, value):
+    ok, msg = flows.apply_wallet_to_ami(req.user, value, req.context.get("apply_ami_meter"))
+    return _result("apply_ami", ok, msg)
+
+
+def _statement_start(req):
+    return prompt("statement_start_date", "Statement start date (YYYY-MM-DD):")
+
+
+def _statement_start_entered(req, value):
+    start_date = flows.parse_statement_date(value)
+    if not start_date:
+        return done("statement_start_date", "Error: Invalid start date format. Use YYYY-MM-DD.")
+    return prompt(
+        "statement_end_date",
+        "Statement end date (YYYY-MM-DD):",
+        context={"statement_start_date": start_date.isoformat()},
+    )
+
+
+def _statement_end_entered(req, value):
+    start_date = flows.parse_statement_date(req.context.get("statement_start_date"))
+    end_date = flows.parse_statement_date(value)
+    if not start_date or not end_date:
+        return done("statement_end_date", "Error: Invalid date format. Use YYYY-MM-DD.")
+    if end_date < start_date:
+        return done("statement_end_date", "Error: End date cannot be before start date.")
+    dispatch_task(
+        handle_send_transaction_statement_email,
+        req.user.id,
+        start_date.isoformat(),
+        end_date.isoformat(),
+    )
+    return done(
+        "statement_email_requested",
+        f"Statement requested. PDF will be sent to {req.user.email}.",
+    )
+
+
+# --- 7) Alerts, 8) Exit, 9) Energy usage -------------------------------------
+
+def _alerts(req):
+    _, msg = flows.notifications_summary(req.user)
+    return done("alerts", msg)
+
+
+def _exit(req):
+    return end("exit", "Thank you for using gPawa.")
+
+
+def _power_usage(req):
+    from meter.usage_service import get_user_ami_meters
+
+    ami_meters = get_user_ami_meters(req.user)
+    if not ami_meters:
+        return done("power_usage", "This is only for AMI meter users.")
+    if len(ami_meters) == 1:
+        return _weekly_usage(req, ami_meters[0].meter_no)
+    return menu(
+        "power_usage_pick",
+        flows.ami_meter_picker_message(ami_meters).replace("Check units", "Energy Usage"),
+        context={"power_usage_meter_nos": [m.meter_no for m in ami_meters]},
+    )
+
+
+def _power_usage_pick(req, value):
+    from meter.usage_service import get_user_ami_meters
+
+    meter_nos = req.context.get("power_usage_meter_nos") or [
+        m.meter_no for m in get_user_ami_meters(req.user)
+    ]
+    meter_no = _pick(value, meter_nos)
+    if meter_no is None:
+        return done("power_usage", "Invalid meter selection.")
+    return _weekly_usage(req, meter_no)
+
+
+def _weekly_usage(req, meter_no: str):
+    from meter.usage_service import format_weekly_usage_ussd, get_power_usage_report
+
+    report = get_power_usage_report(req.user, meter_no=meter_no, period="week")
+    ok, msg = format_weekly_usage_ussd(report)
+    return _result("power_usage", ok, msg)
+
+
+USSD_MENU = MenuMachine([
+    Node(
+        ROOT,
+        enter=_main_menu,
+        options={
+            "1": "wallet_menu",
+            "2": "buy_menu",
+            "3": "loans_menu",
+            "4": "share_meter",
+            "5": "tokens_menu",
+            "6": "manage_menu",
+            "7": "alerts",
+            "8": "exit",
+            "9": "power_usage",
+        },
+        invalid="Invalid menu option.",
+    ),
+    # 1) Wallet & meter
+    Node(
+        "wallet_menu",
+        enter=_wallet_menu,
+        options={"1": "wallet_overview", "2": "check_units"},
+        invalid="Invalid wallet option.",
+    ),
+    Node("wallet_overview", parent="wallet_menu", enter=_wallet_overview),
+    Node("check_units", parent="wallet_menu", enter=_check_units),
+    Node("check_units_pick", parent="wallet_menu", accept=_check_units_pick),
+    # 2) Buy units
+    Node(
+        "buy_menu",
+        enter=_buy_menu,
+        options={"1": "buy_amount", "2": "buy_status"},
+        invalid="Invalid buy-units option.",
+    ),
+    Node("buy_amount", parent="buy_menu", enter=_buy_amount, accept=_buy_amount_entered),
+    Node("buy_result", parent="buy_menu"),
+    Node("buy_status", parent="buy_menu", enter=_buy_status, accept=_buy_status_entered),
+    Node("buy_status_result", parent="buy_menu"),
+    # 3) Loans
+    Node(
+        "loans_menu",
+        enter=_loans_menu,
+        options={"1": "loan_latest", "2": "loan_apply_amount", "3": "loan_repay_pick", "4": "loan_stats"},
+        invalid="Invalid loan option.",
+    ),
+    Node("loan_latest", parent="loans_menu", enter=_loan_latest),
+    Node("loan_apply_amount", parent="loans_menu", enter=_loan_apply, accept=_loan_apply_amount_entered),
+    Node("loan_apply_tenure", parent="loans_menu", accept=_loan_apply_tenure_entered),
+    Node("loan_apply_ineligible", parent="loans_menu"),
+    Node("loan_apply_result", parent="loans_menu"),
+    Node(
+        "loan_repay_pick",
+        parent="loans_menu",
+        enter=_loan_repay,
+        options={"1": "loan_repay_full", "2": "loan_repay_partial"},
+        invalid="Invalid repayment option.",
+        invalid_node="loan_repay_result",
+    ),
+    Node("loan_repay_full", parent="loan_repay_pick", enter=_loan_repay_full),
+    Node(
+        "loan_repay_partial",
+        parent="loan_repay_pick",
+        enter=_loan_repay_partial,
+        accept=_loan_repay_partial_entered,
+    ),
+    Node("loan_repay_result", parent="loans_menu"),
+    Node("loan_stats", parent="loans_menu", enter=_loan_stats),
+    # 4) Share units
+    Node("share_meter", enter=_share_meter, accept=_share_meter_entered),
+    Node("share_units", accept=_share_units_entered),
+    Node("share_preview_error"),
+    Node("share_result"),
+    # 5) Tokens
+    Node(
+        "tokens_menu",
+        enter=_tokens_menu,
+        options={"1": "tokens", "2": "token_generate_amount"},
+        invalid="Invalid token option.",
+    ),
+    Node("tokens", parent="tokens_menu", enter=_tokens_unused),
+    Node(
+        "token_generate_amount",
+        parent="tokens_menu",
+        enter=_token_generate,
+        accept=_token_generate_entered,
+    ),
+    Node("token_generate", parent="tokens_menu"),
+    # 6) Manage
+    Node(
+        "manage_menu",
+        enter=_manage_menu,
+        options={"1": "manage_meters", "2": "manage_alerts", "3": "apply_ami", "4": "statement_start_date"},
+        invalid="Invalid manage option.",
+    ),
+    Node("manage_meters", parent="manage_menu", enter=_manage_meters),
+    Node("manage_alerts", parent="manage_menu", enter=_manage_alerts),
+    Node("apply_ami", parent="manage_menu", enter=_apply_ami),
+    Node("apply_ami_pick", parent="manage_menu", accept=_apply_ami_pick),
+    Node("apply_ami_amount", parent="manage_menu", accept=_apply_ami_amount_entered),
+    Node(
+        "statement_start_date",
+        parent="manage_menu",
+        enter=_statement_start,
+        accept=_statement_start_entered,
+    ),
+    Node("statement_end_date", parent="manage_menu", accept=_statement_end_entered),
+    Node("statement_email_requested", parent="manage_menu"),
+    # 7) Alerts, 8) Exit, 9) Energy usage
+    Node("alerts", enter=_alerts),
+    Node("exit", enter=_exit),
+    Node("power_usage", enter=_power_usage),
+    Node("power_usage_pick", accept=_power_usage_pick),
+    Node("error"),
+])
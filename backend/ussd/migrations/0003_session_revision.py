@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 22:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ussd', '0002_rename_ussd_ussdse_phone_n_2425f8_idx_ussd_ussdse_phone_n_1664d4_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ussdsession',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -26,6 +26,8 @@ class UssdSession(models.Model):
     context = models.JSONField(default=dict, blank=True)
     is_active = models.BooleanField(default=True)
     expires_at = models.DateTimeField()
+    # Write-behind counter from ussd.session_store; older snapshots never overwrite newer ones.
+    revision = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -0,0 +1,280 @@
+"""
+Pluggable storage for live USSD sessions.
+
+settings.USSD_SESSION_STORE selects the backend (dotted path):
+
+  ussd.session_store.DatabaseSessionStore — every step reads and writes the
+      UssdSession row. Default when no shared cache is configured, since the
+      per-process LocMem cache cannot follow a session across workers.
+  ussd.session_store.CacheSessionStore — hot state (menu, context, last text,
+      expiry) lives in the shared cache (Redis) under a native TTL and is written
+      once per request. The UssdSession row is written behind via Celery when a
+      session starts and when it ends, and `persist_idle_sessions` (beat) writes
+      the final state of sessions that timed out or were abandoned mid-flow, so
+      audits still see every session.
+
+Both hand the view an object with the UssdSession attributes and its
+`save()/touch()/reset()/expired` API; `flush()` runs once the reply is built.
+"""
+
+from __future__ import annotations
+
+import importlib
+import logging
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from ussd.models import UssdSession
+
+logger = logging.getLogger(__name__)
+
+_STATE_FIELDS = (
+    "session_id",
+    "service_code",
+    "phone_number",
+    "user_id",
+    "last_text",
+    "current_menu",
+    "context",
+    "is_active",
+    "expires_at",
+    "created_at",
+    "revision",
+)
+
+
+def _cache_key(session_id: str) -> str:
+    return f"ussd:session:{session_id}"
+
+
+def session_cache_ttl() -> int:
+    """Session timeout plus a grace window so late retries still find their state."""
+    grace = int(getattr(settings, "USSD_SESSION_CACHE_GRACE_SECONDS", 600))
+    return int(UssdSession.timeout_delta().total_seconds()) + max(grace, 0)
+
+
+class CachedUssdSession:
+    """In-memory stand-in for a UssdSession row; `save()` only marks it dirty."""
+
+    timeout_delta = staticmethod(UssdSession.timeout_delta)
+    default_expiry = UssdSession.default_expiry
+
+    def __init__(self, **state):
+        self.session_id = state["session_id"]
+        self.service_code = state.get("service_code") or ""
+        self.phone_number = state.get("phone_number") or ""
+        self.user_id = state.get("user_id")
+        self.last_text = state.get("last_text") or ""
+        self.current_menu = state.get("current_menu") or "root"
+        self.context = state.get("context") or {}
+        self.is_active = state.get("is_active", True)
+        self.expires_at = _as_datetime(state.get("expires_at")) or UssdSession.default_expiry()
+        self.created_at = _as_datetime(state.get("created_at")) or timezone.now()
+        self.revision = int(state.get("revision") or 0)
+        self._user = None
+        self._dirty = False
+
+    @classmethod
+    def from_row(cls, row: UssdSession) -> "CachedUssdSession":
+        return cls(**{name: getattr(row, name) for name in _STATE_FIELDS})
+
+    def to_state(self) -> dict:
+        """JSON-safe snapshot used both for the cache entry and the write-behind task."""
+        state = {name: getattr(self, name) for name in _STATE_FIELDS}
+        state["expires_at"] = self.expires_at.isoformat()
+        state["created_at"] = self.created_at.isoformat()
+        return state
+
+    @property
+    def user(self):
+        if self._user is None and self.user_id is not None:
+            from accounts.models import User
+
+            self._user = User.objects.filter(pk=self.user_id).first()
+        return self._user
+
+    @user.setter
+    def user(self, value):
+        self._user = value
+        self.user_id = value.pk if value is not None else None
+
+    @property
+    def expired(self):
+        return timezone.now() > self.expires_at
+
+    def save(self, update_fields=None):
+        self._dirty = True
+
+    def touch(self):
+        self.expires_at = self.default_expiry()
+        self.is_active = True
+        self.save()
+
+    def reset(self):
+        self.current_menu = "root"
+        self.last_text = ""
+        self.context = {}
+        self.is_active = True
+        self.expires_at = self.default_expiry()
+        self.save()
+
+    def __str__(self):
+        return f"USSD {self.session_id} ({self.phone_number})"
+
+
+def _as_datetime(value):
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+class DatabaseSessionStore:
+    """Original behaviour: the UssdSession row is the live session."""
+
+    def load(self, session_id: str, service_code: str, phone_number: str):
+        return UssdSession.objects.get_or_create(
+            session_id=session_id,
+            defaults={
+                "service_code": service_code,
+                "phone_number": str(phone_number),
+                "expires_at": UssdSession.default_expiry(),
+            },
+        )
+
+    def flush(self, session) -> None:
+        """Rows are saved as the view goes; nothing is buffered."""
+
+
+class CacheSessionStore:
+    """Hot session state in the shared cache with write-behind to UssdSession."""
+
+    def load(self, session_id: str, service_code: str, phone_number: str):
+        try:
+            state = cache.get(_cache_key(session_id))
+        except Exception as exc:
+            logger.debug("USSD session cache read failed for %s: %s", session_id, exc)
+            state = None
+        if state:
+            return CachedUssdSession(**state), False
+
+        # Cache miss for a known session (evicted, or the store was just switched).
+        row = UssdSession.objects.filter(session_id=session_id).first()
+        if row is not None:
+            return CachedUssdSession.from_row(row), False
+
+        session = CachedUssdSession(
+            session_id=session_id,
+            service_code=service_code,
+            phone_number=str(phone_number),
+        )
+        session._dirty = True
+        return session, True
+
+    def flush(self, session) -> None:
+        """One cache write per request; persist to the DB on first save and on END."""
+        if not getattr(session, "_dirty", False):
+            return
+        session.revision += 1
+        session._dirty = False
+        state = session.to_state()
+        try:
+            cache.set(_cache_key(session.session_id), state, session_cache_ttl())
+        except Exception as exc:
+            logger.debug("USSD session cache write failed for %s: %s", session.session_id, exc)
+
+        if session.revision == 1 or not session.is_active:
+            from ussd.tasks import persist_ussd_session
+            from utils.general import dispatch_task
+
+            dispatch_task(persist_ussd_session, state)
+
+
+def write_session_row(state: dict) -> bool:
+    """
+    Upsert a cached session into UssdSession. Writes carrying an older revision
+    than the stored row are ignored, so a delayed task never rolls state back.
+    """
+    fields = {
+        "service_code": state.get("service_code") or "",
+        "phone_number": state.get("phone_number") or "",
+        "user_id": state.get("user_id"),
+        "last_text": state.get("last_text") or "",
+        "current_menu": state.get("current_menu") or "root",
+        "context": state.get("context") or {},
+        "is_active": bool(state.get("is_active")),
+        "expires_at": _as_datetime(state["expires_at"]),
+        "revision": int(state.get("revision") or 0),
+    }
+    session_id = state["session_id"]
+    stale = UssdSession.objects.filter(session_id=session_id, revision__lt=fields["revision"])
+    if stale.update(updated_at=timezone.now(), **fields):
+        return True
+    if UssdSession.objects.filter(session_id=session_id).exists():
+        return False
+    try:
+        with transaction.atomic():
+            UssdSession.objects.create(session_id=session_id, **fields)
+        return True
+    except IntegrityError:
+        # Lost a race with another writer for the same session; retry as an update.
+        return bool(stale.update(updated_at=timezone.now(), **fields))
+
+
+def persist_idle_sessions(now=None, batch_size: int = 500) -> int:
+    """
+    Write-behind sweep for CacheSessionStore: sessions whose stored row has
+    passed its expiry while still active get the cached state written, so the
+    row ends up holding the last step of timed-out and abandoned sessions.
+    Sessions still in use are written with their new expiry and drop out of the
+    sweep until they go idle. Returns the number of rows written.
+    """
+    if not isinstance(get_session_store(), CacheSessionStore):
+        return 0
+    now = now or timezone.now()
+    candidates = UssdSession.objects.filter(
+        is_active=True,
+        expires_at__lte=now,
+        expires_at__gt=now - timedelta(seconds=session_cache_ttl()),
+    ).values_list("session_id", "revision")
+
+    written = 0
+    batch: list[tuple[str, int]] = []
+
+    def flush():
+        nonlocal written
+        try:
+            states = cache.get_many([_cache_key(session_id) for session_id, _ in batch])
+        except Exception as exc:
+            logger.debug("USSD session cache read failed during sweep: %s", exc)
+            states = {}
+        for session_id, revision in batch:
+            state = states.get(_cache_key(session_id))
+            if state and int(state.get("revision") or 0) > revision and write_session_row(state):
+                written += 1
+        batch.clear()
+
+    for row in candidates.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return written
+
+
+_store_cache: dict[str, object] = {}
+
+
+def get_session_store():
+    """Return the store named by settings.USSD_SESSION_STORE (one instance per path)."""
+    store_path = getattr(settings, "USSD_SESSION_STORE", "ussd.session_store.DatabaseSessionStore")
+    store = _store_cache.get(store_path)
+    if store is None:
+        module_path, class_name = store_path.rsplit(".", 1)
+        module = importlib.import_module(module_path)
+        store = _store_cache[store_path] = getattr(module, class_name)()
+    return store
@@ -0,0 +1,17 @@
+from celery import shared_task
+
+
+@shared_task(name="ussd.tasks.persist_ussd_session")
+def persist_ussd_session(state):
+    """Write-behind for CacheSessionStore: upsert the cached session into UssdSession."""
+    from ussd.session_store import write_session_row
+
+    return write_session_row(state)
+
+
+@shared_task(name="ussd.tasks.persist_idle_ussd_sessions", ignore_result=True)
+def persist_idle_ussd_sessions():
+    """Beat: write the final cached state of idle USSD sessions to UssdSession."""
+    from ussd.session_store import persist_idle_sessions
+
+    return persist_idle_sessions()
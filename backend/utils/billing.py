@@ -19,7 +19,7 @@ from __future__ import annotations
 import logging
 from dataclasses import dataclass, field
 from datetime import date
-from decimal import Decimal
+from decimal import ROUND_FLOOR, Decimal
 from typing import Optional
 
 from django.db.models import Q, Sum
@@ -50,7 +50,10 @@ class BillBreakdown:
 # ---------------------------------------------------------------------------
 
 def get_active_domestic_tariff(on_date: Optional[date] = None):
-    """Return the active DOMESTIC ElectricityTariff for a given date (today if None)."""
+    """
+    Return the active DOMESTIC ElectricityTariff for a given date (today if None).
+    Hits the DB; billing reads `loan.tariff_cache.get_tariff_snapshot` instead.
+    """
     from loan.models import ElectricityTariff
 
     on_date = on_date or timezone.localdate()
@@ -70,35 +73,14 @@ def get_active_domestic_tariff(on_date: Optional[date] = None):
 
 
 def get_monthly_units_consumed(user, month_date: Optional[date] = None) -> Decimal:
-    """Total kWh purchased by user in the calendar month (COMPLETED purchases)."""
-    from transactions.models import UnitTransaction
-
-    month_date = month_date or timezone.localdate()
-
-    # Buy-units flow records self-credits on UnitTransaction (sender=receiver=user).
-    unit_tx_total = UnitTransaction.objects.filter(
-        sender=user,
-        receiver=user,
-        direction="IN",
-        status="COMPLETED",
-        create_date__year=month_date.year,
-        create_date__month=month_date.month,
-    ).aggregate(total=Sum("units"))
-    purchased = Decimal(str(unit_tx_total["total"] or 0))
-
-    # Also honour unified meter.Transaction records when present.
-    from meter.models import Transaction as MeterTransaction
-
-    meter_tx_total = MeterTransaction.objects.filter(
-        user=user,
-        transaction_type=MeterTransaction.TYPE_PURCHASE,
-        status=MeterTransaction.STATUS_COMPLETED,
-        create_date__year=month_date.year,
-        create_date__month=month_date.month,
-    ).aggregate(total=Sum("amount_kwh"))
-    purchased += Decimal(str(meter_tx_total["total"] or 0))
+    """
+    Total kWh purchased by user in the calendar month (COMPLETED purchases).
+    Reads the materialised `MonthlyConsumption` counter — one indexed row lookup.
+    """
+    from transactions.consumption import get_month_consumption
 
-    return purchased
+    row = get_month_consumption(user, month_date)
+    return Decimal(str(row.units_purchased)) if row else Decimal("0")
 
 
 def is_lifeline_eligible(user) -> bool:
@@ -139,16 +121,14 @@ def recompute_lifeline_eligibility(user) -> bool:
 def get_outstanding_deductions(user) -> Decimal:
     """
     Amount to deduct from a payment before unit calculation.
-    Covers disbursed loan balances; extend here for pending utility (negative) bills.
+    Covers disbursed and defaulted loan balances; extend here for pending utility (negative) bills.
     """
     from loan.models import LoanApplication
 
-    total = Decimal("0")
-    for loan in LoanApplication.objects.filter(user=user, status="DISBURSED"):
-        balance = Decimal(str(loan.outstanding_balance))
-        if balance > 0:
-            total += balance
-    return total
+    total = LoanApplication.objects.filter(
+        user=user, status__in=("DISBURSED", "DEFAULTED"), balance__gt=0
+    ).aggregate(total=Sum("balance"))["total"]
+    return total or Decimal("0")
 
 
 # ---------------------------------------------------------------------------
@@ -159,6 +139,10 @@ def _service_charge(tariff, user=None, month_date: Optional[date] = None) -> Dec
     """Monthly service fee — charged once on the first purchase of each calendar month."""
     if user is not None and get_monthly_units_consumed(user, month_date) > 0:
         return Decimal("0")
+    return _tariff_service_charge(tariff)
+
+
+def _tariff_service_charge(tariff) -> Decimal:
     if tariff and tariff.service_charge and tariff.service_charge > 0:
         return Decimal(str(tariff.service_charge))
     return DEFAULT_SERVICE_CHARGE
@@ -184,83 +168,237 @@ def _rate_for_block(block, eligible: bool) -> Decimal:
     return Decimal(str(block.rate_per_unit))
 
 
-def _energy_cost_for_units(
-    units: Decimal,
-    user,
-    tariff=None,
-    month_date: Optional[date] = None,
-) -> tuple[Decimal, bool]:
-    """Energy-only cost for `units` kWh given monthly consumption so far."""
-    if units <= 0:
-        return Decimal("0"), False
+# ---------------------------------------------------------------------------
+# Billing context & closed-form inversion
+# ---------------------------------------------------------------------------
 
-    if tariff is None:
-        tariff = get_active_domestic_tariff(month_date)
+CENT = Decimal("0.01")
+UNIT_STEP = Decimal("0.0001")
+# Upper bound of a single purchase; matches the historic bisection window.
+MAX_SOLVE_UNITS = Decimal("2000")
 
-    if tariff is None or not tariff.blocks.exists():
-        logger.warning("No active domestic tariff; using flat %.2f UGX/kWh", FALLBACK_ENERGY_RATE)
-        return (units * FALLBACK_ENERGY_RATE).quantize(Decimal("0.01")), False
+
+@dataclass(frozen=True)
+class BillingBand:
+    """One tariff block resolved to Decimal rates for a specific consumer."""
+    min_units: Decimal
+    max_units: Optional[Decimal]
+    rate: Decimal
+    is_lifeline_block: bool = False
+
+
+@dataclass(frozen=True)
+class BillingContext:
+    """
+    Everything a bill depends on, loaded once: tariff bands, month-to-date kWh,
+    lifeline eligibility and the service charge still due this month.
+    """
+    tariff: object
+    bands: tuple = field(default_factory=tuple)
+    already_bought: Decimal = Decimal("0")
+    eligible: bool = True
+    service_charge: Decimal = DEFAULT_SERVICE_CHARGE
+    month_date: Optional[date] = None
+
+
+def load_billing_context(user, tariff=None, month_date: Optional[date] = None) -> BillingContext:
+    """Run the monthly-consumption queries a bill needs exactly once; tariffs come from snapshots."""
+    from loan.tariff_cache import get_tariff_snapshot, snapshot_for_tariff
+
+    tariff = get_tariff_snapshot(month_date) if tariff is None else snapshot_for_tariff(tariff)
 
     already_bought = get_monthly_units_consumed(user, month_date)
     eligible = is_lifeline_eligible(user)
+
+    bands = ()
+    if tariff is not None:
+        bands = tuple(
+            BillingBand(
+                min_units=Decimal(str(block.min_units)),
+                max_units=Decimal(str(block.max_units)) if block.max_units is not None else None,
+                rate=_rate_for_block(block, eligible),
+                is_lifeline_block=block.is_lifeline_block,
+            )
+            for block in tariff.blocks
+        )
+    if not bands:
+        logger.warning("No active domestic tariff; using flat %.2f UGX/kWh", FALLBACK_ENERGY_RATE)
+
+    service = Decimal("0") if already_bought > 0 else _tariff_service_charge(tariff)
+    return BillingContext(
+        tariff=tariff,
+        bands=bands,
+        already_bought=already_bought,
+        eligible=eligible,
+        service_charge=service,
+        month_date=month_date,
+    )
+
+
+def _energy_cost_in_context(units: Decimal, ctx: BillingContext) -> tuple[Decimal, bool]:
+    """Energy-only cost for `units` kWh; pure function of the context."""
+    if units <= 0:
+        return Decimal("0"), False
+
+    if not ctx.bands:
+        return (units * FALLBACK_ENERGY_RATE).quantize(CENT), False
+
+    already_bought = ctx.already_bought
     remaining_units = units
     total_cost = Decimal("0")
     lifeline_applied = False
 
-    for block in tariff.blocks.order_by("block_order"):
+    for band in ctx.bands:
         if remaining_units <= 0:
             break
 
-        capacity = _block_capacity(block, already_bought)
+        capacity = _block_capacity(band, already_bought)
         if capacity is not None and capacity <= 0:
             continue
 
-        rate = _rate_for_block(block, eligible)
-        if block.is_lifeline_block and eligible and rate == Decimal(str(block.rate_per_unit)):
+        if band.is_lifeline_block and ctx.eligible:
             lifeline_applied = True
 
-        if capacity is not None:
-            units_in_block = min(remaining_units, capacity)
-        else:
-            units_in_block = remaining_units
-
-        total_cost += units_in_block * rate
+        units_in_block = min(remaining_units, capacity) if capacity is not None else remaining_units
+        total_cost += units_in_block * band.rate
         already_bought += units_in_block
         remaining_units -= units_in_block
 
     if remaining_units > 0:
         total_cost += remaining_units * FALLBACK_ENERGY_RATE
 
-    return total_cost.quantize(Decimal("0.01")), lifeline_applied
-
+    return total_cost.quantize(CENT), lifeline_applied
 
-def calculate_bill_for_units(
-    units: Decimal,
-    user,
-    tariff=None,
-    month_date: Optional[date] = None,
-) -> BillBreakdown:
-    """Full bill (energy + service + VAT) for a given kWh purchase."""
-    energy_cost, lifeline_applied = _energy_cost_for_units(units, user, tariff, month_date)
-    if tariff is None:
-        tariff = get_active_domestic_tariff(month_date)
 
-    service = _service_charge(tariff, user, month_date)
-    subtotal = energy_cost + service
-    vat = (subtotal * VAT_RATE).quantize(Decimal("0.01"))
-    total = subtotal + vat
+def bill_for_units(units: Decimal, ctx: BillingContext) -> BillBreakdown:
+    """Full bill (energy + service + VAT) for `units` kWh without touching the DB."""
+    energy_cost, lifeline_applied = _energy_cost_in_context(units, ctx)
+    subtotal = energy_cost + ctx.service_charge
+    vat = (subtotal * VAT_RATE).quantize(CENT)
 
     return BillBreakdown(
         energy_units=units,
         energy_cost=energy_cost,
-        service_charge=service,
+        service_charge=ctx.service_charge,
         subtotal=subtotal,
         vat=vat,
-        total=total,
+        total=subtotal + vat,
         lifeline_applied=lifeline_applied,
     )
 
 
+def _max_energy_budget(net: Decimal, ctx: BillingContext) -> Decimal:
+    """Largest 2dp energy cost whose bill (service + VAT) still fits in `net`."""
+    def total_for(cost: Decimal) -> Decimal:
+        subtotal = cost + ctx.service_charge
+        return subtotal + (subtotal * VAT_RATE).quantize(CENT)
+
+    budget = (net / (1 + VAT_RATE) - ctx.service_charge).quantize(CENT, rounding=ROUND_FLOOR)
+    while total_for(budget + CENT) <= net:
+        budget += CENT
+    while budget >= 0 and total_for(budget) > net:
+        budget -= CENT
+    return budget
+
+
+def _units_for_energy_budget(budget: Decimal, ctx: BillingContext) -> Decimal:
+    """Invert the piecewise-linear band schedule: kWh bought by `budget` UGX of energy."""
+    if budget <= 0:
+        return Decimal("0")
+    if not ctx.bands:
+        return budget / FALLBACK_ENERGY_RATE
+
+    already_bought = ctx.already_bought
+    units = Decimal("0")
+    for band in ctx.bands:
+        capacity = _block_capacity(band, already_bought)
+        if capacity is not None and capacity <= 0:
+            continue
+        if band.rate <= 0:
+            if capacity is None:
+                return MAX_SOLVE_UNITS
+            units += capacity
+            already_bought += capacity
+            continue
+        if capacity is None or budget < capacity * band.rate:
+            return units + budget / band.rate
+        units += capacity
+        already_bought += capacity
+        budget -= capacity * band.rate
+
+    return units + budget / FALLBACK_ENERGY_RATE
+
+
+def solve_units_for_payment(net: Decimal, ctx: BillingContext) -> tuple[Decimal, Optional[BillBreakdown]]:
+    """
+    Largest kWh (0.0001 grid) whose full bill does not exceed `net`.
+
+    Solves the band schedule in closed form, then nudges the result by a grid
+    step or two so rounding of energy cost and VAT matches `bill_for_units`.
+    Returns (units, breakdown); breakdown is None when nothing is affordable.
+    """
+    ceiling = MAX_SOLVE_UNITS - UNIT_STEP
+    budget = _max_energy_budget(net, ctx)
+    if budget < 0:
+        return Decimal("0"), None
+
+    # Energy cost is rounded to the cent, so anything below budget + half a cent fits.
+    units = _units_for_energy_budget(budget + CENT / 2, ctx)
+    units = min(max(units, Decimal("0")), ceiling).quantize(UNIT_STEP, rounding=ROUND_FLOOR)
+
+    breakdown = bill_for_units(units, ctx) if units > 0 else None
+    while units > 0 and breakdown.total > net:
+        units -= UNIT_STEP
+        breakdown = bill_for_units(units, ctx) if units > 0 else None
+    while units < ceiling:
+        candidate = bill_for_units(units + UNIT_STEP, ctx)
+        if candidate.total > net:
+            break
+        units += UNIT_STEP
+        breakdown = candidate
+
+    return units, breakdown
+
+
+def _bisect_units_for_payment(net: Decimal, ctx: BillingContext) -> Decimal:
+    """Reference bisection solver; kept so `verify_era_billing` can cross-check the engine."""
+    lo = Decimal("0")
+    hi = MAX_SOLVE_UNITS
+    for _ in range(90):
+        mid = ((lo + hi) / 2).quantize(UNIT_STEP)
+        if bill_for_units(mid, ctx).total <= net:
+            lo = mid
+        else:
+            hi = mid
+        if hi - lo < UNIT_STEP:
+            break
+    return lo
+
+
+def _energy_cost_for_units(
+    units: Decimal,
+    user,
+    tariff=None,
+    month_date: Optional[date] = None,
+) -> tuple[Decimal, bool]:
+    """Energy-only cost for `units` kWh given monthly consumption so far."""
+    if units <= 0:
+        return Decimal("0"), False
+    return _energy_cost_in_context(units, load_billing_context(user, tariff, month_date))
+
+
+def calculate_bill_for_units(
+    units: Decimal,
+    user,
+    tariff=None,
+    month_date: Optional[date] = None,
+    context: Optional[BillingContext] = None,
+) -> BillBreakdown:
+    """Full bill (energy + service + VAT) for a given kWh purchase."""
+    ctx = context or load_billing_context(user, tariff, month_date)
+    return bill_for_units(units, ctx)
+
+
 def calculate_units_from_payment(
     payment_ugx: Decimal,
     user,
@@ -268,12 +406,13 @@ def calculate_units_from_payment(
     month_date: Optional[date] = None,
     outstanding_bills: Optional[Decimal] = None,
     apply_deductions: bool = True,
+    context: Optional[BillingContext] = None,
 ) -> tuple[Decimal, BillBreakdown]:
     """
     Convert a payment amount (UGX) to kWh using ERA tiered billing.
 
     Deducts outstanding bills/loans first, then finds the maximum kWh whose
-  full bill (energy + service + VAT) does not exceed the net payment.
+    full bill (energy + service + VAT) does not exceed the net payment.
     """
     deductions = outstanding_bills if outstanding_bills is not None else Decimal("0")
     if apply_deductions and outstanding_bills is None:
@@ -293,59 +432,52 @@ def calculate_units_from_payment(
     if net <= 0:
         return Decimal("0"), empty
 
-    lo = Decimal("0")
-    hi = Decimal("2000")
-    best_units = Decimal("0")
-    best_breakdown = empty
-
-    for _ in range(90):
-        mid = ((lo + hi) / 2).quantize(Decimal("0.0001"))
-        breakdown = calculate_bill_for_units(mid, user, tariff, month_date)
-        if breakdown.total <= net:
-            best_units = mid
-            best_breakdown = breakdown
-            lo = mid
-        else:
-            hi = mid
-        if hi - lo < Decimal("0.0001"):
-            break
+    ctx = context or load_billing_context(user, tariff, month_date)
+    best_units, best_breakdown = solve_units_for_payment(net, ctx)
+    best_breakdown = best_breakdown or empty
 
-    best_breakdown.energy_units = best_units.quantize(Decimal("0.01"))
+    best_breakdown.energy_units = best_units.quantize(CENT)
     best_breakdown.amount_deducted = deductions
     best_breakdown.net_payment = net
     if best_units <= 0:
         # Surface fixed charges so the UI can explain why small payments yield 0 kWh.
-        min_bill = calculate_bill_for_units(Decimal("0.01"), user, tariff, month_date)
+        min_bill = bill_for_units(CENT, ctx)
         best_breakdown.service_charge = min_bill.service_charge
         best_breakdown.vat = min_bill.vat
         best_breakdown.subtotal = min_bill.subtotal
         best_breakdown.total = min_bill.total
-    return best_units.quantize(Decimal("0.01")), best_breakdown
+    return best_units.quantize(CENT), best_breakdown
 
 
 def get_minimum_payment_for_units(
     user,
     tariff=None,
     month_date: Optional[date] = None,
+    context: Optional[BillingContext] = None,
 ) -> Decimal:
     """Lowest UGX payment that yields any energy under ERA billing rules."""
-    bill = calculate_bill_for_units(Decimal("0.01"), user, tariff, month_date)
-    return bill.total.quantize(Decimal("0.01"))
+    bill = calculate_bill_for_units(CENT, user, tariff, month_date, context=context)
+    return bill.total.quantize(CENT)
 
 
-def get_monthly_tier_context(user, month_date: Optional[date] = None) -> dict:
+def get_monthly_tier_context(
+    user,
+    month_date: Optional[date] = None,
+    context: Optional[BillingContext] = None,
+) -> dict:
     """
     Summarise where the consumer sits in the monthly tier ladder (ERA Code 10.1).
     Used by the estimate API so the UI can explain second-purchase yields.
     """
     month_date = month_date or timezone.localdate()
-    already = get_monthly_units_consumed(user, month_date)
-    eligible = is_lifeline_eligible(user)
+    ctx = context or load_billing_context(user, month_date=month_date)
+    already = ctx.already_bought
+    eligible = ctx.eligible
     lifeline_cap = Decimal("15")
     lifeline_remaining = (
         max(Decimal("0"), lifeline_cap - already) if eligible else Decimal("0")
     )
-    service_due = _service_charge(get_active_domestic_tariff(month_date), user, month_date) > 0
+    service_due = ctx.service_charge > 0
 
     if already < lifeline_cap and eligible:
         current_band = "lifeline"
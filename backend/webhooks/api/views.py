@@ -1,7 +1,7 @@
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 from datetime import date
-from decimal import Decimal, InvalidOperation
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
 import logging
 from utils.models import TokenValidator
 from rest_framework.response import Response
@@ -186,6 +186,72 @@ class LoanTokenVerificationView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _thingsboard_secret_rejection(request):
+    """401 response when THINGSBOARD_WEBHOOK_SECRET is set and the header does not match."""
+    configured_secret = (getattr(settings, "THINGSBOARD_WEBHOOK_SECRET", "") or "").strip()
+    if configured_secret:
+        header_secret = (request.headers.get("X-ThingsBoard-Webhook-Secret") or "").strip()
+        if header_secret != configured_secret:
+            return Response(
+                {"success": False, "message": "Invalid webhook secret."},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+    return None
+
+
+def _thingsboard_batch_items(request):
+    """
+    Items of a batch webhook body (a bare JSON array or {"readings": [...]}),
+    or an error Response when the body is malformed or over the batch limit.
+    """
+    body = request.data
+    items = body.get("readings") if isinstance(body, dict) else body
+    if not isinstance(items, list) or not items:
+        return None, Response(
+            {"success": False, "message": "Body must be a non-empty array of readings."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    limit = int(getattr(settings, "THINGSBOARD_WEBHOOK_MAX_BATCH", 5000))
+    if len(items) > limit:
+        return None, Response(
+            {"success": False, "message": f"At most {limit} readings per request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return items, None
+
+
+def _active_ami_meters_by_token(tokens):
+    """Resolve device tokens to active AMI meters in one query."""
+    meters = (
+        Meter.objects.filter(
+            iot_device_token__in=set(tokens),
+            architecture=Meter.ARCH_AMI,
+            status=Meter.STATUS_ACTIVE,
+        )
+        .select_related("user")
+        .order_by("-id")
+    )
+    by_token = {}
+    for meter in meters:
+        by_token.setdefault(meter.iot_device_token, meter)
+    return by_token
+
+
+def _decimal_for_fields(raw, *fields):
+    """
+    `raw` as a Decimal rounded to the fields' decimal places; ValueError when it
+    is not finite or has more integer digits than any of the DecimalFields allow.
+    """
+    value = Decimal(str(raw))
+    if not value.is_finite():
+        raise ValueError
+    for field in fields:
+        value = value.quantize(Decimal(1).scaleb(-field.decimal_places), rounding=ROUND_HALF_UP)
+        if value and value.adjusted() >= field.max_digits - field.decimal_places:
+            raise ValueError
+    return value
+
+
 class ThingsBoardLowUnitsWebhookView(APIView):
     """
     POST /webhooks/thingsboard/low-units
@@ -196,14 +262,9 @@ class ThingsBoardLowUnitsWebhookView(APIView):
     authentication_classes = []
 
     def post(self, request, *args, **kwargs):
-        configured_secret = (getattr(settings, "THINGSBOARD_WEBHOOK_SECRET", "") or "").strip()
-        if configured_secret:
-            header_secret = (request.headers.get("X-ThingsBoard-Webhook-Secret") or "").strip()
-            if header_secret != configured_secret:
-                return Response(
-                    {"success": False, "message": "Invalid webhook secret."},
-                    status=status.HTTP_401_UNAUTHORIZED,
-                )
+        rejected = _thingsboard_secret_rejection(request)
+        if rejected:
+            return rejected
 
         device_token = str(request.data.get("device_token", "")).strip()
         units_raw = request.data.get("units_kwh")
@@ -336,14 +397,9 @@ class ThingsBoardDailyUsageWebhookView(APIView):
         from meter.models import MeterUsageDaily
         from meter.usage_service import upsert_daily_usage
 
-        configured_secret = (getattr(settings, "THINGSBOARD_WEBHOOK_SECRET", "") or "").strip()
-        if configured_secret:
-            header_secret = (request.headers.get("X-ThingsBoard-Webhook-Secret") or "").strip()
-            if header_secret != configured_secret:
-                return Response(
-                    {"success": False, "message": "Invalid webhook secret."},
-                    status=status.HTTP_401_UNAUTHORIZED,
-                )
+        rejected = _thingsboard_secret_rejection(request)
+        if rejected:
+            return rejected
 
         device_token = str(request.data.get("device_token", "")).strip()
         usage_date_raw = request.data.get("usage_date")
@@ -406,3 +462,172 @@ class ThingsBoardDailyUsageWebhookView(APIView):
             },
             status=status.HTTP_201_CREATED,
         )
+
+
+class ThingsBoardLowUnitsBatchWebhookView(APIView):
+    """
+    POST /webhooks/thingsboard/low-units/batch
+
+    Batched balance readings from a ThingsBoard rule chain.
+    Body: [{ device_token, units_kwh, occurred_at }, ...] (or {"readings": [...]}).
+    Every valid reading is stored as a balance snapshot; low balances go through
+    the same crossing/cooldown rules as the single-reading webhook.
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    def post(self, request, *args, **kwargs):
+        from meter.low_units_alerts import ingest_balance_readings
+        from meter.models import MeterBalanceSnapshot, MeterNotification
+
+        rejected = _thingsboard_secret_rejection(request)
+        if rejected:
+            return rejected
+
+        items, error = _thingsboard_batch_items(request)
+        if error:
+            return error
+
+        parsed = []
+        rejected_items = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                rejected_items.append({"index": index, "error": "Reading must be an object."})
+                continue
+            device_token = str(item.get("device_token", "")).strip()
+            units_raw = item.get("units_kwh")
+            occurred_raw = item.get("occurred_at")
+            if not device_token or units_raw is None or not occurred_raw:
+                rejected_items.append(
+                    {"index": index, "error": "device_token, units_kwh, and occurred_at are required."}
+                )
+                continue
+            try:
+                units_kwh = _decimal_for_fields(
+                    units_raw,
+                    MeterBalanceSnapshot._meta.get_field("remaining_kwh"),
+                    MeterNotification._meta.get_field("units_kwh"),
+                )
+            except (InvalidOperation, TypeError, ValueError):
+                rejected_items.append(
+                    {"index": index, "error": "units_kwh must be a finite number within the stored range."}
+                )
+                continue
+            occurred_at = parse_datetime(str(occurred_raw))
+            if occurred_at is None:
+                rejected_items.append(
+                    {"index": index, "error": "occurred_at must be a valid ISO-8601 datetime."}
+                )
+                continue
+            if timezone.is_naive(occurred_at):
+                occurred_at = timezone.make_aware(occurred_at, timezone.get_current_timezone())
+            parsed.append((index, device_token, units_kwh, occurred_at))
+
+        meters = _active_ami_meters_by_token(token for _, token, _, _ in parsed)
+        readings = []
+        for index, device_token, units_kwh, occurred_at in parsed:
+            meter = meters.get(device_token)
+            if meter is None:
+                rejected_items.append(
+                    {"index": index, "error": "No active AMI meter found for this device token."}
+                )
+                continue
+            readings.append((meter, units_kwh, occurred_at))
+
+        outcome = ingest_balance_readings(readings, source="thingsboard_webhook")
+
+        logger.info(
+            "ThingsBoard low-units batch: accepted=%s rejected=%s low=%s alerts=%s",
+            len(readings),
+            len(rejected_items),
+            outcome["low"],
+            outcome["alerts_sent"],
+        )
+
+        return Response(
+            {
+                "success": True,
+                "accepted": len(readings),
+                "low": outcome["low"],
+                "alerts_sent": outcome["alerts_sent"],
+                "rejected": sorted(rejected_items, key=lambda r: r["index"]),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class ThingsBoardDailyUsageBatchWebhookView(APIView):
+    """
+    POST /webhooks/thingsboard/daily-usage/batch
+
+    Batched daily kWh consumption from a ThingsBoard rule chain.
+    Body: [{ device_token, usage_date (YYYY-MM-DD), kwh_used }, ...] (or {"readings": [...]}).
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    def post(self, request, *args, **kwargs):
+        from meter.models import MeterUsageDaily
+        from meter.usage_service import bulk_upsert_daily_usage
+
+        rejected = _thingsboard_secret_rejection(request)
+        if rejected:
+            return rejected
+
+        items, error = _thingsboard_batch_items(request)
+        if error:
+            return error
+
+        parsed = []
+        rejected_items = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                rejected_items.append({"index": index, "error": "Reading must be an object."})
+                continue
+            device_token = str(item.get("device_token", "")).strip()
+            usage_date_raw = item.get("usage_date")
+            kwh_raw = item.get("kwh_used")
+            if not device_token or not usage_date_raw or kwh_raw is None:
+                rejected_items.append(
+                    {"index": index, "error": "device_token, usage_date, and kwh_used are required."}
+                )
+                continue
+            try:
+                usage_date = date.fromisoformat(str(usage_date_raw)[:10])
+                kwh_used = _decimal_for_fields(kwh_raw, MeterUsageDaily._meta.get_field("kwh_used"))
+                if kwh_used < 0:
+                    raise ValueError
+            except (InvalidOperation, TypeError, ValueError):
+                rejected_items.append({"index": index, "error": "Invalid usage_date or kwh_used."})
+                continue
+            parsed.append((index, device_token, usage_date, kwh_used))
+
+        meters = _active_ami_meters_by_token(token for _, token, _, _ in parsed)
+        rows = []
+        for index, device_token, usage_date, kwh_used in parsed:
+            meter = meters.get(device_token)
+            if meter is None:
+                rejected_items.append(
+                    {"index": index, "error": "No active AMI meter found for this device token."}
+                )
+                continue
+            rows.append((meter.pk, usage_date, kwh_used))
+
+        written = bulk_upsert_daily_usage(rows, MeterUsageDaily.SOURCE_WEBHOOK)
+
+        logger.info(
+            "ThingsBoard daily-usage batch: accepted=%s upserted=%s rejected=%s",
+            len(rows),
+            written,
+            len(rejected_items),
+        )
+
+        return Response(
+            {
+                "success": True,
+                "accepted": len(rows),
+                "upserted": written,
+                "rejected": sorted(rejected_items, key=lambda r: r["index"]),
+            },
+            status=status.HTTP_200_OK,
+        )
@@ -70,6 +70,8 @@ const TransList = () => {
   const [selectedTransaction, setSelectedTransaction] = useState<Transaction | null>(null);
   const [total, setTotal] = useState(0);
   const [page, setPage] = useState(1);
+  // cursors[n] fetches page n + 1; page 1 needs none.
+  const [cursors, setCursors] = useState<string[]>([""]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const [summary, setSummary] = useState<HistorySummary | null>(null);
@@ -85,9 +87,11 @@ const TransList = () => {
     setLoading(true);
     setError(null);
     try {
+      const cursor = cursors[currentPage - 1];
       const params = new URLSearchParams({
         page: currentPage.toString(),
         page_size: pageSize.toString(),
+        ...(cursor && { cursor }),
         ...(filters.type && { type: filters.type }),
         ...(filters.start_date && { start_date: filters.start_date }),
         ...(filters.end_date && { end_date: filters.end_date }),
@@ -96,8 +100,17 @@ const TransList = () => {
       const response = await get<any>(`transactions/history/?${params.toString()}`);
       if (response.data?.success) {
         setTransactions(response.data.transactions);
-        setTotal(response.data.total);
-        setSummary(response.data.summary ?? null);
+        // Totals come with the first page only; later pages are fetched by cursor.
+        if (response.data.summary) {
+          setTotal(response.data.total);
+          setSummary(response.data.summary);
+        }
+        const nextCursor: string | null = response.data.next_cursor ?? null;
+        setCursors(prev => {
+          const next = prev.slice(0, currentPage);
+          if (nextCursor) next[currentPage] = nextCursor;
+          return next;
+        });
       } else {
         setError('Failed to load transactions');
       }
@@ -115,6 +128,7 @@ const TransList = () => {
 
   const handleFilterChange = (key: keyof typeof filters, value: string) => {
     setFilters(prev => ({ ...prev, [key]: value }));
+    setCursors([""]);
     setPage(1);
   };
 
@@ -124,6 +138,7 @@ const TransList = () => {
       start_date: "",
       end_date: "",
     });
+    setCursors([""]);
     setPage(1);
   };
 
@@ -386,7 +401,7 @@ const TransList = () => {
         </Button>
         <span className="text-center">Page {page} of {totalPages}</span>
         <Button
-          disabled={page >= totalPages}
+          disabled={page >= totalPages || !cursors[page]}
           onClick={() => setPage(page + 1)}
           className="w-full sm:w-auto"
         >